@@ -0,0 +1,128 @@
+import io
+import random
+import shutil
+import struct
+import typing as typ
+from pathlib import Path
+
+import mutagen.id3
+import mutagen.flac
+from PIL import Image
+
+TEMPLATE_MP3_PATH = Path(__file__).parent.parent / 'tests' / 'data' / 'file.mp3'
+FLAC_AUDIO_SIZE = 64 * 1024  # fake audio payload, mulima never decodes it
+
+
+class AlbumSpec(typ.NamedTuple):
+    artist: str
+    album: str
+    path: Path
+    track_paths: typ.List[Path]
+
+
+class LibrarySpec(typ.NamedTuple):
+    root: Path
+    albums: typ.List[AlbumSpec]
+
+    def get_artist_paths(self) -> typ.Dict[str, Path]:
+        return {album.artist: album.path.parent for album in self.albums}
+
+    def get_tracks_count(self) -> int:
+        return sum(len(album.track_paths) for album in self.albums)
+
+
+def _make_picture(color: typ.Tuple[int, int, int], size: typ.Tuple[int, int], image_format: str) -> bytes:
+    data = io.BytesIO()
+    Image.new('RGB', size, color).save(data, format=image_format)
+    return data.getvalue()
+
+
+def make_flac(path: Path, tags: typ.Dict[str, str], *, cover: typ.Optional[bytes] = None,
+              cover_mimetype: str = 'image/jpeg', audio_size: int = 0) -> Path:
+    """
+    builds minimal flac track without real audio, it's used by benchmarks and tests
+    :param audio_size: size of zeroed audio payload after metadata blocks
+    """
+    # STREAMINFO: block sizes, frame sizes, 44100 Hz, 2 channels, 16 bits per sample, md5
+    stream_info = struct.pack('>HH', 4096, 4096) + bytes(6) + \
+        ((44100 << 44) | (1 << 41) | (15 << 36)).to_bytes(8, 'big') + bytes(16)
+    path.write_bytes(b'fLaC' + bytes([0x80]) + len(stream_info).to_bytes(3, 'big') + stream_info +
+                     bytes(audio_size))
+
+    m_file = mutagen.flac.FLAC(path)
+    m_file.add_tags()
+    for tag, value in tags.items():
+        m_file[tag] = value
+    if cover is not None:
+        picture = mutagen.flac.Picture()
+        picture.data = cover
+        picture.mime = cover_mimetype
+        picture.type = 3
+        m_file.add_picture(picture)
+    m_file.save()
+    return path
+
+
+def _make_mp3(path: Path, tags: typ.Dict[str, str], cover: typ.Optional[bytes]):
+    shutil.copyfile(TEMPLATE_MP3_PATH, path)
+
+    id3 = mutagen.id3.ID3(path)
+    id3.delete()
+    id3 = mutagen.id3.ID3()
+    frames = {'title': mutagen.id3.TIT2, 'artist': mutagen.id3.TPE1, 'album': mutagen.id3.TALB,
+              'tracknumber': mutagen.id3.TRCK, 'date': mutagen.id3.TDRC}
+    for tag, value in tags.items():
+        id3.add(frames[tag](text=value))
+    if cover is not None:
+        id3.add(mutagen.id3.APIC(encoding=3, mime='image/jpeg', type=3, desc='front', data=cover))
+    id3.save(path)
+
+
+def generate_library(root: Path, *, artists: int = 2, albums_per_artist: int = 2, tracks_per_album: int = 10,
+                     flac_share: float = 0.5, embedded_cover_share: float = 0.3, loose_cover_share: float = 0.5,
+                     duplicate_tracknumbers_share: float = 0.1, missed_tags_share: float = 0.2,
+                     cover_size: typ.Tuple[int, int] = (1000, 1000), seed: int = 0) -> LibrarySpec:
+    """
+    generates synthetic archive: root/artist/album/tracks, with mix of mp3 and flac tracks,
+    embedded and loose covers, duplicated tracknumbers and missed tags
+    :param flac_share: share of flac tracks, others are mp3
+    :param embedded_cover_share: share of tracks with embedded cover
+    :param loose_cover_share: share of albums with cover picture in album directory
+    :param duplicate_tracknumbers_share: share of albums with duplicated tracknumbers
+    :param missed_tags_share: share of tracks without title and album tags
+    """
+    rand = random.Random(seed)
+    embedded_cover = _make_picture((0, 0, 255), (300, 300), 'JPEG')
+
+    albums = list()
+    for artist_number in range(artists):
+        artist = f'Artist {artist_number}'
+        for album_number in range(albums_per_artist):
+            album = f'Album {artist_number}-{album_number}'
+            album_path = Path(root, artist, album)
+            album_path.mkdir(parents=True)
+
+            if rand.random() < loose_cover_share:
+                color = (rand.randrange(256), rand.randrange(256), rand.randrange(256))
+                (album_path / 'cover.jpg').write_bytes(_make_picture(color, cover_size, 'JPEG'))
+
+            has_duplicates = rand.random() < duplicate_tracknumbers_share
+            track_paths = list()
+            for track_number in range(1, tracks_per_album + 1):
+                tags = {'artist': artist, 'tracknumber': str(1 if has_duplicates else track_number),
+                        'date': str(1970 + album_number)}
+                if rand.random() >= missed_tags_share:
+                    tags.update(title=f'Track {track_number}', album=album)
+
+                cover = embedded_cover if rand.random() < embedded_cover_share else None
+                if rand.random() < flac_share:
+                    track_path = album_path / f'track{track_number:03}.flac'
+                    make_flac(track_path, tags, cover=cover, audio_size=FLAC_AUDIO_SIZE)
+                else:
+                    track_path = album_path / f'track{track_number:03}.mp3'
+                    _make_mp3(track_path, tags, cover)
+                track_paths.append(track_path)
+
+            albums.append(AlbumSpec(artist, album, album_path, track_paths))
+
+    return LibrarySpec(Path(root), albums)
@@ -0,0 +1,126 @@
+"""
+times phases of ArtistArchive.update and AlbumArchive.update on synthetic library
+
+usage: python -m benchmarks.update_benchmark --artists 10 --albums 5 --tracks 12 --modes serial parallel
+"""
+import argparse
+import json
+import resource
+import shutil
+import tempfile
+import time
+import typing as typ
+from collections import defaultdict, Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from benchmarks.library_generator import generate_library, LibrarySpec
+from mulima.archive import AlbumArchive, ArtistArchive
+from mulima.executor import UpdateExecutor
+
+PHASES = ['discovery', 'load', 'tags', 'covers', 'write', 'rename', 'index']
+
+EXECUTOR_MODES = {
+    'serial': dict(),
+    'parallel': dict(max_workers=8, max_workers_per_device=8),
+    'processes': dict(max_workers=4, parse_in_processes=True),
+}
+
+
+def _run_updates(library: LibrarySpec, executor: UpdateExecutor, archive_kind: str, *, new_only: bool,
+                 window_size: typ.Optional[int]) -> dict:
+    if archive_kind == 'artist':
+        archives = [ArtistArchive(str(path), [artist], executor=executor)
+                    for artist, path in library.get_artist_paths().items()]
+    else:
+        archives = [AlbumArchive(str(album.path), album.album, executor=executor) for album in library.albums]
+
+    phase_durations, counters = defaultdict(float), Counter()
+    start = time.perf_counter()
+    for archive in archives:
+        report = archive.update(new_only=new_only, window_size=window_size)
+        archive.close()
+
+        for phase, duration in report.phase_durations.items():
+            phase_durations[phase] += duration
+        counters.update(report.counters)
+    total = time.perf_counter() - start
+
+    return {
+        'total_sec': total,
+        'files_per_sec': library.get_tracks_count() / total if total else None,
+        'phases_sec': {phase: phase_durations.get(phase, 0.0) for phase in PHASES},
+        'counters': dict(counters),
+    }
+
+
+def run_mode(template_root: str, library: LibrarySpec, mode: str, archive_kind: str,
+             window_size: typ.Optional[int] = None) -> dict:
+    """
+    updates fresh copy of library twice: cold run on new library and warm run without changes
+    :param window_size: look at ABCArchive.update
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = Path(temp_dir, 'library')
+        shutil.copytree(template_root, root)
+        library = library._replace(root=root, albums=[
+            album._replace(path=root / album.path.relative_to(template_root)) for album in library.albums
+        ])
+
+        with UpdateExecutor(**EXECUTOR_MODES[mode]) as executor:
+            cold = _run_updates(library, executor, archive_kind, new_only=True, window_size=window_size)
+            warm = _run_updates(library, executor, archive_kind, new_only=True, window_size=window_size)
+
+    return {
+        'mode': mode,
+        'archive': archive_kind,
+        'window_size': window_size,
+        'tracks': library.get_tracks_count(),
+        'cold': cold,
+        'warm': warm,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def _format_result(result: dict) -> str:
+    window = '' if result['window_size'] is None else f", windows of {result['window_size']} directories"
+    lines = [f"{result['archive']} archives, {result['mode']}{window}: {result['tracks']} tracks, "
+             f"peak RSS {result['peak_rss_kb'] / 1024:.1f} MiB"]
+    for run in ('cold', 'warm'):
+        stats = result[run]
+        phases = ', '.join(f'{phase} {stats["phases_sec"][phase]:.3f}' for phase in PHASES)
+        lines.append(f"  {run}: {stats['total_sec']:.3f} s, {stats['files_per_sec']:.1f} files/s ({phases})")
+        lines.append('    ' + ', '.join(f'{counter} {value}' for counter, value in stats['counters'].items()))
+    return '\n'.join(lines)
+
+
+def main(argv: typ.Optional[typ.List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--artists', type=int, default=4)
+    parser.add_argument('--albums', type=int, default=4, help='albums per artist')
+    parser.add_argument('--tracks', type=int, default=10, help='tracks per album')
+    parser.add_argument('--flac-share', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--modes', nargs='+', choices=list(EXECUTOR_MODES), default=['serial', 'parallel'])
+    parser.add_argument('--archives', nargs='+', choices=['artist', 'album'], default=['album', 'artist'])
+    parser.add_argument('--window-size', type=int, default=None,
+                        help='stream updates by windows of this number of directories')
+    parser.add_argument('--json', action='store_true', help='print results as json lines')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        template_root = Path(temp_dir, 'template')
+        library = generate_library(template_root, artists=args.artists, albums_per_artist=args.albums,
+                                   tracks_per_album=args.tracks, flac_share=args.flac_share, seed=args.seed)
+
+        for archive_kind in args.archives:
+            for mode in args.modes:
+                # every run is done in fresh process to measure it's own peak RSS
+                with ProcessPoolExecutor(max_workers=1) as process_pool:
+                    result = process_pool.submit(run_mode, str(template_root), library, mode, archive_kind,
+                                                 args.window_size).result()
+                print(json.dumps(result) if args.json else _format_result(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+import asyncio
+import functools
+import threading
+import typing as typ
+from concurrent.futures import Executor
+from pathlib import Path
+
+from mulima.track_processor import Track
+from mulima.archive import ABCArchive
+from mulima.metrics import UpdateCallbacks, UpdateCancelled, UpdateReport
+
+T = typ.TypeVar('T')
+
+
+class AsyncTrackIO:
+    """
+    async counterparts of loading, writing and renaming of tracks.
+    Blocking work is done in executor, number of simultaneous operations is bounded
+    """
+    max_concurrency: int
+    executor: typ.Optional[Executor]
+
+    def __init__(self, *, max_concurrency: int = 4, executor: typ.Optional[Executor] = None):
+        """
+        :param executor: executor for blocking work, None means default executor of event loop
+        """
+        if max_concurrency < 1:
+            raise ValueError('max_concurrency should be positive')
+
+        self.max_concurrency = max_concurrency
+        self.executor = executor
+        self.__semaphore: typ.Optional[asyncio.Semaphore] = None
+
+    async def _run(self, func: typ.Callable[..., T], *args) -> T:
+        if self.__semaphore is None:
+            self.__semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async with self.__semaphore:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(func, *args))
+
+    async def load(self, path: Path) -> Track:
+        return await self._run(Track, path)
+
+    async def load_many(self, filepath_list: typ.Iterable[Path]) -> typ.List[Track]:
+        """
+        if it's cancelled, tracks, which loading has not started yet, are not loaded
+        """
+        return list(await asyncio.gather(*(self.load(filepath) for filepath in filepath_list)))
+
+    async def write(self, track: Track) -> int:
+        """
+        :return: number of written bytes
+        """
+        return await self._run(track.write)
+
+    async def rename(self, filepath: Path, formatting_pattern: str) -> Path:
+        """
+        look at Track.rename
+        """
+        return await self._run(Track.rename, filepath, formatting_pattern)
+
+
+class ProgressEvent(typ.NamedTuple):
+    kind: str  # 'phase_start', 'phase_end', 'file_done' or 'count'
+    name: str  # name of phase or counter
+    path: typ.Optional[Path] = None  # processed file
+    value: typ.Optional[float] = None  # duration of phase or amount of counter
+
+
+class _ProgressCallbacks(UpdateCallbacks):
+    """
+    passes events from update thread to event loop and stops update, when it's cancelled
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue, cancel_event: threading.Event):
+        self.loop = loop
+        self.queue = queue
+        self.cancel_event = cancel_event
+
+    def _send(self, event: ProgressEvent):
+        if self.cancel_event.is_set():
+            raise UpdateCancelled
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+
+    def on_phase_start(self, phase: str):
+        self._send(ProgressEvent('phase_start', phase))
+
+    def on_phase_end(self, phase: str, duration: float):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, ProgressEvent('phase_end', phase, value=duration))
+
+    def on_file_done(self, phase: str, path: Path):
+        self._send(ProgressEvent('file_done', phase, path=path))
+
+    def on_count(self, counter: str, amount: int):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, ProgressEvent('count', counter, value=amount))
+
+
+class AsyncArchiveUpdate:
+    """
+    runs archive update without blocking event loop and streams it's progress:
+
+        update = AsyncArchiveUpdate(archive, new_only=True)
+        task = asyncio.create_task(update.run())
+        async for event in update.events():
+            ...
+        report = await task
+
+    Cancellation of run() (or cancel()) stops update between files, files, which are being processed,
+    are finished, so archive stays consistent and the next update continues the work.
+    Discovery (scanning and hashing), load, covers and write phases are stopped between files.
+    Tags, rename and index phases work on one batch in memory or are journaled, they are not stopped
+    in the middle, cancellation takes effect at the start of the next phase
+    """
+    archive: ABCArchive
+
+    def __init__(self, archive: ABCArchive, **update_kwargs):
+        """
+        :param update_kwargs: arguments of archive.update
+        """
+        self.archive = archive
+        self.update_kwargs = update_kwargs
+
+        self.__cancel_event = threading.Event()
+        self.__queue: typ.Optional[asyncio.Queue] = None
+
+    def _get_queue(self) -> asyncio.Queue:
+        if self.__queue is None:
+            self.__queue = asyncio.Queue()
+        return self.__queue
+
+    def cancel(self):
+        self.__cancel_event.set()
+
+    async def run(self, executor: typ.Optional[Executor] = None) -> UpdateReport:
+        """
+        :param executor: executor, where update is run, None means default executor of event loop
+        """
+        loop, queue = asyncio.get_running_loop(), self._get_queue()
+        callbacks = _ProgressCallbacks(loop, queue, self.__cancel_event)
+
+        self.archive.callbacks.append(callbacks)
+        try:
+            future = loop.run_in_executor(executor, functools.partial(self.archive.update, **self.update_kwargs))
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                self.cancel()
+                try:
+                    await future
+                except UpdateCancelled:
+                    pass
+                raise
+        finally:
+            self.archive.callbacks.remove(callbacks)
+            queue.put_nowait(None)
+
+    async def events(self) -> typ.AsyncIterator[ProgressEvent]:
+        """
+        yields progress events until update is finished
+        """
+        queue = self._get_queue()
+        while True:
+            event = await queue.get()
+            if event is None:
+                return
+            yield event
+
+
+async def update_archive(archive: ABCArchive, **update_kwargs) -> UpdateReport:
+    """
+    async counterpart of archive.update
+    """
+    return await AsyncArchiveUpdate(archive, **update_kwargs).run()
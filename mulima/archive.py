@@ -1,32 +1,430 @@
-from datetime import datetime
+import functools
 import typing as typ
 from pathlib import Path
-import os
 from itertools import chain
-import mimetypes
 from collections import Counter
 
 from mulima.track_processor import Track
-
-from PIL import Image
+from mulima.index import TrackIndex, StatSignature
+from mulima.executor import UpdateExecutor
+from mulima.scanner import DirectoryEntries, FileEntry, scan_directories, scan_directory
+from mulima.covers import CoverCache
+from mulima.renamer import RenamePlan
+from mulima.journal import UpdateJournal
+from mulima.sync import ArchiveSync
+from mulima.tree_cache import TreeCache
+from mulima.artist_matcher import ArtistMatcher
+from mulima.fingerprint import FingerprintIndex, group_duplicates
+from mulima.id3v1 import StripResult, strip_id3v1
+from mulima.snapshot import SnapshotRecord, SnapshotStats, read_snapshot, read_track_record, write_snapshot
+from mulima.metrics import UpdateCallbacks, UpdateMetrics, UpdateReport
+
+
+class MissingRecord(typ.NamedTuple):
+    """
+    index record of track, which was not found by update, it's kept until moved track is found
+    """
+    signature: StatSignature
+    tags: typ.Dict[str, typ.Optional[str]]
+    digest: typ.Optional[str]
 
 
 class ABCArchive:
-    last_update_time: typ.Optional[datetime]
-
-    def __init__(self, path: str):
+    CHECKPOINT_SIZE = 1000  # default number of tracks in batch of update, directories are not split
+    index: TrackIndex
+    executor: UpdateExecutor
+    callbacks: typ.List[UpdateCallbacks]
+    tree_cache: typ.Optional[TreeCache]  # is set by Library, when archive is updated together with others
+    fingerprint_tracks: bool
+
+    def __init__(self, path: str, *, executor: typ.Optional[UpdateExecutor] = None,
+                 callbacks: typ.Iterable[UpdateCallbacks] = (), fingerprint_tracks: bool = False):
+        """
+        :param executor: executor for per track work of updates, by default everything is done serially
+        :param callbacks: observers of update phases and counters
+        :param fingerprint_tracks: if True audio data of new and changed tracks is hashed on update,
+        so tracks, moved by copying, are recognized too (not only renamed ones)
+        """
         self.path = Path(path)
-        self.last_update_time = None
+        self.index = TrackIndex(self.path, type(self).__name__.lower())
+        self.fingerprint_tracks = fingerprint_tracks
+        self.executor = UpdateExecutor() if executor is None else executor
+        self.callbacks = list(callbacks)
+        self.tree_cache = None
+        self.__fingerprints: typ.Optional[FingerprintIndex] = None
+
+    @property
+    def fingerprints(self) -> FingerprintIndex:
+        """
+        digests of audio data of tracks, index is opened on first use
+        """
+        if self.__fingerprints is None:
+            self.__fingerprints = FingerprintIndex(self.path)
+        return self.__fingerprints
+
+    def _commit_indices(self):
+        self.index.commit()
+        if self.__fingerprints is not None:
+            self.__fingerprints.commit()
+
+    def close(self):
+        """
+        closes indices of archive, executor is not shut down, because it could be shared
+        """
+        self.index.close()
+        if self.__fingerprints is not None:
+            self.__fingerprints.close()
+            self.__fingerprints = None
+
+    def __enter__(self) -> 'ABCArchive':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def scan(self, directories: typ.Optional[typ.Iterable[Path]] = None) -> typ.Iterator[DirectoryEntries]:
+        """
+        lazily yields tracks and pictures of every archive directory with their stat results
+        :param directories: if not None, only these directories (without subdirectories) are scanned
+        """
+        if directories is None:
+            if self.tree_cache is not None:
+                return self.tree_cache.scan(self.path)
+            return scan_directories(self.path, skip_dirnames={TrackIndex.STATE_DIRNAME})
+        return (scan_directory(directory) for directory in directories if directory.is_dir())
 
     def find_tracks(self) -> typ.List[Path]:
-        tracks = list()
-        for _, _, files in os.walk(self.path):
-            for file in files:
-                filepath = Path(file)
-                if Track.could_created_from(filepath):
-                    tracks.append(filepath)
+        return [track_entry.path for directory in self.scan() for track_entry in directory.tracks]
+
+    def select_tracks_to_update(self, track_entries: typ.List[FileEntry], *, new_only: bool) -> typ.List[Path]:
+        """
+        filters out tracks, which stat signature has not changed since they were indexed
+        :param new_only: if False every track will be selected
+        """
+        return [track_entry.path for track_entry in track_entries
+                if not new_only or not self.index.is_actual(track_entry.path, StatSignature.from_stat(track_entry.stat))]
+
+    def _load_tracks(self, metrics: UpdateMetrics, filepath_list: typ.List[Path]) -> typ.List[Track]:
+        def on_done(filepath: Path):
+            metrics.file_done('load', filepath)
+
+        with metrics.phase('load'):
+            if self.tree_cache is not None:
+                track_list, loaded_track_list = self.tree_cache.load_tracks(filepath_list, on_done=on_done)
+            else:
+                track_list = loaded_track_list = self.executor.load_tracks(filepath_list, on_done=on_done)
+
+        metrics.count('files_opened', len(loaded_track_list))
+        metrics.count('bytes_read', sum(track.bytes_read for track in loaded_track_list))
+        return track_list
+
+    def _write_tracks(self, metrics: UpdateMetrics, track_list: typ.List[Track]):
+        with metrics.phase('write'):
+            written_bytes_list = self.executor.write_tracks(
+                track_list, on_done=lambda track: metrics.file_done('write', track.get_path())
+            )
+
+        metrics.count('files_parsed', sum(track.is_parsed() for track in track_list))
+        metrics.count('files_saved', sum(1 for written_bytes in written_bytes_list if written_bytes))
+        metrics.count('bytes_written', sum(written_bytes_list))
+
+    def _get_rename_journal_path(self) -> Path:
+        return self.path / TrackIndex.STATE_DIRNAME / f'{type(self).__name__.lower()}.rename.journal'
+
+    def resume_interrupted_renames(self, *, rollback: bool = False):
+        """
+        finishes (or rolls back) renames of the previous update, if it was interrupted
+        """
+        plan = RenamePlan.load(self._get_rename_journal_path())
+        if plan is not None:
+            if rollback:
+                plan.rollback()
+            else:
+                plan.resume()
+
+    def _get_update_journal_path(self) -> Path:
+        return self.path / TrackIndex.STATE_DIRNAME / f'{type(self).__name__.lower()}.update.journal'
+
+    def _start_journal(self, metrics: UpdateMetrics, *, new_only: bool,
+                       directories: typ.Optional[typ.List[Path]]) -> typ.Tuple[UpdateJournal, typ.Set[Path]]:
+        """
+        :return: journal of update and directories, which were finished by interrupted update with the same arguments
+        """
+        journal = UpdateJournal(self._get_update_journal_path(), self.path)
+        finished_directories = journal.start({
+            'new_only': new_only,
+            'directories': None if directories is None else sorted(directory.relative_to(self.path).as_posix()
+                                                                   for directory in directories),
+        })
+        if finished_directories:
+            metrics.count('directories_resumed', len(finished_directories))
+        return journal, finished_directories
+
+    @staticmethod
+    def _split_into_batches(indices_by_directory: typ.Dict[Path, typ.List[int]],
+                            batch_size: int) -> typ.List[typ.Dict[Path, typ.List[int]]]:
+        """
+        :return: groups of whole directories with at least batch_size tracks (except of the last group)
+        """
+        batches, batch, batch_track_count = list(), dict(), 0
+        for directory, indices in indices_by_directory.items():
+            batch[directory] = indices
+            batch_track_count += len(indices)
+            if batch_track_count >= batch_size:
+                batches.append(batch)
+                batch, batch_track_count = dict(), 0
+
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def plan_filenames(self, track_list: typ.List[Track],
+                       indices_by_directory: typ.Dict[Path, typ.List[int]]) -> RenamePlan:
+        """
+        :return: renames of tracks of given directories, which are not applied yet
+        """
+        raise NotImplementedError
+
+    def _apply_changes(self, metrics: UpdateMetrics, journal: UpdateJournal, track_list: typ.List[Track],
+                       indices_by_directory: typ.Dict[Path, typ.List[int]], *, checkpoint_size: int):
+        """
+        writes, renames and registers in index tracks by batches of directories, look at UpdateJournal
+        """
+        for batch_indices_by_directory in self._split_into_batches(indices_by_directory, checkpoint_size):
+            batch_track_list = [track_list[index] for indices in batch_indices_by_directory.values()
+                                for index in indices]
+            plan = self.plan_filenames(track_list, batch_indices_by_directory)
+            written_paths = [track.get_path() for track in batch_track_list if track.is_modified]
+            journal.plan_batch(batch_indices_by_directory, writes=written_paths,
+                               covers=[track.get_path() for track in batch_track_list if track.has_pending_cover()],
+                               renames=plan.operations,
+                               temps=[Track.get_temp_path(path) for path in written_paths])
+
+            self._write_tracks(metrics, batch_track_list)
+
+            with metrics.phase('rename'):
+                renamed_filepaths = plan.apply()
+            metrics.count('files_renamed', len(renamed_filepaths))
+
+            with metrics.phase('index'):
+                self.register_tracks(batch_track_list, renamed_filepaths)
+                self._commit_indices()
+
+            journal.checkpoint(batch_indices_by_directory)
+
+    def _scan_windows(self, metrics: UpdateMetrics, directories: typ.Optional[typ.List[Path]],
+                      window_size: typ.Optional[int]) -> typ.Iterator[typ.Tuple[typ.List[DirectoryEntries], bool]]:
+        """
+        lazily scans archive and groups scanned directories by window_size directories with tracks
+        (directories without tracks are added to the current window)
+        :return: entries of directories of every window and whether it's the last one
+        """
+        window, window_track_directory_count = list(), 0
+        for directory_entries in self.scan(directories):
+            for track_entry in directory_entries.tracks:
+                metrics.file_done('discovery', track_entry.path)
+
+            if directory_entries.tracks and window_track_directory_count == window_size:
+                yield window, False
+                window, window_track_directory_count = list(), 0
+
+            window.append(directory_entries)
+            window_track_directory_count += bool(directory_entries.tracks)
+        yield window, True
+
+    def _carry_moved_tracks(self, track_entries: typ.List[FileEntry], digests: typ.Dict[Path, str],
+                            missing_records: typ.Dict[Path, MissingRecord]) -> int:
+        """
+        finds tracks, which were moved or renamed since the last update, and moves their index records,
+        so they are not processed again. Moved track has the same size and mtime as the missing one and
+        the same inode or the same digest of audio data
+        :param digests: digests of audio data of tracks, if they were computed
+        :param missing_records: records of tracks, which were not found in already scanned directories,
+        carried records are removed from it
+        :return: number of moved tracks
+        """
+        new_entries = [track_entry for track_entry in track_entries
+                       if self.index.get_signature(track_entry.path) is None]
+        if not new_entries or not missing_records:
+            return 0
+
+        missing_by_signature = {record.signature: path for path, record in missing_records.items()}
+        missing_by_digest = {(record.signature.size, record.signature.mtime_ns, record.digest): path
+                             for path, record in missing_records.items() if record.digest is not None}
+
+        moved_count = 0
+        for track_entry in new_entries:
+            signature = StatSignature.from_stat(track_entry.stat)
+            old_path = missing_by_signature.get(signature)
+            if old_path is None and track_entry.path in digests:
+                old_path = missing_by_digest.get((signature.size, signature.mtime_ns, digests[track_entry.path]))
+            if old_path is None or old_path not in missing_records:
+                continue
+
+            self.index.put(track_entry.path, signature, missing_records.pop(old_path).tags)
+            self.index.remove(old_path)
+            if self.fingerprint_tracks:
+                self.fingerprints.remove(old_path)
+            moved_count += 1
+
+        return moved_count
+
+    def _index_discovered_tracks(self, metrics: UpdateMetrics, window: typ.List[DirectoryEntries],
+                                 missing_records: typ.Dict[Path, MissingRecord]):
+        """
+        brings index up to date with tracks of scanned window: moves records of moved tracks and removes
+        records of missing ones. Records of missing tracks are remembered in missing_records,
+        so tracks moved to directories of next windows are recognized too
+        """
+        track_entries = [track_entry for directory_entries in window for track_entry in directory_entries.tracks]
+        window_directories = [directory_entries.path for directory_entries in window]
+        existing_paths = {track_entry.path for track_entry in track_entries}
+
+        digests = dict()
+        if self.fingerprint_tracks:
+            digests = self.fingerprints.update(track_entries, self.executor,
+                                               on_done=lambda path: metrics.file_done('discovery', path))
+        for path, signature, tags in self.index.records(window_directories):
+            if path not in existing_paths:
+                digest = self.fingerprints.get_digest(path, signature) if self.fingerprint_tracks else None
+                missing_records[path] = MissingRecord(signature, tags, digest)
+
+        moved_count = self._carry_moved_tracks(track_entries, digests, missing_records)
+        if moved_count:
+            metrics.count('files_moved', moved_count)
+
+        self.index.retain(existing_paths, directories=window_directories)
+        if self.fingerprint_tracks:
+            self.fingerprints.retain(existing_paths, directories=window_directories)
+
+    def _remember_removed_directories(self, directories: typ.Optional[typ.List[Path]],
+                                      missing_records: typ.Dict[Path, MissingRecord]):
+        """
+        adds records of tracks of directories, which don't exist anymore, to missing_records,
+        so tracks of renamed or moved directories are recognized
+        :param directories: directories to check, None means that every indexed directory is checked once
+        """
+        checked_directories = self.index.directories() if directories is None else directories
+        removed_directories = [directory for directory in checked_directories if not directory.is_dir()]
+        for path, signature, tags in self.index.records(removed_directories):
+            digest = self.fingerprints.get_digest(path, signature) if self.fingerprint_tracks else None
+            missing_records[path] = MissingRecord(signature, tags, digest)
+
+    def _forget_unscanned_directories(self, directories: typ.Optional[typ.List[Path]],
+                                      scanned_directories: typ.Set[Path]):
+        """
+        removes records of tracks of directories, which were removed since the last update
+        """
+        if directories is None:
+            self.index.retain_directories(scanned_directories)
+            if self.fingerprint_tracks:
+                self.fingerprints.retain_directories(scanned_directories)
+        else:
+            removed_directories = [directory for directory in directories if directory not in scanned_directories]
+            self.index.retain((), directories=removed_directories)
+            if self.fingerprint_tracks:
+                self.fingerprints.retain((), directories=removed_directories)
+
+    def _update(self, metrics: UpdateMetrics,
+                fix_tracks: typ.Callable[[UpdateMetrics, typ.List[Track], typ.List[DirectoryEntries]],
+                                         typ.Dict[Path, typ.List[int]]], *,
+                new_only: bool, directories: typ.Optional[typ.List[Path]],
+                window_size: typ.Optional[int], checkpoint_size: typ.Optional[int]):
+        """
+        scans archive, loads tracks to update, fixes them and applies changes
+        :param fix_tracks: changes tags and covers of loaded tracks of scanned directories,
+        returns indices of tracks by directory
+        :param window_size: if not None, archive is scanned lazily and every window_size directories with tracks
+        are processed end to end (from scanning to registration in index) and released, so memory doesn't grow
+        with archive size. Only tracks moved from removed directories or to directories of the same or of next
+        windows are recognized as moved, others are processed as new ones
+        """
+        if window_size is not None and window_size < 1:
+            raise ValueError('window_size should be positive')
+
+        windows = self._scan_windows(metrics, directories, window_size)
+        journal, finished_directories = None, set()
+        scanned_directories, missing_records = set(), dict()
+
+        is_last_window = False
+        while not is_last_window:
+            with metrics.phase('discovery'):
+                if journal is None:
+                    self.resume_interrupted_renames()
+                    journal, finished_directories = self._start_journal(metrics, new_only=new_only,
+                                                                        directories=directories)
+                    self._remember_removed_directories(directories, missing_records)
+
+                window, is_last_window = next(windows)
+                scanned_directories.update(directory_entries.path for directory_entries in window)
+                self._index_discovered_tracks(metrics, window, missing_records)
+                if is_last_window:
+                    self._forget_unscanned_directories(directories, scanned_directories)
+
+                track_entries = [track_entry for directory_entries in window
+                                 for track_entry in directory_entries.tracks]
+                filepath_list = self.select_tracks_to_update(
+                    [track_entry for track_entry in track_entries
+                     if track_entry.path.parent not in finished_directories],
+                    new_only=new_only
+                )
+            metrics.count('files_found', len(track_entries))
+
+            track_list = self._load_tracks(metrics, filepath_list)
+            indices_by_directory = fix_tracks(metrics, track_list, window)
+            self._apply_changes(metrics, journal, track_list, indices_by_directory,
+                                checkpoint_size=checkpoint_size or self.CHECKPOINT_SIZE)
+
+        self._commit_indices()
+        journal.finish()
+
+    def get_fingerprints(self) -> typ.Dict[Path, str]:
+        """
+        :return: digest of audio data of every track, only new and changed tracks are hashed
+        """
+        track_entries = [track_entry for directory in self.scan() for track_entry in directory.tracks]
+        digests = self.fingerprints.update(track_entries, self.executor)
+        self.fingerprints.retain(digests)
+        self.fingerprints.commit()
+        return digests
+
+    def find_duplicates(self) -> typ.Dict[str, typ.List[Path]]:
+        """
+        :return: paths of tracks with the same audio data (the same recording with any tags) by digest of it
+        """
+        return group_duplicates(self.get_fingerprints())
+
+    def register_tracks(self, track_list: typ.List[Track], renamed_filepaths: typ.Dict[Path, Path]):
+        for old_filepath in renamed_filepaths:
+            self.index.remove(old_filepath)
+
+        filepath_list = [renamed_filepaths.get(track.get_path(), track.get_path()) for track in track_list]
+        signatures = self.executor.get_signatures(filepath_list)
+        for track, filepath, signature in zip(track_list, filepath_list, signatures):
+            self.index.put(filepath, signature, track.get_tags())
+            if self.fingerprint_tracks:
+                # only tags were rewritten, so digest of audio data is the same
+                self.fingerprints.carry(track.get_path(), filepath, signature)
+
+        if self.tree_cache is not None:
+            self.tree_cache.register(track_list, renamed_filepaths, signatures)
+
+    @staticmethod
+    def _group_indices(keys: typ.Iterable[typ.Hashable]) -> typ.Dict[typ.Hashable, typ.List[int]]:
+        """
+        :return: indices of equal keys by key, groups keep order of the first occurrence
+        """
+        indices_by_key = dict()
+        for index, key in enumerate(keys):
+            if key not in indices_by_key:
+                indices_by_key[key] = list()
+            indices_by_key[key].append(index)
 
-        return tracks
+        return indices_by_key
+
+    @classmethod
+    def _get_track_indices_by_directory(cls, track_list: typ.List[Track]) -> typ.Dict[Path, typ.List[int]]:
+        return cls._group_indices(track.get_path().parent for track in track_list)
 
     @staticmethod
     def manage_title_tags(track_list: typ.List[Track]):
@@ -34,86 +432,229 @@ class ABCArchive:
             if track.get_tag('title') is None:
                 track.set_tag('title', track.get_path().stem)
 
-    def update(self, *, new_only: bool):
+    def update(self, *, new_only: bool, profile: bool = False, trace_memory: bool = False,
+               directories: typ.Optional[typ.Iterable[Path]] = None,
+               checkpoint_size: typ.Optional[int] = None, window_size: typ.Optional[int] = None) -> UpdateReport:
         """
         updates tracks info
-        :param new_only: if True will consider only new founded tracks
-        :param filename_pattern: if not None will rename track's filename due to it's tags
-        :return:
+        :param new_only: if True will consider only new or changed (since last update) tracks
+        :param directories: if not None, only tracks of these directories (without subdirectories) will be updated
+        :param checkpoint_size: number of tracks, which are written, renamed and registered in index together.
+        If update is interrupted, the next one with the same arguments continues from the last finished batch
+        :param window_size: if not None, update is streamed by windows of window_size directories: tracks of
+        window are loaded, fixed, written, renamed and registered before the next window is loaded,
+        by default tracks of the whole archive are loaded at once
+        :param profile: if True update will be profiled by cProfile, look at UpdateReport.profile
+        :param trace_memory: if True memory allocations will be traced, look at UpdateReport.memory_snapshot
+        :return: durations of update phases and counters of file operations
         """
         raise NotImplementedError
 
-    # def sync(self):
-    #     raise NotImplementedError
-    #
-    # def stat(self):
-    #     raise NotImplementedError
-    #
-    # def json_load(self):
-    #     raise NotImplementedError
+    def sync(self, replica_path: str, *, tags_only: bool = False, delete: bool = True, allow_hardlinks: bool = True,
+             profile: bool = False, trace_memory: bool = False) -> UpdateReport:
+        """
+        transfers only new and changed tracks of archive to replica, renamed tracks are moved in replica
+        :param tags_only: if True and audio data of replica track is the same, only tags region is rewritten
+        :param delete: if True tracks, which are not in archive anymore, are removed from replica
+        :param allow_hardlinks: look at ArchiveSync
+        :return: durations of sync phases and counters of file operations
+        """
+        return ArchiveSync(self.path, self.index, Path(replica_path), tags_only=tags_only, delete=delete,
+                           allow_hardlinks=allow_hardlinks, executor=self.executor,
+                           callbacks=self.callbacks).run(profile=profile, trace_memory=trace_memory)
+
+    def _register_stripped_track(self, result: StripResult):
+        """
+        keeps index record of truncated track, if it was actual and tags of track were not changed by truncation
+        """
+        if self.index.is_actual(result.path, result.old_signature):
+            indexed_tags = self.index.get_tags(result.path)
+            if {tag: value for tag, value in indexed_tags.items() if value is not None} == \
+                    {tag: value for tag, value in result.tags.items() if value is not None}:
+                self.index.put(result.path, result.new_signature, result.tags)
+
+        if self.fingerprint_tracks:
+            # audio data was not changed
+            digest = self.fingerprints.get_digest(result.path, result.old_signature)
+            if digest is not None:
+                self.fingerprints.put(result.path, result.new_signature, digest)
+
+    def strip_id3v1(self, *, dry_run: bool = False, profile: bool = False,
+                    trace_memory: bool = False) -> UpdateReport:
+        """
+        removes ID3v1 tags from the ends of mp3 tracks in place, look at mulima.id3v1.strip_id3v1.
+        Index records are updated, so stripped tracks are not parsed by the next update
+        :param dry_run: if True tracks are not changed, report counts tracks and bytes, which would be removed
+        :return: report with counters files_stripped and bytes_stripped, stripped tracks are passed to
+        on_file_done callbacks
+        """
+        with UpdateMetrics(self.callbacks, profile=profile, trace_memory=trace_memory) as metrics:
+            with metrics.phase('discovery'):
+                filepath_list = [track_entry.path for directory in self.scan() for track_entry in directory.tracks
+                                 if track_entry.path.suffix == '.mp3']
+            metrics.count('files_found', len(filepath_list))
+
+            with metrics.phase('strip'):
+                results = self.executor.map(functools.partial(strip_id3v1, dry_run=dry_run), filepath_list)
+                stripped_results = [result for result in results if result.tag_size]
+                for result in stripped_results:
+                    metrics.file_done('strip', result.path)
+            metrics.count('files_stripped', len(stripped_results))
+            metrics.count('bytes_stripped', sum(result.tag_size for result in stripped_results))
+
+            if not dry_run:
+                with metrics.phase('index'):
+                    for result in stripped_results:
+                        self._register_stripped_track(result)
+                    self._commit_indices()
+
+            return metrics.finish()
+
+    def _iter_snapshot_records(self) -> typ.Iterator[SnapshotRecord]:
+        read_record = functools.partial(read_track_record, self.path)
+        for directory in self.scan():
+            # one directory at a time, so only it's tracks are kept in memory
+            records = self.executor.map(read_record, directory.tracks, path_of=lambda track_entry: track_entry.path)
+            for record in records:
+                yield record._replace(indexed=self.index.is_actual(self.path / record.path, record.signature))
+
+    def json_dump(self, snapshot_path: str) -> int:
+        """
+        exports path, stat signature, tags and cover digest of every track to JSON Lines snapshot,
+        it's compressed, if filename ends with .gz, .bz2 or .xz.
+        Tracks, which are up to date in index, are marked, only they are restored by json_load
+        :return: number of exported tracks
+        """
+        return write_snapshot(Path(snapshot_path), self._iter_snapshot_records())
+
+    def json_load(self, snapshot_path: str) -> int:
+        """
+        rebuilds index of archive from snapshot, track files are not opened.
+        Only tracks, which were indexed at export, are restored, so tracks, which were not processed by update,
+        are updated as usual. So are tracks, which were changed after export, they don't match their stat signatures
+        :return: number of restored tracks
+        """
+        filepath_list = list()
+        for record in read_snapshot(Path(snapshot_path)):
+            if not record.indexed:
+                continue
+
+            filepath = self.path / record.path
+            self.index.put(filepath, record.signature, record.tags)
+            filepath_list.append(filepath)
+
+        self.index.retain(filepath_list)
+        self.index.commit()
+        return len(filepath_list)
+
+    def stat(self, snapshot_path: typ.Optional[str] = None) -> SnapshotStats:
+        """
+        computes aggregate stats of archive in one streaming pass
+        :param snapshot_path: snapshot, which stats are computed, by default index of archive is used
+        (it has no cover digests)
+        """
+        if snapshot_path is not None:
+            return SnapshotStats.compute(read_snapshot(Path(snapshot_path)))
+
+        return SnapshotStats.compute(
+            SnapshotRecord(filepath.relative_to(self.path).as_posix(), signature, tags)
+            for filepath, signature, tags in self.index.records()
+        )
 
 
 class ArtistArchive(ABCArchive):
     ordered_possible_artist_names: typ.List[str]
     case_sensitive: bool
+    whole_words: bool
 
-    def __init__(self, path: str, ordered_possible_artist_names: typ.List[str], *, case_sensitive: bool = True):
-        super().__init__(path)
+    def __init__(self, path: str, ordered_possible_artist_names: typ.List[str], *, case_sensitive: bool = True,
+                 whole_words: bool = False, executor: typ.Optional[UpdateExecutor] = None,
+                 callbacks: typ.Iterable[UpdateCallbacks] = (), fingerprint_tracks: bool = False):
+        """
+        :param whole_words: if True artist names are found in artist tag only as separate words
+        """
+        super().__init__(path, executor=executor, callbacks=callbacks, fingerprint_tracks=fingerprint_tracks)
 
         self.ordered_possible_artist_names = ordered_possible_artist_names
         self.case_sensitive = case_sensitive
+        self.whole_words = whole_words
+        self.__artist_matcher: typ.Optional[ArtistMatcher] = None
+
+    def get_artist_matcher(self) -> ArtistMatcher:
+        """
+        matcher is compiled once and is rebuilt only if names or matching options were changed
+        """
+        matcher = self.__artist_matcher
+        if matcher is None or matcher.names != self.ordered_possible_artist_names or \
+                matcher.case_sensitive != self.case_sensitive or matcher.whole_words != self.whole_words:
+            matcher = self.__artist_matcher = ArtistMatcher(
+                self.ordered_possible_artist_names, case_sensitive=self.case_sensitive, whole_words=self.whole_words
+            )
+        return matcher
 
     def manage_artist_tags(self, track_list: typ.List[Track], *, missed_only: bool):
-        casefolded_possible_artist_names = {name.casefold() for name in self.ordered_possible_artist_names}
+        main_artist_name = self.ordered_possible_artist_names[0]
 
+        tracks_with_artist = list()
         for track in track_list:
-            artist_tag_value = track.get_tag('artist')
-            if artist_tag_value is None:
-                track.set_tag('artist', self.ordered_possible_artist_names[0])
-            elif missed_only is not None:
-                if self.case_sensitive:
-                    if any(artist_name in artist_tag_value
-                           for artist_name in self.ordered_possible_artist_names):
-                        continue
-                    track.set_tag('artist', self.ordered_possible_artist_names[0])
-                else:
-                    folded_artist_tag_value = artist_tag_value.casefold()
-                    if any(folded_artist_name in folded_artist_tag_value
-                           for folded_artist_name in casefolded_possible_artist_names):
-                        continue  # for example collaboration of artists, tag could be 'A & B (feat C)'
-                    track.set_tag('artist', self.ordered_possible_artist_names[0])
-
-    @staticmethod
-    def update_filenames(filepath_list: typ.List[Path]):
-        for filepath in filepath_list:
-            desirable_filename = Track(filepath).get_tag('title')
-            if filepath.stem is not desirable_filename:
-                Track.rename(filepath, desirable_filename)
-
-    def update(self, *, new_only: bool = True):
-        track_list = [Track(filepath) for filepath in self.find_tracks()]
-        if new_only and self.last_update_time is not None:
-            track_list = [track for track in track_list
-                          if track.get_mulima_upd_time() > self.last_update_time]
-
-        self.manage_artist_tags(track_list, missed_only=False)
-        self.manage_title_tags(track_list)
+            if track.get_tag('artist') is None:
+                track.set_tag('artist', main_artist_name)
+            else:
+                tracks_with_artist.append(track)
+
+        if not missed_only:
+            # for example collaboration of artists, tag could be 'A & B (feat C)'
+            artist_matches = self.get_artist_matcher().match_many([track.get_tag('artist')
+                                                                   for track in tracks_with_artist])
+            for track, is_matched in zip(tracks_with_artist, artist_matches):
+                if not is_matched:
+                    track.set_tag('artist', main_artist_name)
+
+    def plan_filenames(self, track_list: typ.List[Track],
+                       indices_by_directory: typ.Dict[Path, typ.List[int]]) -> RenamePlan:
+        plan = RenamePlan(self._get_rename_journal_path())
+        for directory, indices in indices_by_directory.items():
+            directory_track_list = [track_list[index] for index in indices]
+            plan.add_directory(directory, {track.get_path(): track.format_filename('{title}')
+                                           for track in directory_track_list})
+        return plan
+
+    def update_filenames(self, track_list: typ.List[Track]) -> typ.Dict[Path, Path]:
+        """
+        :return: new path for every renamed track
+        """
+        return self.plan_filenames(track_list, self._get_track_indices_by_directory(track_list)).apply()
 
-        for track in track_list:
-            track.write()
+    def _fix_tracks(self, metrics: UpdateMetrics, track_list: typ.List[Track],
+                    window: typ.List[DirectoryEntries]) -> typ.Dict[Path, typ.List[int]]:
+        with metrics.phase('tags'):
+            self.manage_artist_tags(track_list, missed_only=False)
+            self.manage_title_tags(track_list)
 
-        self.update_filenames([track.get_path() for track in track_list])
+        return self._get_track_indices_by_directory(track_list)
 
-        self.last_update_time = datetime.now()
+    def update(self, *, new_only: bool = True, profile: bool = False, trace_memory: bool = False,
+               directories: typ.Optional[typ.Iterable[Path]] = None,
+               checkpoint_size: typ.Optional[int] = None, window_size: typ.Optional[int] = None) -> UpdateReport:
+        directories = None if directories is None else list(directories)
+        with UpdateMetrics(self.callbacks, profile=profile, trace_memory=trace_memory) as metrics:
+            self._update(metrics, self._fix_tracks, new_only=new_only, directories=directories,
+                         window_size=window_size, checkpoint_size=checkpoint_size)
+            return metrics.finish()
 
 
 class AlbumArchive(ABCArchive):
     COVER_PIC_MAX_SIZE = (600, 600)  # in pixels
+    COVERS_CACHE_DIRNAME = 'covers'
     album_name: str
+    cover_cache: CoverCache
 
-    def __init__(self, path: str, album_name: str):
-        super().__init__(path)
+    def __init__(self, path: str, album_name: str, *, executor: typ.Optional[UpdateExecutor] = None,
+                 callbacks: typ.Iterable[UpdateCallbacks] = (), fingerprint_tracks: bool = False):
+        super().__init__(path, executor=executor, callbacks=callbacks, fingerprint_tracks=fingerprint_tracks)
         self.album_name = album_name
+        self.cover_cache = CoverCache(self.path / TrackIndex.STATE_DIRNAME / self.COVERS_CACHE_DIRNAME,
+                                      self.COVER_PIC_MAX_SIZE)
 
     def manage_album_tags(self, track_list: typ.List[Track]):
         for track in track_list:
@@ -125,126 +666,149 @@ class AlbumArchive(ABCArchive):
                 track.set_tag('album', self.album_name)
 
     @staticmethod
-    def manage_tracknumber_tags(tracks_by_album_and_directory: typ.Dict[(str, Path), typ.List[Track]]):
-        for track_list in tracks_by_album_and_directory.values():
+    def manage_tracknumber_tags(track_list: typ.List[Track],
+                                indices_by_album_and_directory: typ.Dict[typ.Tuple[str, Path], typ.List[int]]):
+        tracknumbers = [track.get_tag('tracknumber') for track in track_list]
+        for indices in indices_by_album_and_directory.values():
             # do not use int for tracknumber, because it could be with letters: '1a',''2b'
-            tracknumbers_quantities = Counter([track.get_tag('tracknumber') for track in track_list
-                                               if track.get_tag('tracknumber') is not None])
+            tracknumbers_quantities = Counter([tracknumbers[index] for index in indices
+                                               if tracknumbers[index] is not None])
 
             if any(quantity > 1 for quantity in tracknumbers_quantities.values()):
-                for track in track_list:
-                    track.remove_tag('tracknumber')
+                for index in indices:
+                    track_list[index].remove_tag('tracknumber')
 
     @staticmethod
-    def manage_tracktotal_tags(tracks_by_album_and_directory: typ.Dict[(str, Path), typ.List[Track]]):
-        for track_list in tracks_by_album_and_directory.values():
-            tracktotals_values = {track.get_tag('tracktotal') for track in track_list
-                                  if track.get_tag('tracktotal') is not None}
+    def manage_tracktotal_tags(track_list: typ.List[Track],
+                               indices_by_album_and_directory: typ.Dict[typ.Tuple[str, Path], typ.List[int]]):
+        tracktotals = [track.get_tag('tracktotal') for track in track_list]
+        for indices in indices_by_album_and_directory.values():
+            tracktotals_values = {tracktotals[index] for index in indices if tracktotals[index] is not None}
 
             if len(tracktotals_values) > 1:
-                for track in track_list:
-                    track.remove_tag('tracktotal')
-
-    def manage_covers(self, tracks_by_directory: typ.Dict[Path, typ.List[Track]]):
-        pics_extensions = [mimetypes.guess_extension(mt).lstip('.')
-                           for mt in Track.AVAILABLE_PICS_MIMETYPES]
-
-        ordered_cover_fname_patterns = list(chain(
-            [f'cover.{ext}' for ext in pics_extensions],
-            [f'*cover*.{ext}' for ext in pics_extensions],
-            [f'*.{ext}' for ext in pics_extensions]
-        ))
-
-        root_cover_candidates = list(chain(*(
-            self.path.glob(pattern) for pattern in ordered_cover_fname_patterns
-        )))
+                for index in indices:
+                    track_list[index].remove_tag('tracktotal')
 
-        any_pictures = list(chain(*(
-            self.path.rglob(f'*.{ext}') for ext in pics_extensions
-        )))
+    @staticmethod
+    def _order_cover_candidates(picture_list: typ.List[FileEntry]) -> typ.List[FileEntry]:
+        """
+        orders pictures of one directory by probability to be a cover: 'cover.*', '*cover*.*', others
+        """
+        def priority(picture_entry: FileEntry) -> int:
+            stem = picture_entry.path.stem.casefold()
+            if stem == 'cover':
+                return 0
+            elif 'cover' in stem:
+                return 1
+            return 2
+
+        return sorted(picture_list, key=priority)
+
+    def manage_covers(self, track_list: typ.List[Track], indices_by_directory: typ.Dict[Path, typ.List[int]],
+                      pictures_by_directory: typ.Dict[Path, typ.List[FileEntry]], *,
+                      on_done: typ.Optional[typ.Callable[[Path], None]] = None):
+        """
+        :param pictures_by_directory: pictures of scanned archive directories with their stat results,
+        the first one with pictures is a fallback
+        :param on_done: is called for every track, which got a cover
+        """
+        root_cover_candidates = self._order_cover_candidates(pictures_by_directory.get(self.path, []))
+        any_pictures = list(chain(*pictures_by_directory.values()))
 
         if any_pictures:
-            for dir_path, track_list in tracks_by_directory.items():
-                this_dir_cover_candidates = list(chain(*(
-                    dir_path.glob(pattern) for pattern in ordered_cover_fname_patterns
-                )))
+            for dir_path, indices in indices_by_directory.items():
+                this_dir_cover_candidates = self._order_cover_candidates(pictures_by_directory.get(dir_path, []))
 
                 cover_candidates = this_dir_cover_candidates + root_cover_candidates + any_pictures
-                cover_path = cover_candidates[0]
-
-                cover = Image.open(cover_path)
-                cover.tumbnail(self.COVER_PIC_MAX_SIZE)
-                cover_data = cover.tobytes()
-
-                cover_mimetype = mimetypes.guess_type(cover_path)
-                for track in track_list:
-                    track.set_cover(data=cover_data, mimetype=cover_mimetype)
-
-    @staticmethod
-    def _get_tracks_by_album_and_directory(
-            track_list: typ.List[Track]
-    ) -> typ.Dict[typ.Tuple[str, Path], typ.List[Track]]:
-        tracks_by_album_and_directory = dict()
-        for track in track_list:
-            directory = track.get_path().parent
-            album_tag_val = track.get_tag('album')
-
-            if (album_tag_val, directory) not in tracks_by_album_and_directory:
-                tracks_by_album_and_directory[(album_tag_val, directory)] = list()
-            tracks_by_album_and_directory[(album_tag_val, directory)].append(track)
-
-        return tracks_by_album_and_directory
-
-    @staticmethod
-    def _get_tracks_by_directory(track_list: typ.List[Track]) -> typ.Dict[Path, typ.List[Track]]:
-        tracks_by_directory = dict()
-        for track in track_list:
-            directory = track.get_path().parent
-
-            if directory not in tracks_by_directory:
-                tracks_by_directory[directory] = list()
-            tracks_by_directory[directory].append(track)
-
-        return tracks_by_directory
-
-    @staticmethod
-    def update_filenames(track_filepath_by_directory: typ.Dict[Path, typ.List[Path]]):
-        for filepath_list in track_filepath_by_directory.values():
-            track_list = [Track(filepath) for filepath in filepath_list]
-            tracknumber_list = [track.get_tag('tracknumber') for track in track_list]
+                cover_entry = cover_candidates[0]
+
+                cover = self.cover_cache.get(cover_entry.path, StatSignature.from_stat(cover_entry.stat))
+                for index in indices:
+                    track_list[index].set_cover(data=cover.data, mimetype=cover.mimetype)
+                    if on_done is not None:
+                        on_done(track_list[index].get_path())
+
+    @classmethod
+    def _get_track_indices_by_album_and_directory(
+            cls, track_list: typ.List[Track]
+    ) -> typ.Dict[typ.Tuple[str, Path], typ.List[int]]:
+        return cls._group_indices((track.get_tag('album'), track.get_path().parent) for track in track_list)
+
+    def plan_filenames(self, track_list: typ.List[Track],
+                       indices_by_directory: typ.Dict[Path, typ.List[int]]) -> RenamePlan:
+        plan = RenamePlan(self._get_rename_journal_path())
+        for directory, indices in indices_by_directory.items():
+            tracknumber_list = [track_list[index].get_tag('tracknumber') for index in indices]
 
             evey_tracknumber_unique = len(set(tracknumber_list)) == len(tracknumber_list)
             use_tracknumber_if_filenames = False
             if None not in tracknumber_list and evey_tracknumber_unique:
                 use_tracknumber_if_filenames = True
 
-            for track in track_list:
-                filepath = track.get_path()
-                title, tracknumber = track.get_tag('title'), track.get_tag('tracknumber')
-                desirable_filename = f'{tracknumber}. {title}' if use_tracknumber_if_filenames else f'{title}'
-
-                if filepath.stem is not desirable_filename:
-                    Track.rename(filepath, desirable_filename)
+            filename_pattern = '{tracknumber}. {title}' if use_tracknumber_if_filenames else '{title}'
+            directory_track_list = [track_list[index] for index in indices]
+            plan.add_directory(directory, {track.get_path(): track.format_filename(filename_pattern)
+                                           for track in directory_track_list})
+        return plan
 
-    def update(self, *, new_only: bool):
-        track_list = [Track(filepath) for filepath in self.find_tracks()]
-        if new_only and self.last_update_time is not None:
-            track_list = [track for track in track_list
-                          if track.get_mulima_upd_time() > self.last_update_time]
-
-        tracks_by_directory = self._get_tracks_by_directory(track_list)
-        tracks_by_album_and_directory = self._get_tracks_by_album_and_directory(track_list)
-
-        self.manage_album_tags(track_list)
-        self.manage_tracknumber_tags(tracks_by_album_and_directory)
-        self.manage_tracktotal_tags(tracks_by_album_and_directory)
-        self.manage_covers(tracks_by_directory)
-        self.manage_title_tags(track_list)
-
-        for track in track_list:
-            track.write()
+    def update_filenames(self, track_list: typ.List[Track],
+                         indices_by_directory: typ.Dict[Path, typ.List[int]]) -> typ.Dict[Path, Path]:
+        """
+        :return: new path for every renamed track
+        """
+        return self.plan_filenames(track_list, indices_by_directory).apply()
 
-        self.update_filenames({directory: [track.get_path() for track in track_list]
-                               for directory, track_list in tracks_by_directory.items()})
+    def _get_pictures_by_directory(self, window: typ.List[DirectoryEntries],
+                                   remembered_pictures_by_directory: typ.Dict[Path, typ.List[FileEntry]]
+                                   ) -> typ.Dict[Path, typ.List[FileEntry]]:
+        """
+        :param remembered_pictures_by_directory: pictures of archive root and of the first directory with pictures,
+        found by previous windows, it's filled by the first window
+        :return: pictures of window directories, of archive root and of the first directory with pictures
+        """
+        pictures_by_directory = dict(remembered_pictures_by_directory)
+        pictures_by_directory.update((directory_entries.path, directory_entries.pictures)
+                                     for directory_entries in window)
+        if self.path not in pictures_by_directory:
+            # root pictures are cover candidates for every directory, root is not scanned by update of directories
+            pictures_by_directory[self.path] = scan_directory(self.path).pictures
+        remembered_pictures_by_directory.setdefault(self.path, pictures_by_directory[self.path])
+
+        if not any(remembered_pictures_by_directory.values()):
+            for directory, pictures in pictures_by_directory.items():
+                if pictures:
+                    remembered_pictures_by_directory[directory] = pictures
+                    break
+        return pictures_by_directory
+
+    def _fix_tracks(self, metrics: UpdateMetrics, track_list: typ.List[Track], window: typ.List[DirectoryEntries],
+                    remembered_pictures_by_directory: typ.Dict[Path, typ.List[FileEntry]]
+                    ) -> typ.Dict[Path, typ.List[int]]:
+        pictures_by_directory = self._get_pictures_by_directory(window, remembered_pictures_by_directory)
+        with metrics.phase('tags'):
+            indices_by_directory = self._get_track_indices_by_directory(track_list)
+            indices_by_album_and_directory = self._get_track_indices_by_album_and_directory(track_list)
+
+            self.manage_album_tags(track_list)
+            self.manage_tracknumber_tags(track_list, indices_by_album_and_directory)
+            self.manage_tracktotal_tags(track_list, indices_by_album_and_directory)
+
+        with metrics.phase('covers'):
+            self.manage_covers(track_list, indices_by_directory, pictures_by_directory,
+                               on_done=lambda path: metrics.file_done('covers', path))
+
+        with metrics.phase('tags'):
+            self.manage_title_tags(track_list)
+
+        return indices_by_directory
+
+    def update(self, *, new_only: bool = True, profile: bool = False, trace_memory: bool = False,
+               directories: typ.Optional[typ.Iterable[Path]] = None,
+               checkpoint_size: typ.Optional[int] = None, window_size: typ.Optional[int] = None) -> UpdateReport:
+        directories = None if directories is None else list(directories)
+        with UpdateMetrics(self.callbacks, profile=profile, trace_memory=trace_memory) as metrics:
+            self._update(metrics, functools.partial(self._fix_tracks, remembered_pictures_by_directory=dict()),
+                         new_only=new_only, directories=directories,
+                         window_size=window_size, checkpoint_size=checkpoint_size)
+            return metrics.finish()
 
-        self.last_update_time = datetime.now()
@@ -0,0 +1,64 @@
+import re
+import bisect
+import typing as typ
+
+
+class ArtistMatcher:
+    """
+    finds any of artist names in tag values with a single compiled regex,
+    so matching doesn't depend on number of names. Compilation archives and long lists
+    of aliases (transliterations, old names of band) are matched in one pass
+    """
+    SEPARATOR = '\0'
+    names: typ.List[str]
+    case_sensitive: bool
+    whole_words: bool
+
+    def __init__(self, names: typ.Iterable[str], *, case_sensitive: bool = True, whole_words: bool = False):
+        """
+        :param case_sensitive: if False names and values are compared casefolded
+        :param whole_words: if True name matches only as separate words, for example 'A' matches 'A & B (feat C)',
+        but doesn't match 'AB'
+        """
+        self.names = list(names)
+        self.case_sensitive = case_sensitive
+        self.whole_words = whole_words
+
+        # longer names first, so the longest alternative wins
+        names = sorted({self._normalize(name) for name in self.names if name}, key=len, reverse=True)
+        if not names:
+            self.__pattern = None
+            return
+
+        alternatives = '|'.join(re.escape(name) for name in names)
+        if whole_words:
+            self.__pattern = re.compile(rf'(?<!\w)(?:{alternatives})(?!\w)')
+        else:
+            self.__pattern = re.compile(alternatives)
+
+    def _normalize(self, value: str) -> str:
+        return value if self.case_sensitive else value.casefold()
+
+    def matches(self, value: str) -> bool:
+        return self.__pattern is not None and self.__pattern.search(self._normalize(value)) is not None
+
+    def match_many(self, values: typ.Sequence[str]) -> typ.List[bool]:
+        """
+        matches all values in one pass over their concatenation, equal values are matched once
+        :return: True for every value, which contains any of names
+        """
+        if self.__pattern is None:
+            return [False] * len(values)
+
+        normalized_values = [self._normalize(value) for value in values]
+        unique_values = list(dict.fromkeys(normalized_values))
+        starts, offset = list(), 0
+        for value in unique_values:
+            starts.append(offset)
+            offset += len(value) + len(self.SEPARATOR)
+
+        matched_values = set()
+        for match in self.__pattern.finditer(self.SEPARATOR.join(unique_values)):
+            matched_values.add(unique_values[bisect.bisect_right(starts, match.start()) - 1])
+
+        return [value in matched_values for value in normalized_values]
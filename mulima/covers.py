@@ -0,0 +1,113 @@
+import hashlib
+import io
+import typing as typ
+from pathlib import Path
+
+from PIL import Image
+
+from mulima.index import StatSignature
+
+
+class Cover(typ.NamedTuple):
+    data: bytes
+    mimetype: str
+
+
+class CoverCache:
+    """
+    cache of pictures prepared for embedding into tracks.
+    Pictures are keyed by hash of source file content and target size, so
+    every distinct picture is decoded, downscaled and encoded only once.
+    Hash of source file is remembered with it's stat signature, so replaced picture is hashed again.
+    Prepared pictures are persisted in cache directory between runs.
+    """
+    HASH_CHUNK_SIZE = 1 << 20
+    JPEG_QUALITY = 90
+
+    def __init__(self, cache_dir: Path, max_size: typ.Tuple[int, int]):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+        self.__digest_by_path: typ.Dict[Path, typ.Tuple[StatSignature, str]] = dict()
+        self.__cover_by_digest: typ.Dict[str, Cover] = dict()
+
+    @classmethod
+    def _hash_file(cls, path: Path) -> str:
+        file_hash = hashlib.sha1()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(cls.HASH_CHUNK_SIZE), b''):
+                file_hash.update(chunk)
+        return file_hash.hexdigest()
+
+    def _get_cached_path(self, digest: str, extension: str) -> Path:
+        width, height = self.max_size
+        return self.cache_dir / f'{digest}_{width}x{height}.{extension}'
+
+    def _load_from_disk(self, digest: str) -> typ.Optional[Cover]:
+        for extension, mimetype in (('jpg', 'image/jpeg'), ('png', 'image/png')):
+            cached_path = self._get_cached_path(digest, extension)
+            if cached_path.exists():
+                return Cover(cached_path.read_bytes(), mimetype)
+        return None
+
+    def _prepare(self, picture_file: typ.Union[Path, typ.BinaryIO]) -> typ.Tuple[Cover, str]:
+        with Image.open(picture_file) as picture:
+            # decode JPEG in already reduced scale, when it's possible
+            picture.draft('RGB', self.max_size)
+            picture.thumbnail(self.max_size)
+
+            has_alpha = picture.mode in ('RGBA', 'LA', 'PA') or \
+                (picture.mode == 'P' and 'transparency' in picture.info)
+
+            encoded = io.BytesIO()
+            if has_alpha:
+                picture.save(encoded, format='PNG', optimize=True)
+                return Cover(encoded.getvalue(), 'image/png'), 'png'
+
+            picture.convert('RGB').save(encoded, format='JPEG', quality=self.JPEG_QUALITY, optimize=True)
+            return Cover(encoded.getvalue(), 'image/jpeg'), 'jpg'
+
+    def get(self, picture_path: Path, signature: typ.Optional[StatSignature] = None) -> Cover:
+        """
+        :param signature: stat signature of picture, if it's known, otherwise picture is stat
+        :return: encoded picture, which fits in max_size
+        """
+        if signature is None:
+            signature = StatSignature.from_path(picture_path)
+
+        signature_and_digest = self.__digest_by_path.get(picture_path)
+        if signature_and_digest is not None and signature_and_digest[0] == signature:
+            digest = signature_and_digest[1]
+        else:
+            digest = self._hash_file(picture_path)
+            self.__digest_by_path[picture_path] = (signature, digest)
+
+        return self._get_by_digest(digest, picture_path)
+
+    def get_from_data(self, data: bytes) -> Cover:
+        """
+        prepares picture, which is not a file (for example, fetched one)
+        :raise ValueError: if data is not a picture
+        :return: encoded picture, which fits in max_size
+        """
+        try:
+            return self._get_by_digest(hashlib.sha1(data).hexdigest(), io.BytesIO(data))
+        except (OSError, Image.DecompressionBombError) as error:
+            raise ValueError(f'picture could not be decoded: {error}') from error
+
+    def _get_by_digest(self, digest: str, picture_file: typ.Union[Path, typ.BinaryIO]) -> Cover:
+        cover = self.__cover_by_digest.get(digest)
+        if cover is None:
+            cover = self._load_from_disk(digest)
+
+            if cover is None:
+                cover, extension = self._prepare(picture_file)
+                cached_path = self._get_cached_path(digest, extension)
+                temp_path = cached_path.with_suffix('.tmp')
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                temp_path.write_bytes(cover.data)
+                temp_path.replace(cached_path)
+
+            self.__cover_by_digest[digest] = cover
+
+        return cover
@@ -0,0 +1,152 @@
+import os
+import threading
+import typing as typ
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Executor
+from pathlib import Path
+
+from mulima.track_processor import Track
+from mulima.index import StatSignature
+
+T = typ.TypeVar('T')
+
+
+def _write_track(track: Track) -> int:
+    return track.write()
+
+
+class UpdateExecutor:
+    """
+    runs per file work of archive updates.
+    I/O-bound work (stat, reading and saving of tracks) is done in a thread pool,
+    parsing could be moved to a process pool. Every file operation is bounded by
+    per device limit, so slow disks are not flooded with requests.
+    Results keep order of given files, so grouping of tracks is the same as in serial run.
+    With default arguments everything is done serially in the calling thread.
+    """
+    max_workers: int
+    max_workers_per_device: typ.Optional[int]
+    parse_in_processes: bool
+
+    def __init__(self, *, max_workers: int = 1, max_workers_per_device: typ.Optional[int] = None,
+                 parse_in_processes: bool = False):
+        """
+        :param max_workers: size of thread pool (and process pool, if it's used)
+        :param max_workers_per_device: max number of simultaneous operations on files of one device,
+        None means no limit except of max_workers
+        :param parse_in_processes: if True tracks will be parsed in process pool
+        """
+        if max_workers < 1:
+            raise ValueError('max_workers should be positive')
+        if max_workers_per_device is not None and max_workers_per_device < 1:
+            raise ValueError('max_workers_per_device should be positive')
+
+        self.max_workers = max_workers
+        self.max_workers_per_device = max_workers_per_device
+        self.parse_in_processes = parse_in_processes
+
+        self.__thread_pool: typ.Optional[Executor] = None
+        self.__process_pool: typ.Optional[Executor] = None
+        self.__device_semaphores: typ.Dict[int, threading.Semaphore] = dict()
+        self.__device_by_directory: typ.Dict[Path, int] = dict()
+        self.__lock = threading.Lock()
+
+    def _get_thread_pool(self) -> Executor:
+        with self.__lock:
+            if self.__thread_pool is None:
+                self.__thread_pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix='mulima')
+            return self.__thread_pool
+
+    def _get_process_pool(self) -> Executor:
+        with self.__lock:
+            if self.__process_pool is None:
+                self.__process_pool = ProcessPoolExecutor(self.max_workers)
+            return self.__process_pool
+
+    def _get_device_semaphore(self, path: Path) -> typ.Optional[threading.Semaphore]:
+        if self.max_workers_per_device is None:
+            return None
+
+        directory = path.parent
+        device = self.__device_by_directory.get(directory)
+        if device is None:
+            device = self.__device_by_directory[directory] = os.stat(directory).st_dev
+
+        with self.__lock:
+            if device not in self.__device_semaphores:
+                self.__device_semaphores[device] = threading.Semaphore(self.max_workers_per_device)
+            return self.__device_semaphores[device]
+
+    def _run_bounded(self, func: typ.Callable[[typ.Any], T], item, path: Path) -> T:
+        semaphore = self._get_device_semaphore(path)
+        if semaphore is None:
+            return func(item)
+
+        with semaphore:
+            return func(item)
+
+    def map(self, func: typ.Callable[[typ.Any], T], items: typ.Iterable,
+            *, path_of: typ.Callable[[typ.Any], Path] = lambda item: item,
+            on_done: typ.Optional[typ.Callable[[typ.Any], None]] = None) -> typ.List[T]:
+        """
+        applies func to every item in thread pool
+        :param path_of: function, that returns path of the file, which is touched by func(item)
+        :param on_done: is called in the calling thread for every processed item (in order of items),
+        if it raises, items, which processing has not started yet, are skipped
+        :return: results in order of items
+        """
+        items = list(items)
+        if self.max_workers == 1:
+            results = list()
+            for item in items:
+                results.append(func(item))
+                if on_done is not None:
+                    on_done(item)
+            return results
+
+        thread_pool = self._get_thread_pool()
+        futures = [thread_pool.submit(self._run_bounded, func, item, path_of(item)) for item in items]
+        try:
+            results = list()
+            for item, future in zip(items, futures):
+                results.append(future.result())
+                if on_done is not None:
+                    on_done(item)
+            return results
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _parse_track_in_process(self, filepath: Path) -> Track:
+        return self._get_process_pool().submit(Track, filepath).result()
+
+    def load_tracks(self, filepath_list: typ.Iterable[Path], *,
+                    on_done: typ.Optional[typ.Callable[[Path], None]] = None) -> typ.List[Track]:
+        if self.parse_in_processes:
+            return self.map(self._parse_track_in_process, filepath_list, on_done=on_done)
+        return self.map(Track, filepath_list, on_done=on_done)
+
+    def write_tracks(self, track_list: typ.Iterable[Track], *,
+                     on_done: typ.Optional[typ.Callable[[Track], None]] = None) -> typ.List[int]:
+        """
+        :return: number of written bytes for every track
+        """
+        return self.map(_write_track, track_list, path_of=Track.get_path, on_done=on_done)
+
+    def get_signatures(self, filepath_list: typ.Iterable[Path]) -> typ.List[StatSignature]:
+        return self.map(StatSignature.from_path, filepath_list)
+
+    def shutdown(self):
+        with self.__lock:
+            thread_pool, self.__thread_pool = self.__thread_pool, None
+            process_pool, self.__process_pool = self.__process_pool, None
+
+        if thread_pool is not None:
+            thread_pool.shutdown()
+        if process_pool is not None:
+            process_pool.shutdown()
+
+    def __enter__(self) -> 'UpdateExecutor':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
@@ -0,0 +1,448 @@
+import http.client
+import json
+import sqlite3
+import threading
+import time
+import typing as typ
+import urllib.parse
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+from mulima.track_processor import Track
+from mulima.covers import Cover, CoverCache
+
+COVER = 'cover'
+LYRICS = 'lyrics'
+
+
+class FetchError(Exception):
+    """
+    provider could not answer (server error, broken connection), the answer is not cached
+    """
+    pass
+
+
+class FetchQuery(typ.NamedTuple):
+    kind: str  # COVER or LYRICS
+    artist: str
+    album: typ.Optional[str] = None  # is set for covers, so one fetch serves every track of album
+    title: typ.Optional[str] = None  # is set for lyrics
+
+    @classmethod
+    def for_cover(cls, track: Track) -> typ.Optional['FetchQuery']:
+        artist, album = track.get_tag('artist'), track.get_tag('album')
+        return None if artist is None or album is None else cls(COVER, artist, album=album)
+
+    @classmethod
+    def for_lyrics(cls, track: Track) -> typ.Optional['FetchQuery']:
+        artist, title = track.get_tag('artist'), track.get_tag('title')
+        return None if artist is None or title is None else cls(LYRICS, artist, title=title)
+
+
+class FetchedItem(typ.NamedTuple):
+    data: bytes
+    mimetype: str
+
+
+class HttpResponse(typ.NamedTuple):
+    status: int
+    content_type: str
+    body: bytes
+
+
+class ConnectionPool:
+    """
+    keep-alive HTTP(S) connections, which are reused by requests to the same host.
+    Number of simultaneous connections to one host is bounded
+    """
+    max_per_host: int
+    timeout: float
+    connections_opened: int
+
+    USER_AGENT = 'mulima'
+
+    def __init__(self, *, max_per_host: int = 2, timeout: float = 10.0):
+        if max_per_host < 1:
+            raise ValueError('max_per_host should be positive')
+
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.connections_opened = 0
+
+        self.__idle_connections: typ.Dict[typ.Tuple[str, str], typ.List[http.client.HTTPConnection]] = dict()
+        self.__host_semaphores: typ.Dict[typ.Tuple[str, str], threading.Semaphore] = dict()
+        self.__lock = threading.Lock()
+
+    def _get_host_semaphore(self, host_key: typ.Tuple[str, str]) -> threading.Semaphore:
+        with self.__lock:
+            if host_key not in self.__host_semaphores:
+                self.__host_semaphores[host_key] = threading.Semaphore(self.max_per_host)
+            return self.__host_semaphores[host_key]
+
+    def _take_connection(self, host_key: typ.Tuple[str, str]) -> typ.Tuple[http.client.HTTPConnection, bool]:
+        """
+        :return: connection and True, if it was used before
+        """
+        with self.__lock:
+            idle_connections = self.__idle_connections.get(host_key)
+            if idle_connections:
+                return idle_connections.pop(), True
+            self.connections_opened += 1
+
+        scheme, netloc = host_key
+        connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        return connection_class(netloc, timeout=self.timeout), False
+
+    def _give_back_connection(self, host_key: typ.Tuple[str, str], connection: http.client.HTTPConnection):
+        with self.__lock:
+            self.__idle_connections.setdefault(host_key, list()).append(connection)
+
+    def request(self, url: str) -> HttpResponse:
+        """
+        makes GET request
+        :raise FetchError: if request failed
+        """
+        parsed_url = urllib.parse.urlsplit(url)
+        if parsed_url.scheme not in ('http', 'https'):
+            raise ValueError(f'unsupported url: {url}')
+
+        host_key = (parsed_url.scheme, parsed_url.netloc)
+        target = urllib.parse.urlunsplit(('', '', parsed_url.path or '/', parsed_url.query, ''))
+        headers = {'User-Agent': self.USER_AGENT, 'Connection': 'keep-alive'}
+
+        with self._get_host_semaphore(host_key):
+            while True:
+                connection, was_used = self._take_connection(host_key)
+                try:
+                    connection.request('GET', target, headers=headers)
+                    response = connection.getresponse()
+                    body = response.read()
+                except (http.client.HTTPException, OSError) as error:
+                    connection.close()
+                    if was_used:
+                        # server has closed idle connection, try again with a new one
+                        continue
+                    raise FetchError(f'request to {url} failed: {error}') from error
+
+                if response.will_close:
+                    connection.close()
+                else:
+                    self._give_back_connection(host_key, connection)
+
+                content_type = (response.getheader('Content-Type') or '').partition(';')[0].strip()
+                return HttpResponse(response.status, content_type, body)
+
+    def close(self):
+        with self.__lock:
+            idle_connections, self.__idle_connections = self.__idle_connections, dict()
+
+        for connections in idle_connections.values():
+            for connection in connections:
+                connection.close()
+
+
+class RateLimiter:
+    """
+    spaces requests to every host, so they are not sent more often than it's allowed
+    """
+    min_interval: float
+    intervals_by_host: typ.Dict[str, float]
+
+    def __init__(self, min_interval: float = 0.0, *, intervals_by_host: typ.Optional[typ.Dict[str, float]] = None,
+                 clock: typ.Callable[[], float] = time.monotonic, sleep: typ.Callable[[float], None] = time.sleep):
+        """
+        :param min_interval: min interval between requests to one host in seconds
+        :param intervals_by_host: intervals of hosts with their own limits
+        """
+        self.min_interval = min_interval
+        self.intervals_by_host = dict(intervals_by_host or dict())
+
+        self.__clock = clock
+        self.__sleep = sleep
+        self.__next_time_by_host: typ.Dict[str, float] = dict()
+        self.__lock = threading.Lock()
+
+    def wait(self, host: str):
+        """
+        blocks until request to host is allowed, reserves time for it
+        """
+        interval = self.intervals_by_host.get(host, self.min_interval)
+        with self.__lock:
+            now = self.__clock()
+            request_time = max(now, self.__next_time_by_host.get(host, now))
+            self.__next_time_by_host[host] = request_time + interval
+
+        if request_time > now:
+            self.__sleep(request_time - now)
+
+
+class FetchCache:
+    """
+    persistent cache of fetched items. Misses (nothing was found by every provider) are cached too,
+    they are kept for shorter time, so new releases are found later
+    """
+    FILENAME = 'fetch_cache.sqlite'
+    ttl: float
+    negative_ttl: float
+
+    def __init__(self, cache_dir: Path, *, ttl: float = 30 * 24 * 3600, negative_ttl: float = 24 * 3600,
+                 clock: typ.Callable[[], float] = time.time):
+        """
+        :param ttl: lifetime of found items in seconds
+        :param negative_ttl: lifetime of misses in seconds
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.__clock = clock
+
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        # cache is used by fetching threads
+        self.__connection = sqlite3.connect(str(cache_dir / self.FILENAME), check_same_thread=False)
+        self.__connection.execute(
+            'CREATE TABLE IF NOT EXISTS items ('
+            '    query TEXT PRIMARY KEY,'
+            '    data BLOB,'
+            '    mimetype TEXT,'
+            '    fetched_at REAL NOT NULL'
+            ')'
+        )
+        self.__connection.commit()
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def _key(query: FetchQuery) -> str:
+        return json.dumps(list(query), ensure_ascii=False)
+
+    def get(self, query: FetchQuery) -> typ.Tuple[bool, typ.Optional[FetchedItem]]:
+        """
+        :return: True, if the answer is cached and not expired, and cached item (None for cached miss)
+        """
+        with self.__lock:
+            row = self.__connection.execute(
+                'SELECT data, mimetype, fetched_at FROM items WHERE query = ?', (self._key(query),)
+            ).fetchone()
+        if row is None:
+            return False, None
+
+        data, mimetype, fetched_at = row
+        ttl = self.negative_ttl if data is None else self.ttl
+        if self.__clock() - fetched_at > ttl:
+            return False, None
+        return True, None if data is None else FetchedItem(data, mimetype)
+
+    def put(self, query: FetchQuery, item: typ.Optional[FetchedItem]):
+        data, mimetype = (None, None) if item is None else item
+        with self.__lock:
+            self.__connection.execute(
+                'INSERT OR REPLACE INTO items (query, data, mimetype, fetched_at) VALUES (?, ?, ?, ?)',
+                (self._key(query), data, mimetype, self.__clock())
+            )
+            self.__connection.commit()
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
+
+
+class Provider:
+    """
+    source of covers or lyrics: it knows, where item for query is, and how to get it from response.
+    Responses 404 and 410 mean, that provider has no item, other failures raise FetchError
+    """
+    NOT_FOUND_STATUSES = (404, 410)
+    name: str
+    kinds: typ.Tuple[str, ...]
+
+    def get_url(self, query: FetchQuery) -> typ.Optional[str]:
+        """
+        :return: url of item or None, if provider can't search such query
+        """
+        raise NotImplementedError
+
+    def parse_response(self, query: FetchQuery, response: HttpResponse) -> typ.Optional[FetchedItem]:
+        if response.status in self.NOT_FOUND_STATUSES:
+            return None
+        if response.status != 200:
+            raise FetchError(f'{self.name} answered {response.status}')
+        if not response.body:
+            return None
+        return FetchedItem(response.body, response.content_type)
+
+
+class UrlTemplateProvider(Provider):
+    """
+    provider, which serves items by urls like 'https://example.com/covers/{artist}/{album}',
+    fields of query are quoted
+    """
+    url_template: str
+
+    def __init__(self, name: str, kinds: typ.Iterable[str], url_template: str):
+        self.name = name
+        self.kinds = tuple(kinds)
+        self.url_template = url_template
+
+    def get_url(self, query: FetchQuery) -> typ.Optional[str]:
+        fields = {field: urllib.parse.quote(value, safe='') for field, value in query._asdict().items()
+                  if value is not None}
+        try:
+            return self.url_template.format(**fields)
+        except KeyError:
+            return None
+
+
+class Fetcher:
+    """
+    fetches covers and lyrics from providers (in order of their priority) concurrently.
+    Requests go through pooled keep-alive connections and per host rate limits.
+    Equal queries are coalesced: the item is fetched once, even if it's requested by many tracks
+    at the same time, and answers are kept in persistent cache
+    """
+    providers: typ.List[Provider]
+    max_concurrency: int
+
+    def __init__(self, providers: typ.Iterable[Provider], *, cache: typ.Optional[FetchCache] = None,
+                 pool: typ.Optional[ConnectionPool] = None, rate_limiter: typ.Optional[RateLimiter] = None,
+                 max_concurrency: int = 4):
+        """
+        :param cache: cache of answers, by default nothing is cached between runs
+        :param max_concurrency: number of simultaneously fetched queries
+        """
+        if max_concurrency < 1:
+            raise ValueError('max_concurrency should be positive')
+
+        self.providers = list(providers)
+        self.cache = cache
+        self.pool = ConnectionPool() if pool is None else pool
+        self.rate_limiter = RateLimiter() if rate_limiter is None else rate_limiter
+        self.max_concurrency = max_concurrency
+
+        self.__in_flight: typ.Dict[FetchQuery, Future] = dict()
+        self.__lock = threading.Lock()
+
+    def _fetch_from_providers(self, query: FetchQuery) -> typ.Optional[FetchedItem]:
+        """
+        :raise FetchError: if no provider has item and some of them failed
+        """
+        error = None
+        for provider in self.providers:
+            url = provider.get_url(query) if query.kind in provider.kinds else None
+            if url is None:
+                continue
+
+            try:
+                self.rate_limiter.wait(urllib.parse.urlsplit(url).netloc)
+                item = provider.parse_response(query, self.pool.request(url))
+            except FetchError as provider_error:
+                error = provider_error
+                continue
+
+            if item is not None:
+                return item
+
+        if error is not None:
+            raise error
+        return None
+
+    def fetch(self, query: FetchQuery) -> typ.Optional[FetchedItem]:
+        """
+        :return: item or None, if it was not found or fetching failed
+        """
+        if self.cache is not None:
+            is_cached, item = self.cache.get(query)
+            if is_cached:
+                return item
+
+        with self.__lock:
+            future = self.__in_flight.get(query)
+            is_owner = future is None
+            if is_owner:
+                future = self.__in_flight[query] = Future()
+
+        if not is_owner:
+            return future.result()
+
+        try:
+            try:
+                item = self._fetch_from_providers(query)
+            except FetchError:
+                # failure is not cached, so it will be fetched again next time
+                item = None
+            else:
+                if self.cache is not None:
+                    self.cache.put(query, item)
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(item)
+        finally:
+            with self.__lock:
+                del self.__in_flight[query]
+
+        return item
+
+    def fetch_many(self, queries: typ.Iterable[FetchQuery]) -> typ.Dict[FetchQuery, typ.Optional[FetchedItem]]:
+        queries = list(dict.fromkeys(queries))
+        if self.max_concurrency == 1 or len(queries) < 2:
+            return {query: self.fetch(query) for query in queries}
+
+        with ThreadPoolExecutor(min(self.max_concurrency, len(queries)), thread_name_prefix='mulima-fetch') as pool:
+            return dict(zip(queries, pool.map(self.fetch, queries)))
+
+    def fetch_covers(self, track_list: typ.List[Track], cover_cache: CoverCache, *, missing_only: bool = True) -> int:
+        """
+        sets fetched covers to tracks, one cover is fetched for every album
+        :param cover_cache: fetched pictures are downscaled and encoded by it, like pictures of archive
+        :param missing_only: if True only tracks without pictures get cover
+        :return: number of tracks, which got cover
+        """
+        queries = [FetchQuery.for_cover(track) for track in track_list]
+        if missing_only:
+            queries = [None if query is None or track.has_pics() else query
+                       for track, query in zip(track_list, queries)]
+
+        items = self.fetch_many(query for query in queries if query is not None)
+
+        covers: typ.Dict[FetchQuery, typ.Optional[Cover]] = dict()
+        for query, item in items.items():
+            try:
+                covers[query] = None if item is None else cover_cache.get_from_data(item.data)
+            except ValueError:
+                # provider has answered with something, which is not a picture
+                covers[query] = None
+
+        covered_count = 0
+        for track, query in zip(track_list, queries):
+            cover = None if query is None else covers[query]
+            if cover is not None:
+                track.set_cover(data=cover.data, mimetype=cover.mimetype)
+                covered_count += 1
+        return covered_count
+
+    def fetch_lyrics(self, track_list: typ.List[Track], *, missing_only: bool = True) -> int:
+        """
+        sets fetched lyrics to lyrics tag of tracks
+        :return: number of tracks, which got lyrics
+        """
+        queries = [None if missing_only and track.get_tag('lyrics') is not None else FetchQuery.for_lyrics(track)
+                   for track in track_list]
+        items = self.fetch_many(query for query in queries if query is not None)
+
+        lyrics_count = 0
+        for track, query in zip(track_list, queries):
+            item = None if query is None else items[query]
+            if item is not None:
+                track.set_tag('lyrics', item.data.decode('utf-8', errors='replace'))
+                lyrics_count += 1
+        return lyrics_count
+
+    def close(self):
+        self.pool.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    def __enter__(self) -> 'Fetcher':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
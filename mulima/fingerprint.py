@@ -0,0 +1,193 @@
+import hashlib
+import mmap
+import sqlite3
+import typing as typ
+from pathlib import Path
+
+from mulima.index import TrackIndex, StatSignature, iter_directory_rows
+from mulima.executor import UpdateExecutor
+from mulima.scanner import FileEntry
+from mulima.tag_regions import get_payload_range
+
+HASH_CHUNK_SIZE = 1024 * 1024
+DIGEST_SIZE = 20
+
+
+def _hash_file_region(path: Path, start: int, end: int, chunk_size: int) -> str:
+    payload_hash = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    if end <= start:
+        return payload_hash.hexdigest()
+
+    with open(path, 'rb') as file:
+        try:
+            mapped_file = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            mapped_file = None
+
+        if mapped_file is None:
+            # some filesystems (and empty files) can't be mapped
+            file.seek(start)
+            while start < end:
+                chunk = file.read(min(chunk_size, end - start))
+                if not chunk:
+                    break
+                payload_hash.update(chunk)
+                start += len(chunk)
+            return payload_hash.hexdigest()
+
+        with mapped_file:
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mapped_file.madvise(mmap.MADV_SEQUENTIAL)
+
+            view = memoryview(mapped_file)
+            try:
+                for offset in range(start, min(end, len(view)), chunk_size):
+                    payload_hash.update(view[offset:min(offset + chunk_size, end)])
+            finally:
+                view.release()
+
+    return payload_hash.hexdigest()
+
+
+def get_payload_digest(path: Path, *, chunk_size: int = HASH_CHUNK_SIZE) -> str:
+    """
+    digest of audio data, leading and trailing tags are skipped, so it doesn't change, when tags are changed
+    """
+    start, end = get_payload_range(path)
+    return _hash_file_region(path, start, end, chunk_size)
+
+
+class FingerprintIndex:
+    """
+    persistent digests of audio data of archive tracks, stored in archive root.
+    Every digest is kept together with stat signature of file, so it's recomputed only if file was changed
+    """
+    FILENAME = 'fingerprints.sqlite'
+
+    def __init__(self, archive_path: Path):
+        self.archive_path = archive_path
+
+        state_dir = archive_path / TrackIndex.STATE_DIRNAME
+        state_dir.mkdir(parents=True, exist_ok=True)
+
+        self.__connection = sqlite3.connect(str(state_dir / self.FILENAME), check_same_thread=False)
+        self.__connection.execute(
+            'CREATE TABLE IF NOT EXISTS fingerprints ('
+            '    path TEXT PRIMARY KEY,'
+            '    size INTEGER NOT NULL,'
+            '    mtime_ns INTEGER NOT NULL,'
+            '    inode INTEGER NOT NULL,'
+            '    digest TEXT NOT NULL'
+            ')'
+        )
+        self.__connection.execute('CREATE INDEX IF NOT EXISTS fingerprints_digest ON fingerprints (digest)')
+        self.__connection.commit()
+
+    def _key(self, path: Path) -> str:
+        return path.relative_to(self.archive_path).as_posix()
+
+    def get(self, path: Path) -> typ.Optional[typ.Tuple[StatSignature, str]]:
+        """
+        :return: signature of file, which digest was computed, and digest
+        """
+        row = self.__connection.execute(
+            'SELECT size, mtime_ns, inode, digest FROM fingerprints WHERE path = ?', (self._key(path),)
+        ).fetchone()
+        return None if row is None else (StatSignature(*row[:3]), row[3])
+
+    def get_digest(self, path: Path, signature: StatSignature) -> typ.Optional[str]:
+        """
+        :return: digest, if it was computed for file with the same signature
+        """
+        record = self.get(path)
+        if record is None or record[0] != signature:
+            return None
+        return record[1]
+
+    def put(self, path: Path, signature: StatSignature, digest: str):
+        self.__connection.execute(
+            'INSERT OR REPLACE INTO fingerprints (path, size, mtime_ns, inode, digest) VALUES (?, ?, ?, ?, ?)',
+            (self._key(path), *signature, digest)
+        )
+
+    def remove(self, path: Path):
+        self.__connection.execute('DELETE FROM fingerprints WHERE path = ?', (self._key(path),))
+
+    def carry(self, old_path: Path, new_path: Path, new_signature: StatSignature):
+        """
+        keeps digest of file, which tags were rewritten or which was renamed, audio data of it is the same
+        """
+        record = self.get(old_path)
+        if record is not None:
+            self.remove(old_path)
+            self.put(new_path, new_signature, record[1])
+
+    def update(self, track_entries: typ.List[FileEntry], executor: UpdateExecutor, *,
+               on_done: typ.Optional[typ.Callable[[Path], None]] = None) -> typ.Dict[Path, str]:
+        """
+        computes digests of new and changed tracks
+        :param on_done: is called for every hashed track, look at UpdateExecutor.map
+        :return: digest of every track
+        """
+        digests, entries_to_hash = dict(), list()
+        for track_entry in track_entries:
+            digest = self.get_digest(track_entry.path, StatSignature.from_stat(track_entry.stat))
+            if digest is None:
+                entries_to_hash.append(track_entry)
+            else:
+                digests[track_entry.path] = digest
+
+        computed_digests = executor.map(get_payload_digest, [track_entry.path for track_entry in entries_to_hash],
+                                        on_done=on_done)
+        for track_entry, digest in zip(entries_to_hash, computed_digests):
+            self.put(track_entry.path, StatSignature.from_stat(track_entry.stat), digest)
+            digests[track_entry.path] = digest
+
+        return digests
+
+    def retain(self, existing_paths: typ.Iterable[Path], *, directories: typ.Optional[typ.Iterable[Path]] = None):
+        """
+        look at TrackIndex.retain
+        """
+        existing_keys = {self._key(path) for path in existing_paths}
+        if directories is None:
+            rows = self.__connection.execute('SELECT path FROM fingerprints')
+        else:
+            rows = iter_directory_rows(self.__connection, 'SELECT path FROM fingerprints WHERE',
+                                       [self._key(directory) for directory in directories])
+
+        stale_keys = [(key,) for (key,) in rows if key not in existing_keys]
+        self.__connection.executemany('DELETE FROM fingerprints WHERE path = ?', stale_keys)
+
+    def retain_directories(self, directories: typ.Iterable[Path]):
+        """
+        look at TrackIndex.retain_directories
+        """
+        directory_keys = {self._key(directory) for directory in directories}
+        stale_keys = [(key,) for (key,) in self.__connection.execute('SELECT path FROM fingerprints')
+                      if (key.rpartition('/')[0] or '.') not in directory_keys]
+        self.__connection.executemany('DELETE FROM fingerprints WHERE path = ?', stale_keys)
+
+    def find(self, digest: str) -> typ.List[Path]:
+        return [self.archive_path / key for (key,) in self.__connection.execute(
+            'SELECT path FROM fingerprints WHERE digest = ? ORDER BY path', (digest,)
+        )]
+
+    def commit(self):
+        self.__connection.commit()
+
+    def close(self):
+        self.__connection.commit()
+        self.__connection.close()
+
+
+def group_duplicates(digests: typ.Dict[Path, str]) -> typ.Dict[str, typ.List[Path]]:
+    """
+    :param digests: digest of audio data of every track
+    :return: sorted paths of tracks with the same audio data by digest, if there are several of them
+    """
+    paths_by_digest = dict()
+    for path, digest in digests.items():
+        paths_by_digest.setdefault(digest, list()).append(path)
+
+    return {digest: sorted(paths) for digest, paths in paths_by_digest.items() if len(paths) > 1}
@@ -0,0 +1,33 @@
+import os
+import typing as typ
+from pathlib import Path
+
+from mulima.track_processor import Track
+from mulima.index import StatSignature
+from mulima.tag_regions import ID3V1_MAX_SIZE, get_id3v1_size, read_tail
+
+
+class StripResult(typ.NamedTuple):
+    path: Path
+    tag_size: int  # size of removed (or found in dry run) ID3v1 tag, 0 if there is no tag
+    old_signature: StatSignature
+    new_signature: StatSignature
+    # tags of truncated track, ID3v1 values fill missing ID3v2 frames on loading, so they could change
+    tags: typ.Optional[typ.Dict[str, typ.Optional[str]]] = None
+
+
+def strip_id3v1(path: Path, *, dry_run: bool = False) -> StripResult:
+    """
+    removes ID3v1 tag (with enhanced TAG+ tag) by truncation of file in place, audio data is not rewritten.
+    Only the tail of file is read
+    :param dry_run: if True file is not changed, only size of tag is found
+    """
+    with open(path, 'rb' if dry_run else 'r+b') as file:
+        old_signature = StatSignature.from_stat(os.fstat(file.fileno()))
+        tag_size = get_id3v1_size(read_tail(file, ID3V1_MAX_SIZE))
+        if not tag_size or dry_run:
+            return StripResult(path, tag_size, old_signature, old_signature)
+
+        file.truncate(old_signature.size - tag_size)
+
+    return StripResult(path, tag_size, old_signature, StatSignature.from_path(path), Track(path).get_tags())
@@ -0,0 +1,160 @@
+import json
+import os
+import sqlite3
+import typing as typ
+from pathlib import Path
+
+
+class StatSignature(typ.NamedTuple):
+    size: int
+    mtime_ns: int
+    inode: int
+
+    @classmethod
+    def from_stat(cls, stat_result: os.stat_result) -> 'StatSignature':
+        return cls(stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino)
+
+    @classmethod
+    def from_path(cls, path: Path) -> 'StatSignature':
+        return cls.from_stat(path.stat())
+
+
+def iter_directory_rows(connection: sqlite3.Connection, query: str,
+                        directory_keys: typ.Iterable[str]) -> typ.Iterator[typ.Tuple]:
+    """
+    yields rows of records of given directories (without subdirectories), only key ranges of them are read
+    :param query: selects rows, which first column is the path key, and ends with the WHERE condition on it
+    """
+    for directory_key in directory_keys:
+        if directory_key == '.':
+            rows = connection.execute(f"{query} instr(path, '/') = 0")
+            prefix = ''
+        else:
+            # keys of directory are between 'directory/' and 'directory0', because '0' follows '/'
+            prefix = f'{directory_key}/'
+            rows = connection.execute(f'{query} path >= ? AND path < ?', (prefix, f'{directory_key}0'))
+        for row in rows:
+            if '/' not in row[0][len(prefix):]:
+                yield row
+
+
+class TrackIndex:
+    """
+    persistent index of archive tracks, stored in archive root.
+    Every track is keyed by it's path (relative to archive root) and remembers
+    stat signature and normalized tags, it had after the last update
+    """
+    STATE_DIRNAME = '.mulima'
+    FILENAME_PATTERN = '{name}.index.sqlite'
+
+    def __init__(self, archive_path: Path, name: str):
+        """
+        :param archive_path: root of the archive
+        :param name: index name, different kinds of archives over the same tree should use different names
+        """
+        self.archive_path = archive_path
+
+        state_dir = archive_path / self.STATE_DIRNAME
+        state_dir.mkdir(parents=True, exist_ok=True)
+
+        # index may be used from a watcher thread, but never concurrently
+        self.__connection = sqlite3.connect(str(state_dir / self.FILENAME_PATTERN.format(name=name)),
+                                            check_same_thread=False)
+        self.__connection.execute(
+            'CREATE TABLE IF NOT EXISTS tracks ('
+            '    path TEXT PRIMARY KEY,'
+            '    size INTEGER NOT NULL,'
+            '    mtime_ns INTEGER NOT NULL,'
+            '    inode INTEGER NOT NULL,'
+            '    tags TEXT NOT NULL'
+            ')'
+        )
+        self.__connection.commit()
+
+    def _key(self, path: Path) -> str:
+        return path.relative_to(self.archive_path).as_posix()
+
+    def get_signature(self, path: Path) -> typ.Optional[StatSignature]:
+        row = self.__connection.execute(
+            'SELECT size, mtime_ns, inode FROM tracks WHERE path = ?', (self._key(path),)
+        ).fetchone()
+        return None if row is None else StatSignature(*row)
+
+    def get_tags(self, path: Path) -> typ.Optional[typ.Dict[str, typ.Optional[str]]]:
+        row = self.__connection.execute(
+            'SELECT tags FROM tracks WHERE path = ?', (self._key(path),)
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def is_actual(self, path: Path, signature: StatSignature) -> bool:
+        return self.get_signature(path) == signature
+
+    def put(self, path: Path, signature: StatSignature, tags: typ.Dict[str, typ.Optional[str]]):
+        self.__connection.execute(
+            'INSERT OR REPLACE INTO tracks (path, size, mtime_ns, inode, tags) VALUES (?, ?, ?, ?, ?)',
+            (self._key(path), *signature, json.dumps(tags, sort_keys=True))
+        )
+
+    def remove(self, path: Path):
+        self.__connection.execute('DELETE FROM tracks WHERE path = ?', (self._key(path),))
+
+    def paths(self) -> typ.Iterator[Path]:
+        for (key,) in self.__connection.execute('SELECT path FROM tracks'):
+            yield self.archive_path / key
+
+    def directories(self) -> typ.Set[Path]:
+        """
+        :return: directories, which contain indexed tracks
+        """
+        return {self.archive_path / (key.rpartition('/')[0] or '.')
+                for (key,) in self.__connection.execute('SELECT path FROM tracks')}
+
+    def signatures(self) -> typ.Iterator[typ.Tuple[Path, StatSignature]]:
+        for key, size, mtime_ns, inode in self.__connection.execute('SELECT path, size, mtime_ns, inode FROM tracks'):
+            yield self.archive_path / key, StatSignature(size, mtime_ns, inode)
+
+    def records(self, directories: typ.Optional[typ.Iterable[Path]] = None
+                ) -> typ.Iterator[typ.Tuple[Path, StatSignature, typ.Dict[str, typ.Optional[str]]]]:
+        """
+        yields path, stat signature and tags of every track in one query
+        :param directories: if not None, only tracks of these directories (without subdirectories) are yielded
+        """
+        if directories is None:
+            rows = self.__connection.execute('SELECT path, size, mtime_ns, inode, tags FROM tracks ORDER BY path')
+        else:
+            rows = iter_directory_rows(self.__connection, 'SELECT path, size, mtime_ns, inode, tags FROM tracks WHERE',
+                                       [self._key(directory) for directory in directories])
+        for key, size, mtime_ns, inode, tags in rows:
+            yield self.archive_path / key, StatSignature(size, mtime_ns, inode), json.loads(tags)
+
+    def retain(self, existing_paths: typ.Iterable[Path], *, directories: typ.Optional[typ.Iterable[Path]] = None):
+        """
+        removes records of tracks, which are not in existing_paths anymore
+        :param directories: if not None, only records of tracks from these directories (without subdirectories)
+        are considered
+        """
+        existing_keys = {self._key(path) for path in existing_paths}
+        if directories is None:
+            rows = self.__connection.execute('SELECT path FROM tracks')
+        else:
+            rows = iter_directory_rows(self.__connection, 'SELECT path FROM tracks WHERE',
+                                       [self._key(directory) for directory in directories])
+
+        stale_keys = [(key,) for (key,) in rows if key not in existing_keys]
+        self.__connection.executemany('DELETE FROM tracks WHERE path = ?', stale_keys)
+
+    def retain_directories(self, directories: typ.Iterable[Path]):
+        """
+        removes records of tracks, which are not in given directories (without subdirectories)
+        """
+        directory_keys = {self._key(directory) for directory in directories}
+        stale_keys = [(key,) for (key,) in self.__connection.execute('SELECT path FROM tracks')
+                      if (key.rpartition('/')[0] or '.') not in directory_keys]
+        self.__connection.executemany('DELETE FROM tracks WHERE path = ?', stale_keys)
+
+    def commit(self):
+        self.__connection.commit()
+
+    def close(self):
+        self.__connection.commit()
+        self.__connection.close()
@@ -0,0 +1,115 @@
+import json
+import os
+import typing as typ
+from pathlib import Path
+
+from mulima.renamer import RenameOperation
+
+
+class UpdateJournal:
+    """
+    write-ahead journal of archive update. Changes are applied by batches of directories:
+    planned tag writes, cover embeds and renames of batch are written to journal before they are applied,
+    and checkpoint is written after batch is registered in index. If update is interrupted,
+    the next update with the same arguments skips directories of checkpointed batches.
+    Temporary copies of tracks, which could be left by interrupted batch, are removed by the next update.
+    Journal is removed, when update is finished
+    """
+    journal_path: Path
+    archive_path: Path
+
+    def __init__(self, journal_path: Path, archive_path: Path):
+        self.journal_path = journal_path
+        self.archive_path = archive_path
+
+    def _key(self, path: Path) -> str:
+        return path.relative_to(self.archive_path).as_posix()
+
+    def _append(self, record: dict):
+        with open(self.journal_path, 'a') as journal:
+            journal.write(json.dumps(record, ensure_ascii=False) + '\n')
+            journal.flush()
+            os.fsync(journal.fileno())
+
+    def _read_records(self) -> typ.Iterator[dict]:
+        with open(self.journal_path) as journal:
+            for line in journal:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    return  # the last record was not completely written
+
+    def start(self, arguments: dict) -> typ.Set[Path]:
+        """
+        starts journal of update or continues journal of interrupted update with the same arguments
+        :param arguments: arguments of update, which are serializable to JSON
+        :return: directories, which were finished by interrupted update
+        """
+        finished_directories = set()
+        if self.journal_path.exists():
+            self._remove_temp_files(self.get_pending_batch())
+
+            records = self._read_records()
+            if next(records, None) == {'update': arguments}:
+                for record in records:
+                    if 'checkpoint' in record:
+                        finished_directories.update(self.archive_path / key for key in record['checkpoint'])
+
+        # journal is compacted (journal of update with other arguments is dropped),
+        # so incompletely written record is not continued by new ones
+        self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.journal_path.with_name(self.journal_path.name + '.tmp')
+        with open(temp_path, 'w') as journal:
+            journal.write(json.dumps({'update': arguments}, ensure_ascii=False) + '\n')
+            if finished_directories:
+                journal.write(json.dumps({'checkpoint': sorted(self._key(directory)
+                                                               for directory in finished_directories)},
+                                         ensure_ascii=False) + '\n')
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.replace(temp_path, self.journal_path)
+        return finished_directories
+
+    def _remove_temp_files(self, batch: typ.Optional[dict]):
+        for key in [] if batch is None else batch.get('temps', []):
+            temp_path = self.archive_path / key
+            if temp_path.exists():
+                temp_path.unlink()
+
+    def plan_batch(self, directories: typ.Iterable[Path], *, writes: typ.Iterable[Path],
+                   covers: typ.Iterable[Path], renames: typ.Iterable[RenameOperation],
+                   temps: typ.Iterable[Path] = ()):
+        """
+        :param writes: tracks, which tags will be written
+        :param covers: tracks, which cover will be embedded
+        :param temps: temporary files, which could be left, if batch is interrupted
+        """
+        self._append({
+            'batch': [self._key(directory) for directory in directories],
+            'writes': [self._key(path) for path in writes],
+            'covers': [self._key(path) for path in covers],
+            'renames': [[self._key(operation.source), self._key(operation.target)] for operation in renames],
+            'temps': [self._key(path) for path in temps],
+        })
+
+    def checkpoint(self, directories: typ.Iterable[Path]):
+        self._append({'checkpoint': [self._key(directory) for directory in directories]})
+
+    def get_pending_batch(self) -> typ.Optional[dict]:
+        """
+        :return: planned batch, which was not checkpointed, with paths relative to archive root
+        """
+        if not self.journal_path.exists():
+            return None
+
+        pending_batch = None
+        for record in self._read_records():
+            if 'batch' in record:
+                pending_batch = record
+            elif 'checkpoint' in record:
+                pending_batch = None
+        return pending_batch
+
+    def finish(self):
+        if self.journal_path.exists():
+            self.journal_path.unlink()
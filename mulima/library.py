@@ -0,0 +1,123 @@
+import typing as typ
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from mulima.archive import ABCArchive, ArtistArchive, AlbumArchive
+from mulima.executor import UpdateExecutor
+from mulima.tree_cache import TreeCache
+from mulima.metrics import UpdateCallbacks, UpdateReport
+from mulima.fingerprint import group_duplicates
+
+
+class Library:
+    """
+    set of archives, which are updated together.
+    Archives, which trees overlap (one is nested in other), are updated one after another with shared TreeCache,
+    so their directories are walked once and every track is loaded once. Independent trees are updated
+    concurrently. Per file work of all archives goes through one shared executor with it's per device limits
+    """
+    archives: typ.List[ABCArchive]
+    executor: UpdateExecutor
+    max_concurrent_trees: int
+
+    def __init__(self, *, executor: typ.Optional[UpdateExecutor] = None, max_concurrent_trees: int = 1,
+                 callbacks: typ.Iterable[UpdateCallbacks] = ()):
+        """
+        :param executor: executor, shared by all archives, by default everything is done serially
+        :param max_concurrent_trees: number of independent trees, which are updated simultaneously
+        :param callbacks: observers of update phases and counters, which are added to every archive
+        """
+        if max_concurrent_trees < 1:
+            raise ValueError('max_concurrent_trees should be positive')
+
+        self.archives = list()
+        self.executor = UpdateExecutor() if executor is None else executor
+        self.max_concurrent_trees = max_concurrent_trees
+        self.callbacks = list(callbacks)
+
+    def add(self, archive: ABCArchive) -> ABCArchive:
+        """
+        registers archive, it will use executor of library
+        :return: given archive or already registered archive of the same kind and path
+        """
+        for registered_archive in self.archives:
+            if type(registered_archive) is type(archive) and \
+                    registered_archive.path.resolve() == archive.path.resolve():
+                return registered_archive
+
+        archive.executor = self.executor
+        archive.callbacks.extend(callback for callback in self.callbacks if callback not in archive.callbacks)
+        self.archives.append(archive)
+        return archive
+
+    def add_artist_archive(self, path: str, ordered_possible_artist_names: typ.List[str], *,
+                           case_sensitive: bool = True, whole_words: bool = False,
+                           fingerprint_tracks: bool = False) -> ABCArchive:
+        return self.add(ArtistArchive(path, ordered_possible_artist_names, case_sensitive=case_sensitive,
+                                      whole_words=whole_words, executor=self.executor,
+                                      fingerprint_tracks=fingerprint_tracks))
+
+    def add_album_archive(self, path: str, album_name: str, *, fingerprint_tracks: bool = False) -> ABCArchive:
+        return self.add(AlbumArchive(path, album_name, executor=self.executor, fingerprint_tracks=fingerprint_tracks))
+
+    def get_trees(self) -> typ.Dict[Path, typ.List[ABCArchive]]:
+        """
+        :return: archives of every independent tree by tree root, outer archives go before nested ones
+        """
+        trees = dict()
+        for archive in sorted(self.archives, key=lambda archive: len(archive.path.parts)):
+            root = next((root for root in trees if root == archive.path or root in archive.path.parents),
+                        archive.path)
+            trees.setdefault(root, list()).append(archive)
+        return trees
+
+    def _update_tree(self, root: Path, archive_list: typ.List[ABCArchive], *, new_only: bool
+                     ) -> typ.List[typ.Tuple[ABCArchive, UpdateReport]]:
+        tree_cache = TreeCache(root, self.executor)
+        reports = list()
+        for archive in archive_list:
+            archive.tree_cache = tree_cache
+            try:
+                reports.append((archive, archive.update(new_only=new_only)))
+            finally:
+                archive.tree_cache = None
+        return reports
+
+    def update(self, *, new_only: bool = True) -> typ.List[typ.Tuple[ABCArchive, UpdateReport]]:
+        """
+        updates every archive, look at ABCArchive.update
+        :return: every archive with report of it's update
+        """
+        trees = self.get_trees()
+        if self.max_concurrent_trees == 1:
+            tree_reports = [self._update_tree(root, archive_list, new_only=new_only)
+                            for root, archive_list in trees.items()]
+        else:
+            with ThreadPoolExecutor(self.max_concurrent_trees, thread_name_prefix='mulima-tree') as tree_pool:
+                futures = [tree_pool.submit(self._update_tree, root, archive_list, new_only=new_only)
+                           for root, archive_list in trees.items()]
+                tree_reports = [future.result() for future in futures]
+
+        return [archive_report for reports in tree_reports for archive_report in reports]
+
+    def find_duplicates(self) -> typ.Dict[str, typ.List[Path]]:
+        """
+        :return: paths of tracks with the same audio data by digest of it, tracks of all archives are compared
+        """
+        digests = dict()
+        for archive in self.archives:
+            for path, digest in archive.get_fingerprints().items():
+                # nested archives share tracks
+                digests.setdefault(path.resolve(), digest)
+        return group_duplicates(digests)
+
+    def close(self):
+        for archive in self.archives:
+            archive.close()
+        self.executor.shutdown()
+
+    def __enter__(self) -> 'Library':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
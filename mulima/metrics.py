@@ -0,0 +1,161 @@
+import cProfile
+import pstats
+import time
+import tracemalloc
+import typing as typ
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+
+class UpdateCancelled(Exception):
+    """
+    is raised by callbacks to stop update between files
+    """
+
+
+class UpdateCallbacks:
+    """
+    base class for observers of archive updates, override the methods you need
+    """
+    def on_phase_start(self, phase: str):
+        pass
+
+    def on_file_done(self, phase: str, path: Path):
+        pass
+
+    def on_phase_end(self, phase: str, duration: float):
+        pass
+
+    def on_count(self, counter: str, amount: int):
+        pass
+
+
+class UpdateReport:
+    """
+    result of archive update
+    """
+    COUNTERS = [
+        'files_found',  # tracks, found in archive
+        'files_opened',  # tracks, which tags were read
+        'files_parsed',  # tracks, which were parsed completely by mutagen (for writing or pictures)
+        'files_saved',
+        'files_renamed',
+        'files_moved',  # tracks, which were moved or renamed outside of mulima, their index records are kept
+        'bytes_read',
+        'bytes_written',
+    ]
+
+    phase_durations: typ.Dict[str, float]
+    counters: typ.Dict[str, int]
+    total_duration: float
+    profile: typ.Optional[pstats.Stats]
+    memory_snapshot: typ.Optional[tracemalloc.Snapshot]
+
+    def __init__(self, phase_durations: typ.Dict[str, float], counters: typ.Dict[str, int], total_duration: float,
+                 profile: typ.Optional[pstats.Stats] = None,
+                 memory_snapshot: typ.Optional[tracemalloc.Snapshot] = None):
+        self.phase_durations = phase_durations
+        self.counters = {counter: counters.get(counter, 0) for counter in self.COUNTERS}
+        self.counters.update(counters)
+        self.total_duration = total_duration
+        self.profile = profile
+        self.memory_snapshot = memory_snapshot
+
+    def to_dict(self) -> dict:
+        return {
+            'total_duration': self.total_duration,
+            'phase_durations': dict(self.phase_durations),
+            'counters': dict(self.counters),
+        }
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.to_dict()})'
+
+
+class UpdateMetrics:
+    """
+    collects durations of update phases and counters of file operations,
+    optionally profiles update with cProfile and traces memory allocations with tracemalloc.
+    It's a context manager, so profiling and tracing are stopped, even if update fails:
+
+        with UpdateMetrics(callbacks, profile=True) as metrics:
+            ...
+            return metrics.finish()
+    """
+    def __init__(self, callbacks: typ.Iterable[UpdateCallbacks] = (), *,
+                 profile: bool = False, trace_memory: bool = False):
+        self.callbacks = list(callbacks)
+        self.profile = profile
+        self.trace_memory = trace_memory
+
+        self.__phase_durations: typ.Dict[str, float] = dict()
+        self.__counters: typ.Counter[str] = Counter()
+        self.__profiler: typ.Optional[cProfile.Profile] = None
+        self.__started_tracemalloc = False
+        self.__start_time: typ.Optional[float] = None
+
+    def start(self):
+        self.__start_time = time.perf_counter()
+
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.__started_tracemalloc = True
+
+        if self.profile:
+            self.__profiler = cProfile.Profile()
+            self.__profiler.enable()
+
+    def stop(self):
+        """
+        stops profiling and memory tracing, it could be called several times
+        """
+        if self.__profiler is not None:
+            self.__profiler.disable()
+
+        if self.__started_tracemalloc:
+            tracemalloc.stop()
+            self.__started_tracemalloc = False
+
+    def finish(self) -> UpdateReport:
+        total_duration = time.perf_counter() - self.__start_time
+
+        memory_snapshot = None
+        if self.trace_memory and tracemalloc.is_tracing():
+            memory_snapshot = tracemalloc.take_snapshot()
+        self.stop()
+
+        profile = None if self.__profiler is None else pstats.Stats(self.__profiler)
+        return UpdateReport(self.__phase_durations, self.__counters, total_duration, profile, memory_snapshot)
+
+    def __enter__(self) -> 'UpdateMetrics':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @contextmanager
+    def phase(self, name: str):
+        for callback in self.callbacks:
+            callback.on_phase_start(name)
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self.__phase_durations[name] = self.__phase_durations.get(name, 0.0) + duration
+
+            for callback in self.callbacks:
+                callback.on_phase_end(name, duration)
+
+    def file_done(self, phase: str, path: Path):
+        for callback in self.callbacks:
+            callback.on_file_done(phase, path)
+
+    def count(self, counter: str, amount: int = 1):
+        self.__counters[counter] += amount
+
+        for callback in self.callbacks:
+            callback.on_count(counter, amount)
@@ -0,0 +1,197 @@
+import errno
+import json
+import logging
+import os
+import typing as typ
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+NAME_MAX = 255  # maximal length of filename in bytes on common filesystems
+
+
+def fit_filename(filename: str, suffix: str) -> str:
+    """
+    :return: filename (without suffix), cut so that together with suffix it fits into NAME_MAX bytes
+    """
+    filename = filename[:NAME_MAX]
+    while len(os.fsencode(filename + suffix)) > NAME_MAX:
+        filename = filename[:-1]
+    return filename
+
+
+class RenameOperation(typ.NamedTuple):
+    source: Path
+    target: Path
+    # intermediate name, used when source name is a target of some rename of the plan (or differs from it in case)
+    temp: typ.Optional[Path] = None
+
+
+class RenamePlan:
+    """
+    renames of archive files, planned per directory and applied in one batch.
+    Before applying, the plan is written to journal, and the progress is appended to it,
+    so renames interrupted by crash could be resumed or rolled back by the next run.
+    """
+    TEMP_FILENAME_PREFIX = '.mulima-rename-'
+    # errors of renames, which could not succeed on the next run too
+    PERMANENT_ERRNOS = {errno.ENAMETOOLONG, errno.EINVAL, errno.EILSEQ}
+
+    journal_path: Path
+    operations: typ.List[RenameOperation]
+
+    def __init__(self, journal_path: Path):
+        self.journal_path = journal_path
+        self.operations = list()
+
+        self.__moved_to_temp = False
+        self.__done_indexes: typ.Set[int] = set()
+
+    @staticmethod
+    def _unique_filename(filename: str, suffix: str, taken_names: typ.Set[str]) -> str:
+        candidate, number = fit_filename(filename, suffix) + suffix, 1
+        while candidate.casefold() in taken_names:
+            number += 1
+            postfix = f' ({number}){suffix}'
+            candidate = fit_filename(filename, postfix) + postfix
+        return candidate
+
+    def add_directory(self, directory: Path, desirable_filenames: typ.Dict[Path, str]):
+        """
+        plans renames of files of one directory, colliding filenames get ' (2)', ' (3)', ... postfixes
+        :param desirable_filenames: new filename (without suffix) for files of directory
+        """
+        # names are compared casefolded, because filesystem could be case insensitive
+        movable_names = {path.name.casefold() for path, filename in desirable_filenames.items()
+                         if path.stem != filename}
+        taken_names = {name.casefold() for name in os.listdir(directory)} - movable_names
+
+        directory_renames = list()
+        for source, filename in desirable_filenames.items():
+            if source.stem != filename:
+                target_name = self._unique_filename(filename, source.suffix, taken_names)
+                taken_names.add(target_name.casefold())
+                directory_renames.append((source, directory / target_name))
+
+        target_names = {target.name.casefold() for _, target in directory_renames}
+        for source, target in directory_renames:
+            if source.name == target.name:
+                continue
+
+            temp = None
+            if source.name.casefold() in target_names:
+                temp = directory / f'{self.TEMP_FILENAME_PREFIX}{len(self.operations)}{source.suffix}'
+            self.operations.append(RenameOperation(source, target, temp))
+
+    def _write_journal(self):
+        self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.journal_path, 'w') as journal:
+            for operation in self.operations:
+                journal.write(json.dumps({
+                    'source': str(operation.source),
+                    'target': str(operation.target),
+                    'temp': None if operation.temp is None else str(operation.temp),
+                }) + '\n')
+            journal.flush()
+            os.fsync(journal.fileno())
+
+    def _append_to_journal(self, record: dict):
+        with open(self.journal_path, 'a') as journal:
+            journal.write(json.dumps(record) + '\n')
+
+    @classmethod
+    def load(cls, journal_path: Path) -> typ.Optional['RenamePlan']:
+        """
+        :return: plan of interrupted run or None, if there is no journal
+        """
+        if not journal_path.exists():
+            return None
+
+        plan = cls(journal_path)
+        with open(journal_path) as journal:
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # the last record was not completely written
+
+                if 'done' in record:
+                    plan.__done_indexes.add(record['done'])
+                elif 'moved_to_temp' in record:
+                    plan.__moved_to_temp = True
+                else:
+                    plan.operations.append(RenameOperation(
+                        Path(record['source']),
+                        Path(record['target']),
+                        None if record['temp'] is None else Path(record['temp'])
+                    ))
+        return plan
+
+    def apply(self) -> typ.Dict[Path, Path]:
+        """
+        :return: new path for every renamed file, it's empty if the plan was rolled back, look at resume
+        """
+        if not self.operations:
+            return dict()
+
+        self._write_journal()
+        if not self.resume():
+            return dict()
+        return {operation.source: operation.target for operation in self.operations}
+
+    def _is_done(self, index: int) -> bool:
+        if index in self.__done_indexes:
+            return True
+
+        # crash could happen between rename and writing of it to journal
+        operation = self.operations[index]
+        current = operation.source if operation.temp is None else operation.temp
+        return self.__moved_to_temp and not current.exists() and operation.target.exists()
+
+    def resume(self) -> bool:
+        """
+        finishes planned renames, skips the already done ones
+        :return: False, if some rename is impossible (for example, name is too long for filesystem),
+        the whole plan is rolled back then, so the next run isn't stopped by the same rename
+        """
+        if not self.__moved_to_temp:
+            # free names of sources, which are targets of other renames
+            for operation in self.operations:
+                if operation.temp is not None and operation.source.exists():
+                    os.rename(operation.source, operation.temp)
+
+            self.__moved_to_temp = True
+            self._append_to_journal({'moved_to_temp': True})
+
+        for index, operation in enumerate(self.operations):
+            if not self._is_done(index):
+                try:
+                    os.rename(operation.source if operation.temp is None else operation.temp, operation.target)
+                except OSError as error:
+                    if error.errno not in self.PERMANENT_ERRNOS:
+                        raise
+                    logger.error("rename of '%s' to '%s' is impossible (%s), renames are rolled back",
+                                 operation.source, operation.target, error.strerror)
+                    self.rollback()
+                    return False
+
+                self.__done_indexes.add(index)
+                self._append_to_journal({'done': index})
+
+        self.journal_path.unlink()
+        return True
+
+    def rollback(self):
+        """
+        returns renamed files to their original names
+        """
+        for index in reversed(range(len(self.operations))):
+            if self._is_done(index):
+                operation = self.operations[index]
+                os.rename(operation.target, operation.source if operation.temp is None else operation.temp)
+
+        for operation in self.operations:
+            if operation.temp is not None and operation.temp.exists():
+                os.rename(operation.temp, operation.source)
+
+        self.journal_path.unlink()
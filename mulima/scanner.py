@@ -0,0 +1,66 @@
+import os
+import mimetypes
+import typing as typ
+from pathlib import Path
+
+from mulima.track_processor import Track
+
+
+class FileEntry(typ.NamedTuple):
+    path: Path
+    stat: os.stat_result
+
+
+class DirectoryEntries(typ.NamedTuple):
+    path: Path
+    tracks: typ.List[FileEntry]
+    pictures: typ.List[FileEntry]
+
+
+def is_picture(path: Path) -> bool:
+    mimetype, _ = mimetypes.guess_type(path.name)
+    return mimetype in Track.AVAILABLE_PICS_MIMETYPES
+
+
+def _scan_directory(directory: Path, skip_dirnames: typ.Collection[str]
+                    ) -> typ.Tuple[DirectoryEntries, typ.List[Path]]:
+    with os.scandir(directory) as dir_entries:
+        dir_entries = sorted(dir_entries, key=lambda entry: entry.name)
+
+    tracks, pictures, subdirectories = list(), list(), list()
+    for dir_entry in dir_entries:
+        if dir_entry.is_dir(follow_symlinks=False):
+            if dir_entry.name not in skip_dirnames:
+                subdirectories.append(Path(dir_entry.path))
+            continue
+
+        path = Path(dir_entry.path)
+        if Track.could_created_from(path):
+            tracks.append(FileEntry(path, dir_entry.stat()))
+        elif is_picture(path):
+            pictures.append(FileEntry(path, dir_entry.stat()))
+
+    return DirectoryEntries(directory, tracks, pictures), subdirectories
+
+
+def scan_directory(directory: Path) -> DirectoryEntries:
+    """
+    scans only given directory, without subdirectories
+    """
+    directory_entries, _ = _scan_directory(directory, ())
+    return directory_entries
+
+
+def scan_directories(root: Path, *, skip_dirnames: typ.Collection[str] = ()) -> typ.Iterator[DirectoryEntries]:
+    """
+    lazily walks the tree (top-down, entries are sorted by name) with a single os.scandir call per directory
+    and yields tracks and pictures of every directory together with their stat results,
+    so later stages don't need to touch the filesystem again
+    :param skip_dirnames: names of directories, which should not be walked into
+    """
+    pending_directories = [root]
+    while pending_directories:
+        directory_entries, subdirectories = _scan_directory(pending_directories.pop(), skip_dirnames)
+        yield directory_entries
+
+        pending_directories.extend(reversed(subdirectories))
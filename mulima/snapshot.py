@@ -0,0 +1,155 @@
+import bz2
+import gzip
+import hashlib
+import json
+import lzma
+import typing as typ
+from pathlib import Path
+
+from mulima.track_processor import Track
+from mulima.index import StatSignature
+from mulima.scanner import FileEntry
+
+FORMAT_NAME = 'mulima-snapshot'
+FORMAT_VERSION = 1
+COVER_DIGEST_SIZE = 20
+
+# snapshot is compressed, if it's filename has one of these suffixes
+COMPRESSED_OPENERS = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+}
+
+
+class SnapshotRecord(typ.NamedTuple):
+    path: str  # relative to archive root, in posix form
+    signature: StatSignature
+    tags: typ.Dict[str, typ.Optional[str]]
+    cover_digest: typ.Optional[str] = None
+    indexed: bool = False  # True if track was up to date in archive index at export
+
+
+def open_snapshot(path: Path, mode: str) -> typ.TextIO:
+    """
+    :param mode: 'r' or 'w'
+    """
+    opener = COMPRESSED_OPENERS.get(path.suffix, open)
+    return opener(path, f'{mode}t', encoding='utf-8')
+
+
+def get_cover_digest(cover: typ.Optional[typ.Tuple[bytes, str]]) -> typ.Optional[str]:
+    if cover is None:
+        return None
+    data, _mimetype = cover
+    return hashlib.blake2b(data, digest_size=COVER_DIGEST_SIZE).hexdigest()
+
+
+def read_track_record(archive_path: Path, track_entry: FileEntry) -> SnapshotRecord:
+    """
+    parses track and takes it's state
+    """
+    track = Track(track_entry.path)
+    return SnapshotRecord(track_entry.path.relative_to(archive_path).as_posix(),
+                          StatSignature.from_stat(track_entry.stat), track.get_tags(),
+                          get_cover_digest(track.get_cover()))
+
+
+def dump_record(record: SnapshotRecord) -> str:
+    # absent tags are omitted to keep snapshot compact
+    line = {'path': record.path, 'sig': list(record.signature),
+            'tags': {tag: value for tag, value in record.tags.items() if value is not None}}
+    if record.cover_digest is not None:
+        line['cover'] = record.cover_digest
+    if record.indexed:
+        line['indexed'] = True
+    return json.dumps(line, ensure_ascii=False, separators=(',', ':'))
+
+
+def parse_record(line: str) -> SnapshotRecord:
+    data = json.loads(line)
+    tags = {tag: data['tags'].get(tag) for tag in Track.TAG_ALIASES}
+    return SnapshotRecord(data['path'], StatSignature(*data['sig']), tags, data.get('cover'),
+                          data.get('indexed', False))
+
+
+def write_snapshot(path: Path, records: typ.Iterable[SnapshotRecord]) -> int:
+    """
+    streams records to snapshot file, records are not kept in memory
+    :return: number of written records
+    """
+    count = 0
+    with open_snapshot(path, 'w') as file:
+        file.write(json.dumps({'format': FORMAT_NAME, 'version': FORMAT_VERSION}) + '\n')
+        for record in records:
+            file.write(dump_record(record) + '\n')
+            count += 1
+    return count
+
+
+def read_snapshot(path: Path) -> typ.Iterator[SnapshotRecord]:
+    """
+    lazily yields records of snapshot file
+    """
+    with open_snapshot(path, 'r') as file:
+        header = json.loads(file.readline() or '{}')
+        if header.get('format') != FORMAT_NAME:
+            raise ValueError(f'{path} is not a mulima snapshot')
+        if header.get('version') != FORMAT_VERSION:
+            raise ValueError(f'unsupported snapshot version: {header.get("version")}')
+
+        for line in file:
+            if line.strip():
+                yield parse_record(line)
+
+
+class SnapshotStats:
+    """
+    aggregate stats of archive state, which are computed in one pass over records
+    """
+    tracks: int
+    size: int  # total size of tracks in bytes
+    covers: int  # number of tracks with embedded cover
+    tracks_by_directory: typ.Dict[str, int]
+    missing_tags: typ.Dict[str, int]  # number of tracks without tag by tag
+    # tracknumbers, which occur several times in one album of one directory, by directory and album
+    duplicate_tracknumbers: typ.Dict[typ.Tuple[str, typ.Optional[str]], typ.List[str]]
+
+    def __init__(self):
+        self.tracks = 0
+        self.size = 0
+        self.covers = 0
+        self.tracks_by_directory = dict()
+        self.missing_tags = {tag: 0 for tag in Track.TAG_ALIASES}
+        self.duplicate_tracknumbers = dict()
+
+        self.__tracknumbers: typ.Dict[typ.Tuple[str, typ.Optional[str]], typ.Set[str]] = dict()
+
+    def add(self, record: SnapshotRecord):
+        self.tracks += 1
+        self.size += record.signature.size
+        self.covers += record.cover_digest is not None
+
+        directory = record.path.rpartition('/')[0] or '.'
+        self.tracks_by_directory[directory] = self.tracks_by_directory.get(directory, 0) + 1
+
+        for tag in Track.TAG_ALIASES:
+            if record.tags.get(tag) is None:
+                self.missing_tags[tag] += 1
+
+        tracknumber = record.tags.get('tracknumber')
+        if tracknumber is not None:
+            album_key = (directory, record.tags.get('album'))
+            tracknumbers = self.__tracknumbers.setdefault(album_key, set())
+            if tracknumber in tracknumbers:
+                duplicates = self.duplicate_tracknumbers.setdefault(album_key, list())
+                if tracknumber not in duplicates:
+                    duplicates.append(tracknumber)
+            tracknumbers.add(tracknumber)
+
+    @classmethod
+    def compute(cls, records: typ.Iterable[SnapshotRecord]) -> 'SnapshotStats':
+        stats = cls()
+        for record in records:
+            stats.add(record)
+        return stats
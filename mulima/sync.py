@@ -0,0 +1,412 @@
+import errno
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import typing as typ
+from pathlib import Path
+
+from mulima.track_processor import Track
+from mulima.index import TrackIndex, StatSignature
+from mulima.executor import UpdateExecutor
+from mulima.scanner import scan_directories
+from mulima.tag_regions import get_payload_range
+from mulima.fingerprint import get_payload_digest
+from mulima.metrics import UpdateCallbacks, UpdateMetrics, UpdateReport
+
+FICLONE = 0x40049409  # ioctl request of copy-on-write clone, _IOW(0x94, 9, int)
+
+
+def get_tags_digest(tags: typ.Dict[str, typ.Optional[str]]) -> str:
+    """
+    digest of track tags, mulima update time is not taken into account
+    """
+    tags = {tag: value for tag, value in tags.items() if tag != 'mulima_upd_time'}
+    return hashlib.sha1(json.dumps(tags, sort_keys=True).encode()).hexdigest()
+
+
+def get_payload_size(path: Path) -> int:
+    start, end = get_payload_range(path)
+    return end - start
+
+
+def clone_file(source: Path, target: Path, *, allow_hardlink: bool) -> str:
+    """
+    places copy of source at target atomically: reflink is tried first, then hardlink (if allowed)
+    and the whole data is copied only if neither is possible
+    :return: 'reflink', 'hardlink' or 'copy'
+    """
+    target.parent.mkdir(parents=True, exist_ok=True)
+    temp = target.with_name(f'.{target.name}.mulima-sync')
+    if temp.exists():
+        temp.unlink()
+
+    method = 'copy'
+    if source.stat().st_dev == target.parent.stat().st_dev:
+        with open(source, 'rb') as source_file, open(temp, 'wb') as temp_file:
+            try:
+                import fcntl
+            except ImportError:
+                pass  # there is no ioctl on this platform, so reflink is not supported
+            else:
+                try:
+                    fcntl.ioctl(temp_file.fileno(), FICLONE, source_file.fileno())
+                    method = 'reflink'
+                except OSError as e:
+                    if e.errno not in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS):
+                        raise
+
+        if method == 'reflink':
+            shutil.copystat(source, temp)
+        elif allow_hardlink:
+            temp.unlink()
+            os.link(source, temp)
+            method = 'hardlink'
+
+    if method == 'copy':
+        shutil.copy2(source, temp)
+
+    os.replace(temp, target)
+    return method
+
+
+def copy_tags(source: Path, target: Path) -> int:
+    """
+    rewrites tags (and cover, embedded by mulima) of target track with tags of source track,
+    audio data of target is not touched
+    :return: number of written bytes
+    """
+    source_track, target_track = Track(source), Track(target)
+    for tag in Track.TAG_ALIASES:
+        if tag != 'mulima_upd_time':
+            target_track.set_tag(tag, source_track.get_tag(tag))
+
+    cover = source_track.get_cover()
+    if cover is not None:
+        data, mimetype = cover
+        target_track.set_cover(data=data, mimetype=mimetype)
+
+    return target_track.write()
+
+
+class SyncRecord(typ.NamedTuple):
+    master_signature: StatSignature
+    tags_digest: str
+    replica_signature: StatSignature
+
+
+class SyncIndex:
+    """
+    state of replica, stored in replica root: for every synced track it remembers signature
+    and tags digest of master track and signature of replica file right after the sync
+    """
+    FILENAME = 'sync.index.sqlite'
+
+    def __init__(self, replica_path: Path):
+        self.replica_path = replica_path
+
+        state_dir = replica_path / TrackIndex.STATE_DIRNAME
+        state_dir.mkdir(parents=True, exist_ok=True)
+
+        self.__connection = sqlite3.connect(str(state_dir / self.FILENAME))
+        self.__connection.execute(
+            'CREATE TABLE IF NOT EXISTS tracks ('
+            '    path TEXT PRIMARY KEY,'
+            '    master_size INTEGER NOT NULL,'
+            '    master_mtime_ns INTEGER NOT NULL,'
+            '    master_inode INTEGER NOT NULL,'
+            '    tags_digest TEXT NOT NULL,'
+            '    replica_size INTEGER NOT NULL,'
+            '    replica_mtime_ns INTEGER NOT NULL,'
+            '    replica_inode INTEGER NOT NULL'
+            ')'
+        )
+        self.__connection.commit()
+
+    def records(self) -> typ.Dict[str, SyncRecord]:
+        """
+        :return: records by path, relative to replica root
+        """
+        return {row[0]: SyncRecord(StatSignature(*row[1:4]), row[4], StatSignature(*row[5:8]))
+                for row in self.__connection.execute('SELECT * FROM tracks')}
+
+    def put(self, key: str, record: SyncRecord):
+        self.__connection.execute(
+            'INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (key, *record.master_signature, record.tags_digest, *record.replica_signature)
+        )
+
+    def remove(self, key: str):
+        self.__connection.execute('DELETE FROM tracks WHERE path = ?', (key,))
+
+    def commit(self):
+        self.__connection.commit()
+
+    def close(self):
+        self.__connection.commit()
+        self.__connection.close()
+
+
+class ArchiveSync:
+    """
+    one-way delta sync of master archive to replica tree.
+    Tracks are compared by stat signatures and tags digests, remembered in replica's SyncIndex,
+    audio data is hashed only if there is no other way to match tracks.
+    Only new and changed tracks are transferred, renamed tracks are moved inside replica
+    """
+    def __init__(self, master_path: Path, master_index: TrackIndex, replica_path: Path, *,
+                 tags_only: bool = False, delete: bool = True, allow_hardlinks: bool = True,
+                 executor: typ.Optional[UpdateExecutor] = None, callbacks: typ.Iterable[UpdateCallbacks] = ()):
+        """
+        :param master_index: index of master archive, tags of actual tracks are taken from it
+        :param tags_only: if True and audio data of replica track is the same, only tags region is rewritten
+        :param delete: if True tracks, which are not in master anymore, are removed from replica
+        :param allow_hardlinks: if True and reflink is not supported, replica tracks on the same filesystem are
+        hardlinked to master tracks (so later changes of master are seen in replica immediately)
+        """
+        self.master_path = master_path
+        self.master_index = master_index
+        self.replica_path = replica_path
+        self.tags_only = tags_only
+        self.delete = delete
+        self.allow_hardlinks = allow_hardlinks
+        self.executor = UpdateExecutor() if executor is None else executor
+        self.callbacks = list(callbacks)
+
+    def _get_tags_digests(self, metrics: UpdateMetrics, master_signatures: typ.Dict[str, StatSignature]
+                          ) -> typ.Dict[str, str]:
+        tags_by_key, keys_to_load = dict(), list()
+        for key, signature in master_signatures.items():
+            path = self.master_path / key
+            if self.master_index.is_actual(path, signature):
+                tags_by_key[key] = self.master_index.get_tags(path)
+            else:
+                keys_to_load.append(key)
+
+        track_list = self.executor.load_tracks(self.master_path / key for key in keys_to_load)
+        metrics.count('files_opened', len(track_list))
+        metrics.count('bytes_read', sum(track.bytes_read for track in track_list))
+        tags_by_key.update((key, track.get_tags()) for key, track in zip(keys_to_load, track_list))
+
+        return {key: get_tags_digest(tags) for key, tags in tags_by_key.items()}
+
+    def _hash_payloads(self, metrics: UpdateMetrics, paths: typ.Iterable[Path]) -> typ.Dict[Path, str]:
+        paths = list(paths)
+        digests = self.executor.map(get_payload_digest, paths)
+        metrics.count('files_hashed', len(paths))
+        return dict(zip(paths, digests))
+
+    def _find_same_payload_keys(self, metrics: UpdateMetrics, keys: typ.List[str]) -> typ.List[str]:
+        """
+        :return: tracks, which audio data in master and in replica is the same,
+        sizes of audio data are compared first, so only tracks with equal sizes are hashed
+        """
+        pairs = [(self.master_path / key, self.replica_path / key) for key in keys]
+        payload_sizes = dict(zip([path for pair in pairs for path in pair],
+                                 self.executor.map(get_payload_size, [path for pair in pairs for path in pair])))
+        same_size_keys = [key for key, (master_path, replica_path) in zip(keys, pairs)
+                          if payload_sizes[master_path] == payload_sizes[replica_path]]
+
+        digests = self._hash_payloads(metrics, [path for key in same_size_keys
+                                                for path in (self.master_path / key, self.replica_path / key)])
+        return [key for key in same_size_keys if digests[self.master_path / key] == digests[self.replica_path / key]]
+
+    def _get_replica_signature(self, key: str) -> typ.Optional[StatSignature]:
+        try:
+            return StatSignature.from_path(self.replica_path / key)
+        except FileNotFoundError:
+            return None
+
+    def _match_moved_tracks(self, metrics: UpdateMetrics, new_keys: typ.List[str],
+                            orphan_records: typ.Dict[str, SyncRecord],
+                            master_signatures: typ.Dict[str, StatSignature]) -> typ.Dict[str, str]:
+        """
+        moved master track has the same stat signature as orphan had, inode alone is not enough,
+        because inode of removed file is reused by new ones
+        :param new_keys: master tracks, which are not in replica
+        :param orphan_records: synced tracks, which are not in master anymore
+        :return: orphan key for every moved master track
+        """
+        moves = dict()
+        orphan_by_signature = {record.master_signature: key for key, record in orphan_records.items()}
+        unmatched_keys = list()
+        for key in new_keys:
+            orphan_key = orphan_by_signature.pop(master_signatures[key], None)
+            if orphan_key is not None:
+                moves[key] = orphan_key
+            else:
+                unmatched_keys.append(key)
+
+        # fallback: renamed file was rewritten (by tagger or by other tool), so only it's content could match
+        orphan_keys = list(orphan_by_signature.values())
+        if not unmatched_keys or not orphan_keys:
+            return moves
+
+        orphan_by_payload_size = dict()
+        for orphan_key, payload_size in zip(orphan_keys, self.executor.map(
+                get_payload_size, [self.replica_path / key for key in orphan_keys])):
+            orphan_by_payload_size.setdefault(payload_size, list()).append(orphan_key)
+
+        candidates = list()
+        for key, payload_size in zip(unmatched_keys, self.executor.map(
+                get_payload_size, [self.master_path / key for key in unmatched_keys])):
+            if payload_size in orphan_by_payload_size:
+                candidates.append((key, orphan_by_payload_size[payload_size]))
+
+        digests = self._hash_payloads(metrics, {path for key, orphan_keys in candidates for path in
+                                                [self.master_path / key] + [self.replica_path / orphan_key
+                                                                            for orphan_key in orphan_keys]})
+        matched_orphan_keys = set()
+        for key, orphan_keys in candidates:
+            for orphan_key in orphan_keys:
+                if orphan_key not in matched_orphan_keys and \
+                        digests[self.master_path / key] == digests[self.replica_path / orphan_key]:
+                    moves[key] = orphan_key
+                    matched_orphan_keys.add(orphan_key)
+                    break
+
+        return moves
+
+    def _remove_empty_directories(self, keys: typ.Iterable[str]):
+        directories = {(self.replica_path / key).parent for key in keys}
+        for directory in sorted(directories, key=lambda path: len(path.parts), reverse=True):
+            while directory != self.replica_path:
+                try:
+                    directory.rmdir()
+                except OSError:
+                    break
+                directory = directory.parent
+
+    def _sync(self, metrics: UpdateMetrics, sync_index: SyncIndex):
+        with metrics.phase('discovery'):
+            master_signatures = {
+                track_entry.path.relative_to(self.master_path).as_posix(): StatSignature.from_stat(track_entry.stat)
+                for directory in scan_directories(self.master_path, skip_dirnames={TrackIndex.STATE_DIRNAME})
+                for track_entry in directory.tracks
+            }
+            records = sync_index.records()
+
+            unchanged_keys, changed_keys, new_keys = list(), list(), list()
+            for key, master_signature in master_signatures.items():
+                record = records.get(key)
+                replica_signature = self._get_replica_signature(key)
+                if replica_signature is None:
+                    new_keys.append(key)
+                elif record is not None and record.replica_signature == replica_signature and \
+                        record.master_signature == master_signature:
+                    unchanged_keys.append(key)
+                else:
+                    changed_keys.append(key)
+
+            orphan_records = {key: record for key, record in records.items() if key not in master_signatures}
+            orphan_records = {key: record for key, record in orphan_records.items()
+                              if self._get_replica_signature(key) == record.replica_signature}
+        metrics.count('files_found', len(master_signatures))
+
+        with metrics.phase('load'):
+            tags_digests = self._get_tags_digests(metrics, {key: master_signatures[key]
+                                                            for key in changed_keys + new_keys})
+
+        with metrics.phase('move'):
+            moves = self._match_moved_tracks(metrics, new_keys, orphan_records, master_signatures)
+            for key, orphan_key in moves.items():
+                (self.replica_path / key).parent.mkdir(parents=True, exist_ok=True)
+                os.replace(self.replica_path / orphan_key, self.replica_path / key)
+
+                record = orphan_records.pop(orphan_key)
+                records[key] = record._replace(replica_signature=StatSignature.from_path(self.replica_path / key))
+                sync_index.remove(orphan_key)
+                sync_index.put(key, records[key])
+                if record.master_signature != master_signatures[key]:
+                    changed_keys.append(key)
+            self._remove_empty_directories(moves.values())
+        metrics.count('files_moved', len(moves))
+
+        keys_to_copy = [key for key in new_keys if key not in moves]
+        keys_to_fix_tags, keys_to_check_payload = list(), list()
+        for key in changed_keys:
+            record, master_signature = records.get(key), master_signatures[key]
+            replica_signature = self._get_replica_signature(key)
+
+            if replica_signature.inode == master_signature.inode and \
+                    (self.replica_path / key).stat().st_dev == (self.master_path / key).stat().st_dev:
+                # hardlinked to master
+                sync_index.put(key, SyncRecord(master_signature, tags_digests[key], replica_signature))
+            elif record is not None and record.replica_signature == replica_signature and \
+                    record.master_signature.size == master_signature.size and \
+                    record.master_signature.inode == master_signature.inode and \
+                    record.tags_digest == tags_digests[key]:
+                # file was only touched
+                sync_index.put(key, SyncRecord(master_signature, tags_digests[key], replica_signature))
+            elif record is not None and record.replica_signature == replica_signature and \
+                    record.master_signature.inode == master_signature.inode and not self.tags_only:
+                # file was rewritten in place, it's the way taggers (and mulima) save tags
+                keys_to_copy.append(key)
+            else:
+                # replica file is unknown or was changed in replica, or master file was rewritten in place
+                # (inode could be reused by other file as well): only content could tell,
+                # whether rewriting of tags is enough
+                keys_to_check_payload.append(key)
+
+        with metrics.phase('hash'):
+            replica_tags_digests = dict()
+            same_payload_keys = self._find_same_payload_keys(metrics, keys_to_check_payload)
+            for key, track in zip(same_payload_keys,
+                                  self.executor.load_tracks(self.replica_path / key for key in same_payload_keys)):
+                replica_tags_digests[key] = get_tags_digest(track.get_tags())
+
+            for key in keys_to_check_payload:
+                if key in replica_tags_digests and replica_tags_digests[key] == tags_digests[key]:
+                    sync_index.put(key, SyncRecord(master_signatures[key], tags_digests[key],
+                                                   StatSignature.from_path(self.replica_path / key)))
+                elif key in replica_tags_digests and self.tags_only:
+                    keys_to_fix_tags.append(key)
+                else:
+                    keys_to_copy.append(key)
+
+        with metrics.phase('copy'):
+            methods = self.executor.map(
+                lambda key: clone_file(self.master_path / key, self.replica_path / key,
+                                       allow_hardlink=self.allow_hardlinks),
+                keys_to_copy, path_of=lambda key: self.replica_path / key
+            )
+            for key in keys_to_copy:
+                sync_index.put(key, SyncRecord(master_signatures[key], tags_digests[key],
+                                               StatSignature.from_path(self.replica_path / key)))
+        metrics.count('files_copied', methods.count('copy'))
+        metrics.count('files_linked', len(methods) - methods.count('copy'))
+        metrics.count('bytes_written', sum(master_signatures[key].size
+                                           for key, method in zip(keys_to_copy, methods) if method == 'copy'))
+
+        with metrics.phase('tags'):
+            written_bytes_list = self.executor.map(
+                lambda key: copy_tags(self.master_path / key, self.replica_path / key),
+                keys_to_fix_tags, path_of=lambda key: self.replica_path / key
+            )
+            for key in keys_to_fix_tags:
+                sync_index.put(key, SyncRecord(master_signatures[key], tags_digests[key],
+                                               StatSignature.from_path(self.replica_path / key)))
+        metrics.count('files_saved', sum(1 for written_bytes in written_bytes_list if written_bytes))
+        metrics.count('bytes_written', sum(written_bytes_list))
+
+        with metrics.phase('delete'):
+            deleted_keys = list()
+            for key in set(records) - set(master_signatures) - set(moves.values()):
+                if self.delete:
+                    if key in orphan_records:
+                        (self.replica_path / key).unlink()
+                        deleted_keys.append(key)
+                    sync_index.remove(key)
+            self._remove_empty_directories(deleted_keys)
+        metrics.count('files_deleted', len(deleted_keys))
+
+    def run(self, *, profile: bool = False, trace_memory: bool = False) -> UpdateReport:
+        with UpdateMetrics(self.callbacks, profile=profile, trace_memory=trace_memory) as metrics:
+            sync_index = SyncIndex(self.replica_path)
+            try:
+                self._sync(metrics, sync_index)
+            finally:
+                sync_index.close()
+
+            return metrics.finish()
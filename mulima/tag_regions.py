@@ -0,0 +1,103 @@
+import typing as typ
+from pathlib import Path
+
+ID3V2_HEADER_SIZE = 10
+ID3V2_FOOTER_FLAG = 0x10
+FLAC_MARKER = b'fLaC'
+FLAC_BLOCK_HEADER_SIZE = 4
+ID3V1_SIZE = 128
+ID3V1_MARKER = b'TAG'
+# enhanced tag, which is placed right before ID3v1 tag
+ID3V1_EXTENDED_SIZE = 227
+ID3V1_EXTENDED_MARKER = b'TAG+'
+ID3V1_MAX_SIZE = ID3V1_SIZE + ID3V1_EXTENDED_SIZE
+
+
+def get_id3v2_size(header: bytes) -> int:
+    """
+    :param header: first bytes of file
+    :return: full size of ID3v2 tag (with header and footer) or 0, if there is no tag
+    """
+    if len(header) < ID3V2_HEADER_SIZE or not header.startswith(b'ID3'):
+        return 0
+
+    flags = header[5]
+    # size is synchsafe integer: 7 bits in every byte
+    size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+    footer_size = ID3V2_HEADER_SIZE if flags & ID3V2_FOOTER_FLAG else 0
+    return ID3V2_HEADER_SIZE + size + footer_size
+
+
+def iter_flac_blocks(file: typ.BinaryIO) -> typ.Iterator[typ.Tuple[int, int, int]]:
+    """
+    walks metadata block headers of FLAC file, which position is right after 'fLaC' marker
+    :return: type, offset of data and data size of every block
+    """
+    is_last_block = False
+    while not is_last_block:
+        block_header = file.read(FLAC_BLOCK_HEADER_SIZE)
+        if len(block_header) < FLAC_BLOCK_HEADER_SIZE:
+            return
+
+        is_last_block = bool(block_header[0] & 0x80)
+        block_type = block_header[0] & 0x7F
+        block_size = int.from_bytes(block_header[1:], 'big')
+
+        data_offset = file.tell()
+        yield block_type, data_offset, block_size
+        file.seek(data_offset + block_size)
+
+
+def get_leading_tags_size(path: Path) -> int:
+    """
+    :return: size of metadata in the beginning of file: ID3v2 tag and FLAC metadata blocks
+    """
+    with open(path, 'rb') as file:
+        offset = get_id3v2_size(file.read(ID3V2_HEADER_SIZE))
+        file.seek(offset)
+
+        if file.read(len(FLAC_MARKER)) == FLAC_MARKER:
+            offset = file.tell()
+            for _, data_offset, block_size in iter_flac_blocks(file):
+                offset = data_offset + block_size
+
+        return offset
+
+
+def get_id3v1_size(tail: bytes) -> int:
+    """
+    :param tail: last bytes of file, ID3V1_MAX_SIZE bytes are enough
+    :return: size of ID3v1 tag together with enhanced tag, if it's present, or 0, if there is no tag
+    """
+    if len(tail) < ID3V1_SIZE or not tail[-ID3V1_SIZE:].startswith(ID3V1_MARKER):
+        return 0
+
+    if len(tail) >= ID3V1_MAX_SIZE and tail[-ID3V1_MAX_SIZE:].startswith(ID3V1_EXTENDED_MARKER):
+        return ID3V1_MAX_SIZE
+    return ID3V1_SIZE
+
+
+def read_tail(file: typ.BinaryIO, size: int) -> bytes:
+    """
+    :return: last size bytes of file (or the whole file, if it's smaller)
+    """
+    file_size = file.seek(0, 2)
+    file.seek(max(0, file_size - size))
+    return file.read(size)
+
+
+def get_trailing_tags_size(path: Path) -> int:
+    """
+    :return: size of ID3v1 tag (with enhanced tag) in the end of file or 0, if there is no tag
+    """
+    with open(path, 'rb') as file:
+        return get_id3v1_size(read_tail(file, ID3V1_MAX_SIZE))
+
+
+def get_payload_range(path: Path) -> typ.Tuple[int, int]:
+    """
+    :return: start and end offsets of audio data, which is placed between leading and trailing tags
+    """
+    start = get_leading_tags_size(path)
+    end = max(start, path.stat().st_size - get_trailing_tags_size(path))
+    return start, end
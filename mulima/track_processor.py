@@ -1,3 +1,6 @@
+import os
+import shutil
+import sys
 import typing as typ
 from pathlib import Path
 from datetime import datetime
@@ -7,8 +10,25 @@ import mutagen.mp3
 import mutagen.id3
 import mutagen.flac
 
+from mulima.renamer import fit_filename
+from mulima.tag_regions import (
+    ID3V2_HEADER_SIZE, FLAC_MARKER, FLAC_BLOCK_HEADER_SIZE, get_id3v2_size, iter_flac_blocks, get_leading_tags_size
+)
+
+
+class _TagsDontFit(Exception):
+    """
+    is raised before in place saving, when tags don't fit in existing padding
+    """
+
 
 class Track:
+    # tracks of the whole archive are kept in memory during update (unless it is streamed by windows),
+    # so they should be compact:
+    # tag values are interned and stored in lists, mutagen file is parsed only for writing or pictures
+    __slots__ = ('bytes_read', '_Track__path', '_Track__mutagen_file', '_Track__was_parsed', '_Track__values',
+                 '_Track__original_values', '_Track__pics_modified', '_Track__pending_cover')
+
     AVAILABLE_PICS_MIMETYPES = ['image/jpeg', 'image/png', 'image/bmp']
     AVAILABLE_TRACK_EXTENSIONS = ['mp3', 'flac']  # wav, m4a, aac
     TAG_ALIASES = [
@@ -18,190 +38,382 @@ class Track:
         'date',
         'composer',
         'tracknumber',
-        'genre'
-        'mulima_upd_time'
+        'tracktotal',
+        'genre',
+        'lyrics',
+        'mulima_upd_time',
         # quality?
-        # lyric?
     ]
 
+    TAG_INDEXES = {tag: index for index, tag in enumerate(TAG_ALIASES)}
+
     UPD_TIME_TAG_FORMAT = '%d.%m.%Y %H:%M'
 
-    is_modified: bool
+    # copy of track, which is written, when the whole file should be rewritten
+    TEMP_FILENAME_PATTERN = '.mulima-write-{name}.tmp'
+
+    # ID3 frames of tags, which are stored in mp3 as is
+    MP3_TEXT_FRAMES = {
+        'title': 'TIT2',
+        'artist': 'TPE1',
+        'album': 'TALB',
+        'composer': 'TCOM',
+        'genre': 'TCON',
+    }
+
+    bytes_read: int  # by loading of tags
 
     #TODO: rename? to Track.is(path), Track.is_file(path), Track.file_is_proper_track(path)
     @classmethod
     def could_created_from(cls, path: Path) -> bool:
         return path.suffix.lstrip('.') in cls.AVAILABLE_TRACK_EXTENSIONS
 
+    # the only ID3 frames, which are parsed on loading, others are kept as raw bytes
+    LOADED_ID3_FRAMES = {
+        frame_id: getattr(mutagen.id3, frame_id)
+        for frame_id in ['TIT2', 'TPE1', 'TALB', 'TDRC', 'TDAT', 'TYER', 'TCOM', 'TRCK', 'TCON', 'TXXX', 'USLT']
+    }
+    FLAC_VORBIS_COMMENT_BLOCK_TYPE = 4
+
     def __init__(self, path: Path):
         if not self.could_created_from(path):
             raise ValueError(f"given track has extension '{path.suffix.lstrip('.')}', "
                              f"but should be one of follow: {self.AVAILABLE_TRACK_EXTENSIONS}")
 
         self.__path = path
-        self.__mutagen_file = m_file = mutagen.File(path)
-        self.new_cover = None
+        self.__mutagen_file = None  # is opened only when it's needed for writing or pictures
+        self.__was_parsed = False
 
-        if isinstance(m_file, mutagen.mp3.MP3):
-            if 'TDRC' in m_file:
-                date = m_file['TDRC'].text[0]
-            elif 'TDAT' in m_file:
-                date = m_file['TDAT'].text[0]
-            elif 'TYER' in m_file:
-                date = m_file['TYER'].text[0]
-            else:
-                date = None
-
-            if 'TXXX:_mulima_upd_time' in m_file.tags:
-                mulima_upd_time = m_file['TXXX:_mulima_upd_time'].text[0]
-            else:
-                mulima_upd_time = None
-
-            self.__tags = {
-                'title': m_file['TIT2'].text[0] if 'TIT2' in m_file else None,
-                'artist': m_file['TPE1'].text[0] if 'TPE1' in m_file else None,
-                'album': m_file['TALB'].text[0] if 'TALB' in m_file else None,
-                'date': date,
-                'composer': m_file['TCOM'].text[0] if 'TCOM' in m_file else None,
-                'tracknumber': m_file['TRCK'].text[0] if 'TRCK' in m_file else None,
-                'genre': m_file['TCON'].text[0] if 'TCON' in m_file else None,
-                'mulima_upd_time': mulima_upd_time
-            }
-        elif isinstance(m_file, mutagen.flac.FLAC):
-            if '_mulima_upd_time' in m_file.tags:
-                mulima_upd_time = m_file['_mulima_upd_time'][0]
-            else:
-                mulima_upd_time = None
-
-            self.__tags = {
-                'title': m_file['title'][0] if 'title' in m_file else None,
-                'artist': m_file['artist'][0] if 'artist' in m_file else None,
-                'album': m_file['album'][0] if 'album' in m_file else None,
-                'date': m_file['date'][0] if 'date' in m_file else None,
-                'composer': m_file['composer'][0] if 'composer' in m_file else None,
-                'tracknumber': m_file['tracknumber'][0] if 'tracknumber' in m_file else None,
-                'genre': m_file['genre'][0] if 'genre' in m_file else None,
-                'mulima_upd_time': mulima_upd_time
-            }
-
-        self.is_modified = False
+        if path.suffix == '.mp3':
+            tags, self.bytes_read = self._read_mp3_tags(path)
+        elif path.suffix == '.flac':
+            tags, self.bytes_read = self._read_flac_tags(path)
+
+        # the same values (artist, album, date, etc) are repeated in many tracks
+        self.__values = [None if tags[tag] is None else sys.intern(tags[tag]) for tag in self.TAG_ALIASES]
+        self.__original_values = tuple(self.__values)
+        self.__pics_modified = False
+        self.__pending_cover: typ.Optional[typ.Tuple[bytes, str]] = None
+
+    @classmethod
+    def _read_mp3_tags(cls, path: Path) -> typ.Tuple[typ.Dict[str, typ.Optional[str]], int]:
+        """
+        reads only ID3 tag (without scanning of MPEG frames) and parses only frames, used by mulima
+        :return: tags and number of read bytes
+        """
+        try:
+            id3 = mutagen.id3.ID3(path, known_frames=cls.LOADED_ID3_FRAMES)
+            bytes_read = id3.size
+        except mutagen.id3.ID3NoHeaderError:
+            id3 = mutagen.id3.ID3()
+            bytes_read = ID3V2_HEADER_SIZE
+
+        if 'TDRC' in id3:
+            date = str(id3['TDRC'].text[0])
+        elif 'TDAT' in id3:
+            date = str(id3['TDAT'].text[0])
+        elif 'TYER' in id3:
+            date = str(id3['TYER'].text[0])
+        else:
+            date = None
+
+        if 'TXXX:_mulima_upd_time' in id3:
+            mulima_upd_time = id3['TXXX:_mulima_upd_time'].text[0]
+        else:
+            mulima_upd_time = None
+
+        if 'TRCK' in id3:
+            tracknumber, _, tracktotal = id3['TRCK'].text[0].partition('/')
+        else:
+            tracknumber, tracktotal = None, None
+
+        lyrics_frames = id3.getall('USLT')
+
+        return {
+            'title': id3['TIT2'].text[0] if 'TIT2' in id3 else None,
+            'artist': id3['TPE1'].text[0] if 'TPE1' in id3 else None,
+            'album': id3['TALB'].text[0] if 'TALB' in id3 else None,
+            'date': date,
+            'composer': id3['TCOM'].text[0] if 'TCOM' in id3 else None,
+            'tracknumber': tracknumber,
+            'tracktotal': tracktotal or None,
+            'genre': id3['TCON'].text[0] if 'TCON' in id3 else None,
+            'lyrics': lyrics_frames[0].text if lyrics_frames else None,
+            'mulima_upd_time': mulima_upd_time
+        }, bytes_read
+
+    @classmethod
+    def _read_flac_vorbis_comment(cls, path: Path) -> typ.Tuple[mutagen.flac.VCFLACDict, int]:
+        """
+        walks through FLAC metadata block headers and reads only vorbis comment block,
+        other blocks (pictures, seektable, etc) are skipped without reading
+        :return: vorbis comment and number of read bytes
+        """
+        with open(path, 'rb') as file:
+            # some taggers put ID3 before FLAC stream
+            file.seek(get_id3v2_size(file.read(ID3V2_HEADER_SIZE)))
+
+            if file.read(len(FLAC_MARKER)) != FLAC_MARKER:
+                raise mutagen.flac.FLACNoHeaderError(f"'{path}' is not a FLAC file")
+
+            bytes_read = ID3V2_HEADER_SIZE + len(FLAC_MARKER)
+            for block_type, _, block_size in iter_flac_blocks(file):
+                bytes_read += FLAC_BLOCK_HEADER_SIZE
+                if block_type == cls.FLAC_VORBIS_COMMENT_BLOCK_TYPE:
+                    return mutagen.flac.VCFLACDict(file.read(block_size)), bytes_read + block_size
+
+        return mutagen.flac.VCFLACDict(), bytes_read
+
+    @classmethod
+    def _read_flac_tags(cls, path: Path) -> typ.Tuple[typ.Dict[str, typ.Optional[str]], int]:
+        vorbis_comment, bytes_read = cls._read_flac_vorbis_comment(path)
+
+        if '_mulima_upd_time' in vorbis_comment:
+            mulima_upd_time = vorbis_comment['_mulima_upd_time'][0]
+        else:
+            mulima_upd_time = None
+
+        return {
+            'title': vorbis_comment['title'][0] if 'title' in vorbis_comment else None,
+            'artist': vorbis_comment['artist'][0] if 'artist' in vorbis_comment else None,
+            'album': vorbis_comment['album'][0] if 'album' in vorbis_comment else None,
+            'date': vorbis_comment['date'][0] if 'date' in vorbis_comment else None,
+            'composer': vorbis_comment['composer'][0] if 'composer' in vorbis_comment else None,
+            'tracknumber': vorbis_comment['tracknumber'][0] if 'tracknumber' in vorbis_comment else None,
+            'tracktotal': vorbis_comment['tracktotal'][0] if 'tracktotal' in vorbis_comment else None,
+            'genre': vorbis_comment['genre'][0] if 'genre' in vorbis_comment else None,
+            'lyrics': vorbis_comment['lyrics'][0] if 'lyrics' in vorbis_comment else None,
+            'mulima_upd_time': mulima_upd_time
+        }, bytes_read
+
+    def _get_mutagen_file(self) -> mutagen.FileType:
+        if self.__mutagen_file is None:
+            if self.__path.suffix == '.mp3':
+                self.__mutagen_file = mutagen.mp3.MP3(self.__path)
+            elif self.__path.suffix == '.flac':
+                self.__mutagen_file = mutagen.flac.FLAC(self.__path)
+
+            if self.__mutagen_file.tags is None:
+                self.__mutagen_file.add_tags()
+            self.__was_parsed = True
+
+        return self.__mutagen_file
+
+    def is_parsed(self) -> bool:
+        """
+        :return: True if the whole file was parsed by mutagen (for writing or pictures), even if it's released
+        """
+        return self.__was_parsed
 
     def get_path(self) -> Path:
         return self.__path
 
+    def relocate(self, path: Path):
+        """
+        updates path of track, which file was renamed
+        """
+        self.__path = path
+        if self.__mutagen_file is not None:
+            self.__mutagen_file.filename = str(path)
+
     def get_mulima_upd_time(self):
         return datetime.strptime(self.get_tag('mulima_upd_time'), self.UPD_TIME_TAG_FORMAT)
 
     def get_tags(self):
-        return self.__tags.copy()
+        return dict(zip(self.TAG_ALIASES, self.__values))
 
     def get_tag(self, tag: str) -> str:
-        if tag not in self.TAG_ALIASES:
+        if tag not in self.TAG_INDEXES:
             raise ValueError(f'unexpected tag alias: {tag}')
 
-        return self.__tags[tag]
+        return self.__values[self.TAG_INDEXES[tag]]
 
-    def set_tag(self, tag: str, value: typ.Optional[str]) -> None:
-        self.is_modified = True
+    def has_pending_cover(self) -> bool:
+        """
+        :return: True if cover was set and will be embedded on writing
+        """
+        return self.__pending_cover is not None
+
+    @property
+    def is_modified(self) -> bool:
+        """
+        True also if cover was set, but it was not compared with embedded one yet
+        """
+        return self.__pics_modified or self.__pending_cover is not None or \
+            tuple(self.__values) != self.__original_values
+
+    def get_changed_tags(self) -> typ.List[str]:
+        """
+        :return: aliases of tags, which values differ from values in file
+        """
+        return [tag for tag, value, original_value in zip(self.TAG_ALIASES, self.__values, self.__original_values)
+                if value != original_value]
 
-        if tag not in self.TAG_ALIASES:
+    def set_tag(self, tag: str, value: typ.Optional[str]) -> None:
+        if tag not in self.TAG_INDEXES:
             raise ValueError(f'unexpected tag alias: {tag}')
 
-        if tag is 'mulima_upd_time':
+        if tag == 'mulima_upd_time':
             raise ValueError(f'read-only tag')
 
-        self.__tags[tag] = value
+        self.__values[self.TAG_INDEXES[tag]] = None if value is None else sys.intern(value)
 
     def remove_tag(self, tag):
         self.set_tag(tag, None)
 
-    def write(self):
-        if self.is_modified:
-            if isinstance(self.__mutagen_file, mutagen.mp3.MP3):
-                self._fill_tags_to_mp3_mfile()
-            elif isinstance(self.__mutagen_file, mutagen.flac.FLAC):
-                self._fill_tags_to_flac_mfile()
+    def write(self) -> int:
+        """
+        saves changes, if there are any. Changes are fitted into existing padding when it's possible,
+        so only the region of tags is rewritten in place
+        Parsed mutagen file is released after writing
+        :return: number of written bytes
+        """
+        self._apply_pending_cover()
+        if not self.is_modified:
+            self._release_mutagen_file()
+            return 0
 
-            self.__mutagen_file.save()
+        self.__values[self.TAG_INDEXES['mulima_upd_time']] = datetime.now().strftime(self.UPD_TIME_TAG_FORMAT)
+        changed_tags = self.get_changed_tags()
 
-    def _fill_tags_to_mp3_mfile(self):
-        m_file = self.__mutagen_file
+        m_file = self._get_mutagen_file()
         if isinstance(m_file, mutagen.mp3.MP3):
-            title_val = self.__tags.get('title')
-            if title_val is not None:
-                m_file.tags.add(mutagen.id3.TIT2(text = str(title_val)))
-            elif 'TIT2' in m_file.tags:
-                del m_file.tags['TIT2']
-
-            artist_val = self.__tags.get('artist')
-            if artist_val is not None:
-                m_file.tags.add(mutagen.id3.TPE1(text = str(artist_val)))
-            elif 'TPE1' in m_file.tags:
-                del m_file.tags['TPE1']
-
-            album_val = self.__tags.get('album')
-            if album_val is not None:
-                m_file.tags.add(mutagen.id3.TALB(text = str(album_val)))
-            elif 'TALB' in m_file.tags:
-                del m_file.tags['TALB']
-
-            date_val = self.__tags.get('date')
-            if date_val is not None:
-                if m_file.tags.version == (2, 3, 0):
-                    m_file.tags.add(mutagen.id3.TDAT(text = str(date_val)))
-                elif m_file.tags.version == (2, 4, 0):
-                    m_file.tags.add(mutagen.id3.TDRC(text = str(date_val)))
-            elif 'TDAT' in m_file.tags:
-                del m_file['TDAT']
-            elif 'TDRC' in m_file.tags:
-                del m_file['TDRC']
-            elif 'TYER' in m_file.tags:
-                del m_file['TYER']
-
-            composer_val = self.__tags.get('composer')
-            if composer_val is not None:
-                m_file.tags.add(mutagen.id3.TCOM(text = str(composer_val)))
-            elif 'TCOM' in m_file.tags:
-                del m_file.tags['TCOM']
-
-            tracknumber_val = self.__tags.get('tracknumber')
-            if tracknumber_val is not None:
-                m_file.tags.add(mutagen.id3.TRCK(text = str(tracknumber_val)))
-            elif 'TRCK' in m_file.tags:
-                del m_file.tags['TRCK']
-
-            genre_val = self.__tags.get('genre')
-            if genre_val is not None:
-                m_file.tags.add(mutagen.id3.TCON(text = str(genre_val)))
-            elif 'TCON' in m_file.tags:
-                del m_file.tags['TCON']
+            self._fill_tags_to_mp3_mfile(changed_tags)
+        elif isinstance(m_file, mutagen.flac.FLAC):
+            self._fill_tags_to_flac_mfile(changed_tags)
+
+        def keep_padding(info: mutagen.PaddingInfo) -> int:
+            if info.padding < 0:
+                raise _TagsDontFit
+            return info.padding
+
+        try:
+            self._save_mutagen_file(self.__path, keep_padding)
+            fits_in_padding = True
+        except _TagsDontFit:
+            self._save_to_temp_copy()
+            fits_in_padding = False
+
+        self.__original_values = tuple(self.__values)
+        self.__pics_modified = False
+        self._release_mutagen_file()
+
+        # if tags don't fit in padding, the whole file is rewritten
+        return get_leading_tags_size(self.__path) if fits_in_padding else self.__path.stat().st_size
+
+    def _save_mutagen_file(self, path: Path, padding: typ.Optional[typ.Callable[[mutagen.PaddingInfo], int]]):
+        m_file = self._get_mutagen_file()
+        if isinstance(m_file, mutagen.mp3.MP3):
+            # keep ID3 version, because conversion changes size of tag
+            m_file.save(str(path), padding=padding, v2_version=3 if m_file.tags.version < (2, 4, 0) else 4)
+        else:
+            m_file.save(str(path), padding=padding)
+
+    @classmethod
+    def get_temp_path(cls, path: Path) -> Path:
+        """
+        :return: path of copy of track, which is used, when the whole file is rewritten
+        """
+        return path.with_name(cls.TEMP_FILENAME_PATTERN.format(name=path.name))
+
+    def _save_to_temp_copy(self):
+        """
+        saves changes to copy of file and replaces file by it, so crash never leaves partially rewritten track
+        """
+        temp_path = self.get_temp_path(self.__path)
+        try:
+            shutil.copy2(self.__path, temp_path)
+            self._save_mutagen_file(temp_path, None)
+            with open(temp_path, 'rb') as temp_file:
+                os.fsync(temp_file.fileno())
+            os.replace(temp_path, self.__path)
+        except BaseException:
+            if temp_path.exists():
+                temp_path.unlink()
+            raise
+
+    def _release_mutagen_file(self):
+        if not self.__pics_modified and self.__pending_cover is None:
+            self.__mutagen_file = None
+
+    def _fill_tags_to_mp3_mfile(self, changed_tags: typ.List[str]):
+        m_file = self._get_mutagen_file()
+        if isinstance(m_file, mutagen.mp3.MP3):
+            for tag, frame_id in self.MP3_TEXT_FRAMES.items():
+                if tag in changed_tags:
+                    tag_val = self.get_tag(tag)
+                    if tag_val is not None:
+                        m_file.tags.add(getattr(mutagen.id3, frame_id)(text = str(tag_val)))
+                    elif frame_id in m_file.tags:
+                        del m_file.tags[frame_id]
+
+            if 'date' in changed_tags:
+                date_val = self.get_tag('date')
+                if date_val is not None:
+                    if m_file.tags.version == (2, 3, 0):
+                        m_file.tags.add(mutagen.id3.TDAT(text = str(date_val)))
+                    elif m_file.tags.version == (2, 4, 0):
+                        m_file.tags.add(mutagen.id3.TDRC(text = str(date_val)))
+                elif 'TDAT' in m_file.tags:
+                    del m_file['TDAT']
+                elif 'TDRC' in m_file.tags:
+                    del m_file['TDRC']
+                elif 'TYER' in m_file.tags:
+                    del m_file['TYER']
+
+            if 'tracknumber' in changed_tags or 'tracktotal' in changed_tags:
+                tracknumber_val = self.get_tag('tracknumber')
+                tracktotal_val = self.get_tag('tracktotal')
+                if tracknumber_val is not None and tracktotal_val is not None:
+                    m_file.tags.add(mutagen.id3.TRCK(text = f'{tracknumber_val}/{tracktotal_val}'))
+                elif tracknumber_val is not None:
+                    m_file.tags.add(mutagen.id3.TRCK(text = str(tracknumber_val)))
+                elif 'TRCK' in m_file.tags:
+                    del m_file.tags['TRCK']
+
+            if 'lyrics' in changed_tags:
+                m_file.tags.delall('USLT')
+                lyrics_val = self.get_tag('lyrics')
+                if lyrics_val is not None:
+                    m_file.tags.add(mutagen.id3.USLT(encoding=3, lang='eng', desc='', text=str(lyrics_val)))
 
             m_file.tags.add(mutagen.id3.TXXX(
                 desc='_mulima_upd_time',
-                text=str(datetime.now())
+                text=self.get_tag('mulima_upd_time')
             ))
 
-    def _fill_tags_to_flac_mfile(self):
-        equal_tag_names = ['title', 'artist', 'album', 'date', 'composer', 'tracknumber', 'genre']
+    def _fill_tags_to_flac_mfile(self, changed_tags: typ.List[str]):
+        m_file = self._get_mutagen_file()
+        equal_tag_names = ['title', 'artist', 'album', 'date', 'composer', 'tracknumber', 'tracktotal', 'genre',
+                           'lyrics']
         for tag in equal_tag_names:
-            tag_val = self.__tags.get(tag)
-            if tag_val is not None:
-                self.__mutagen_file[tag] = str(tag_val)
-            elif tag in self.__mutagen_file.tags:
-                del self.__mutagen_file.tags[tag]
+            if tag in changed_tags:
+                tag_val = self.get_tag(tag)
+                if tag_val is not None:
+                    m_file[tag] = str(tag_val)
+                elif tag in m_file.tags:
+                    del m_file.tags[tag]
 
-        self.__mutagen_file.tags['_mulima_upd_time'] = str(datetime.now())
+        m_file.tags['_mulima_upd_time'] = self.get_tag('mulima_upd_time')
 
     def has_pics(self) -> bool:
-        if isinstance(self.__mutagen_file, mutagen.mp3.MP3):
-            return any(id3_tag.startswith('APIC') for id3_tag in self.__mutagen_file.tags.keys())
-        elif isinstance(self.__mutagen_file, mutagen.flac.FLAC):
-            return bool(self.__mutagen_file.pictures)
+        if self.__pending_cover is not None:
+            return True
+
+        m_file = self._get_mutagen_file()
+        if isinstance(m_file, mutagen.mp3.MP3):
+            return any(id3_tag.startswith('APIC') for id3_tag in m_file.tags.keys())
+        elif isinstance(m_file, mutagen.flac.FLAC):
+            return bool(m_file.pictures)
 
     def clear_pics(self):
-        self.is_modified = True
+        self.__pending_cover = None
+        if not self.has_pics():
+            return
+
+        self.__pics_modified = True
 
-        m_file = self.__mutagen_file
+        m_file = self._get_mutagen_file()
         if isinstance(m_file, mutagen.mp3.MP3):
             for id3_tag in list(m_file.tags.keys()):
                 if id3_tag.startswith('APIC'):
@@ -209,40 +421,91 @@ class Track:
         elif isinstance(m_file, mutagen.flac.FLAC):
             m_file.clear_pictures()
 
+    def get_cover(self) -> typ.Optional[typ.Tuple[bytes, str]]:
+        """
+        :return: data and mimetype of cover, embedded by mulima
+        """
+        if self.__pending_cover is not None:
+            return self.__pending_cover
+
+        m_file = self._get_mutagen_file()
+        if isinstance(m_file, mutagen.mp3.MP3):
+            apic = m_file.tags.get('APIC:cover')
+            if apic is not None:
+                return apic.data, apic.mime
+        elif isinstance(m_file, mutagen.flac.FLAC):
+            for pic in m_file.pictures:
+                if pic.type == 3 and pic.desc == 'cover':
+                    return pic.data, pic.mime
+
+        return None
+
     def set_cover(self, *, data: bytes, mimetype: str):
+        """
+        cover is embedded on writing, so the file is not parsed until then
+        """
         if mimetype not in self.AVAILABLE_PICS_MIMETYPES:
             raise ValueError('unexpected picture mimetype')
 
-        self.is_modified = True
+        self.__pending_cover = (data, mimetype)
+
+    def _apply_pending_cover(self):
+        if self.__pending_cover is None:
+            return
+
+        (data, mimetype), self.__pending_cover = self.__pending_cover, None
+        if self.get_cover() == (data, mimetype):
+            return
+
+        self.__pics_modified = True
 
-        if isinstance(self.__mutagen_file, mutagen.mp3.MP3):
-            self.__mutagen_file.tags.add(mutagen.id3.APIC(
+        m_file = self._get_mutagen_file()
+        if isinstance(m_file, mutagen.mp3.MP3):
+            m_file.tags.add(mutagen.id3.APIC(
                 encoding=3,
                 mime=mimetype,
                 type=3,
                 desc=u'cover',
                 data=data
             ))
-        if isinstance(self.__mutagen_file, mutagen.flac.FLAC):
+        if isinstance(m_file, mutagen.flac.FLAC):
+            pictures = [pic for pic in m_file.pictures if not (pic.type == 3 and pic.desc == 'cover')]
+            m_file.clear_pictures()
+            for old_pic in pictures:
+                m_file.add_picture(old_pic)
+
             pic = mutagen.flac.Picture()
             pic.data = data
             pic.mime = mimetype
             pic.type = 3
             pic.desc = u'cover'
-            self.__mutagen_file.add_picture(pic)
+            m_file.add_picture(pic)
+
+    def format_filename(self, formatting_pattern: str) -> str:
+        """
+        :param formatting_pattern: Pattern, used to build new track filename.
+        Use names in Track.TAG_ALIASES as keyword parameters for string's format method, to replace it with tag values
+        :return: filename without suffix, it fits into NAME_MAX bytes together with suffix.
+        Current filename is kept, if formatted one is empty or starts with '.' (track would be hidden or lost)
+        """
+        tags = {tag: '' if val is None else val for tag, val in zip(self.TAG_ALIASES, self.__values)}
+        filename = formatting_pattern.format(**tags).replace('/', '_').replace('\0', '')
+        if not filename.strip() or filename.startswith('.'):
+            return self.get_path().stem
+        return fit_filename(filename, self.get_path().suffix)
 
     @classmethod
-    def rename(cls, filepath: Path, formatting_pattern: str):
+    def rename(cls, filepath: Path, formatting_pattern: str) -> Path:
         """
         rename track due to it's tags
         :param filepath: original path to file
-        :param formatting_pattern: Pattern, used to build new track filename.
-        Use names in Track.TAG_ALIASES as keyword parameters for string's format method, to replace it with tag values
-        :return:
+        :param formatting_pattern: look at Track.format_filename
+        :return: new path to file
         """
-        track = cls(filepath)
-        tags = {tag: '' if val is None else val for tag, val in track.get_tags().items()}
+        filename = cls(filepath).format_filename(formatting_pattern)
+        if filename != filepath.stem:
+            new_filepath = filepath.parent / (filename + filepath.suffix)
+            filepath.rename(new_filepath)
+            return new_filepath
 
-        filename = formatting_pattern.format(**tags)
-        if filename is not filepath.stem:
-            filepath.rename(filepath.parent + filename + filepath.suffix)
+        return filepath
@@ -0,0 +1,107 @@
+import typing as typ
+from pathlib import Path
+
+from mulima.track_processor import Track
+from mulima.index import TrackIndex, StatSignature
+from mulima.executor import UpdateExecutor
+from mulima.scanner import DirectoryEntries, scan_directories, scan_directory
+
+
+class TreeCache:
+    """
+    directories and tracks of one tree, shared by updates of archives, which are placed in this tree,
+    so every directory is walked once and every track is loaded once, even if several archives claim it.
+    Cached tracks are validated by stat signatures, directories, which were changed by update, are rescanned
+    """
+    root: Path
+    executor: UpdateExecutor
+
+    def __init__(self, root: Path, executor: UpdateExecutor):
+        self.root = root
+        self.executor = executor
+
+        self.__directory_entries: typ.Optional[typ.Dict[Path, DirectoryEntries]] = None
+        self.__stale_directories: typ.Set[Path] = set()
+        self.__tracks: typ.Dict[Path, typ.Tuple[StatSignature, Track]] = dict()
+
+    def _get_directory_entries(self) -> typ.Dict[Path, DirectoryEntries]:
+        if self.__directory_entries is None:
+            self.__directory_entries = {
+                directory_entries.path: directory_entries
+                for directory_entries in scan_directories(self.root, skip_dirnames={TrackIndex.STATE_DIRNAME})
+            }
+
+        for directory in self.__stale_directories:
+            if directory.is_dir():
+                self.__directory_entries[directory] = scan_directory(directory)
+            else:
+                self.__directory_entries.pop(directory, None)
+        self.__stale_directories.clear()
+
+        return self.__directory_entries
+
+    def scan(self, path: Path) -> typ.Iterator[DirectoryEntries]:
+        """
+        yields directories of subtree in the same order as scan_directories does
+        """
+        directory_entries = self._get_directory_entries()
+        subtree = [directory for directory in directory_entries
+                   if directory == path or path in directory.parents]
+        for directory in sorted(subtree, key=lambda directory: directory.parts):
+            yield directory_entries[directory]
+
+    def load_tracks(self, filepath_list: typ.Iterable[Path], *,
+                    on_done: typ.Optional[typ.Callable[[Path], None]] = None
+                    ) -> typ.Tuple[typ.List[Track], typ.List[Track]]:
+        """
+        takes track from cache, if it's file has not changed since it was loaded or written, otherwise loads it.
+        Signatures of files are taken from stat results of scan, only files, which were not scanned, are stat
+        :return: tracks in order of filepath_list and tracks, which were really loaded
+        """
+        filepath_list = list(filepath_list)
+        directory_entries = self._get_directory_entries()
+        scanned_signature_by_path = dict()
+        for directory in {filepath.parent for filepath in filepath_list}:
+            if directory in directory_entries:
+                scanned_signature_by_path.update((track_entry.path, StatSignature.from_stat(track_entry.stat))
+                                                 for track_entry in directory_entries[directory].tracks)
+
+        unscanned_filepath_list = [filepath for filepath in filepath_list if filepath not in scanned_signature_by_path]
+        scanned_signature_by_path.update(zip(unscanned_filepath_list,
+                                             self.executor.get_signatures(unscanned_filepath_list)))
+        signature_by_path = {filepath: scanned_signature_by_path[filepath] for filepath in filepath_list}
+
+        tracks_by_path, filepaths_to_load = dict(), list()
+        for filepath, signature in signature_by_path.items():
+            cached_signature, track = self.__tracks.get(filepath, (None, None))
+            if cached_signature == signature:
+                tracks_by_path[filepath] = track
+            else:
+                filepaths_to_load.append(filepath)
+
+        loaded_track_list = self.executor.load_tracks(filepaths_to_load, on_done=on_done)
+        for filepath, track in zip(filepaths_to_load, loaded_track_list):
+            self.__tracks[filepath] = (signature_by_path[filepath], track)
+            tracks_by_path[filepath] = track
+
+        return [tracks_by_path[filepath] for filepath in filepath_list], loaded_track_list
+
+    def register(self, track_list: typ.List[Track], renamed_filepaths: typ.Dict[Path, Path],
+                 signatures: typ.List[StatSignature]):
+        """
+        remembers state of tracks after update: their new paths and stat signatures
+        """
+        for old_filepath, new_filepath in renamed_filepaths.items():
+            self.__tracks.pop(old_filepath, None)
+            self.__stale_directories.update((old_filepath.parent, new_filepath.parent))
+
+        for track, signature in zip(track_list, signatures):
+            filepath = renamed_filepaths.get(track.get_path(), track.get_path())
+            if filepath != track.get_path():
+                track.relocate(filepath)
+
+            cached_signature, _ = self.__tracks.get(filepath, (None, None))
+            if cached_signature != signature:
+                # stat results of scanned directory are outdated
+                self.__stale_directories.add(filepath.parent)
+            self.__tracks[filepath] = (signature, track)
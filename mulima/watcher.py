@@ -0,0 +1,339 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+import typing as typ
+from pathlib import Path
+
+from mulima.archive import ABCArchive
+from mulima.index import TrackIndex, StatSignature
+from mulima.renamer import RenamePlan
+from mulima.scanner import is_picture
+from mulima.track_processor import Track
+
+logger = logging.getLogger(__name__)
+
+
+class _Inotify:
+    """
+    minimal recursive inotify binding over libc
+    """
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_ISDIR = 0x40000000
+    IN_Q_OVERFLOW = 0x00004000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    WATCH_MASK = IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c')
+        if libc_name is None:
+            raise OSError('libc is not found')
+
+        self.__libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self.__libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        self.__directory_by_wd: typ.Dict[int, Path] = dict()
+
+    def add_watch(self, directory: Path):
+        wd = self.__libc.inotify_add_watch(self.fd, os.fsencode(directory), self.WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for '{directory}'")
+        self.__directory_by_wd[wd] = directory
+
+    def remove_watches(self, directory: Path):
+        """
+        stops watching of directory and it's subdirectories
+        """
+        for wd, watched_directory in list(self.__directory_by_wd.items()):
+            if watched_directory == directory or directory in watched_directory.parents:
+                # watch of deleted directory is already removed by kernel, so errors are ignored
+                self.__libc.inotify_rm_watch(self.fd, wd)
+                del self.__directory_by_wd[wd]
+
+    def read_events(self, timeout: typ.Optional[float]) -> typ.List[typ.Tuple[Path, int]]:
+        """
+        :return: path and mask of every event, path is None if events queue was overflowed
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events, offset = list(), 0
+        while offset < len(data):
+            wd, mask, _, name_length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = data[offset:offset + name_length].rstrip(b'\0')
+            offset += name_length
+
+            if mask & self.IN_Q_OVERFLOW:
+                events.append((None, mask))
+                continue
+
+            directory = self.__directory_by_wd.get(wd)
+            if directory is not None:
+                events.append((directory / os.fsdecode(name) if name else directory, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class ArchiveWatcher:
+    """
+    long-running watch mode of archive: subscribes to inotify events (or polls directories, if inotify
+    is not available), debounces bursts of changes and updates only affected directories.
+    Changes, made by mulima itself (saving and renaming of tracks), are recognized by archive index and ignored.
+    Failed updates (for example, of unreadable track) are logged and watching goes on,
+    failed directory is updated again after it's next change
+    """
+    archive: ABCArchive
+    debounce: float
+    poll_interval: float
+
+    def __init__(self, archive: ABCArchive, *, debounce: float = 2.0, poll_interval: float = 5.0,
+                 use_inotify: typ.Optional[bool] = None, **update_kwargs):
+        """
+        :param debounce: directory is updated after it has no changes during this number of seconds
+        :param poll_interval: interval between directory scans, when inotify is not used
+        :param use_inotify: None means using inotify if it's available, polling otherwise
+        :param update_kwargs: additional arguments of archive.update
+        """
+        self.archive = archive
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.update_kwargs = update_kwargs
+
+        self.__inotify: typ.Optional[_Inotify] = None
+        if use_inotify is None or use_inotify:
+            try:
+                self.__inotify = _Inotify()
+            except (OSError, AttributeError):
+                if use_inotify:
+                    raise
+
+        self.__stop_event = threading.Event()
+        # changed paths and time of the last change for every dirty directory
+        self.__changed_paths: typ.Dict[Path, typ.Set[Path]] = dict()
+        self.__last_change_time: typ.Dict[Path, float] = dict()
+        self.__poll_snapshot: typ.Dict[Path, typ.Dict[str, typ.Tuple[int, int]]] = dict()
+        self.__full_update_needed = False
+
+    def uses_inotify(self) -> bool:
+        return self.__inotify is not None
+
+    def _walk_directories(self, root: typ.Optional[Path] = None) -> typ.Iterator[Path]:
+        """
+        :param root: subdirectory of archive, which tree is walked, None means the whole archive
+        """
+        for dirpath, dirnames, _ in os.walk(self.archive.path if root is None else root):
+            if TrackIndex.STATE_DIRNAME in dirnames:
+                dirnames.remove(TrackIndex.STATE_DIRNAME)
+            yield Path(dirpath)
+
+    def _watch_tree(self):
+        for directory in self._walk_directories():
+            self.__inotify.add_watch(directory)
+
+    def _snapshot_directory(self, directory: Path) -> typ.Dict[str, typ.Tuple[int, int]]:
+        snapshot = dict()
+        try:
+            with os.scandir(directory) as dir_entries:
+                for dir_entry in dir_entries:
+                    if dir_entry.is_file(follow_symlinks=False):
+                        stat_result = dir_entry.stat()
+                        snapshot[dir_entry.name] = (stat_result.st_size, stat_result.st_mtime_ns)
+        except FileNotFoundError:
+            pass
+        return snapshot
+
+    def _poll(self) -> typ.List[Path]:
+        changed_paths = list()
+        current_directories = set()
+        for directory in self._walk_directories():
+            current_directories.add(directory)
+            snapshot = self._snapshot_directory(directory)
+            previous_snapshot = self.__poll_snapshot.get(directory, dict())
+
+            for name in snapshot.keys() | previous_snapshot.keys():
+                if snapshot.get(name) != previous_snapshot.get(name):
+                    changed_paths.append(directory / name)
+            self.__poll_snapshot[directory] = snapshot
+
+        for directory in set(self.__poll_snapshot) - current_directories:
+            changed_paths.extend(directory / name for name in self.__poll_snapshot.pop(directory))
+        return changed_paths
+
+    def _is_relevant(self, path: Path) -> bool:
+        return (Track.could_created_from(path) or is_picture(path)) and \
+            not path.name.startswith(RenamePlan.TEMP_FILENAME_PREFIX) and \
+            TrackIndex.STATE_DIRNAME not in path.relative_to(self.archive.path).parts
+
+    def _is_own_change(self, path: Path) -> bool:
+        """
+        :return: True if path is a track in the state, which mulima left it after the last update
+        """
+        if not Track.could_created_from(path):
+            return False
+
+        try:
+            signature = StatSignature.from_path(path)
+        except FileNotFoundError:
+            # mulima renamed it or it was not a track of archive
+            return self.archive.index.get_signature(path) is None
+        return self.archive.index.is_actual(path, signature)
+
+    def _register_changes(self, paths: typ.Iterable[typ.Optional[Path]]):
+        now = time.monotonic()
+        for path in paths:
+            if path is None:
+                # events were lost, so the whole archive should be checked
+                self.__full_update_needed = True
+                continue
+            if not self._is_relevant(path):
+                continue
+
+            directory = path.parent
+            self.__changed_paths.setdefault(directory, set()).add(path)
+            self.__last_change_time[directory] = now
+
+    def _collect_due_directories(self) -> typ.List[Path]:
+        now = time.monotonic()
+        due_directories = list()
+        for directory, last_change_time in list(self.__last_change_time.items()):
+            if now - last_change_time >= self.debounce:
+                changed_paths = self.__changed_paths.pop(directory)
+                del self.__last_change_time[directory]
+
+                if not all(self._is_own_change(path) for path in changed_paths):
+                    due_directories.append(directory)
+        return sorted(due_directories)
+
+    def process_pending(self, *, force: bool = False):
+        """
+        updates directories, which changes are debounced
+        :param force: if True directories are updated without waiting for debounce
+        """
+        if force:
+            for directory in self.__last_change_time:
+                self.__last_change_time[directory] = float('-inf')
+
+        if self.__full_update_needed:
+            self.__full_update_needed = False
+            self.__changed_paths.clear()
+            self.__last_change_time.clear()
+            try:
+                self.archive.update(new_only=True, **self.update_kwargs)
+            except Exception:
+                logger.exception("update of archive '%s' failed", self.archive.path)
+            return
+
+        due_directories = self._collect_due_directories()
+        if not due_directories:
+            return
+
+        # directories are updated together, so tracks moved between them are recognized
+        try:
+            self.archive.update(new_only=False, directories=due_directories, **self.update_kwargs)
+            return
+        except Exception:
+            if len(due_directories) == 1:
+                logger.exception("update of directory '%s' failed", due_directories[0])
+                return
+
+        # one broken track should not stop update of other directories
+        for directory in due_directories:
+            try:
+                self.archive.update(new_only=False, directories=[directory], **self.update_kwargs)
+            except Exception:
+                logger.exception("update of directory '%s' failed", directory)
+
+    def _watch_new_directory(self, directory: Path):
+        """
+        watches created (or moved in) directory tree and registers it's files as changed
+        """
+        for subdirectory in self._walk_directories(directory):
+            try:
+                self.__inotify.add_watch(subdirectory)
+                names = os.listdir(subdirectory)
+            except FileNotFoundError:
+                # directory was removed right after it was created
+                continue
+            self._register_changes(subdirectory / name for name in names)
+
+    def _forget_directory(self, directory: Path):
+        """
+        stops watching of deleted (or moved out) directory tree, drops it's pending changes and
+        schedules update of it's indexed directories, so records of their tracks are moved or removed
+        """
+        self.__inotify.remove_watches(directory)
+
+        def is_in_tree(path: Path) -> bool:
+            return path == directory or directory in path.parents
+
+        for pending_directory in [path for path in self.__changed_paths if is_in_tree(path)]:
+            del self.__changed_paths[pending_directory]
+            del self.__last_change_time[pending_directory]
+
+        now = time.monotonic()
+        for indexed_directory in self.archive.index.directories():
+            if is_in_tree(indexed_directory):
+                # directory itself is not a track, so it's never taken for own change
+                self.__changed_paths[indexed_directory] = {indexed_directory}
+                self.__last_change_time[indexed_directory] = now
+
+    def _process_inotify_events(self, events: typ.List[typ.Tuple[typ.Optional[Path], int]]):
+        for path, mask in events:
+            if path is None or not mask & _Inotify.IN_ISDIR:
+                self._register_changes([path])
+            elif mask & (_Inotify.IN_CREATE | _Inotify.IN_MOVED_TO):
+                self._watch_new_directory(path)
+            elif mask & (_Inotify.IN_DELETE | _Inotify.IN_MOVED_FROM):
+                self._forget_directory(path)
+
+    def run(self):
+        """
+        watches archive until stop() is called
+        """
+        if self.__inotify is not None:
+            self._watch_tree()
+        else:
+            self._poll()
+
+        while not self.__stop_event.is_set():
+            if self.__inotify is not None:
+                self._process_inotify_events(self.__inotify.read_events(timeout=min(self.debounce, 1.0)))
+            else:
+                self.__stop_event.wait(self.poll_interval)
+                self._register_changes(self._poll())
+
+            self.process_pending()
+
+    def stop(self):
+        self.__stop_event.set()
+
+    def close(self):
+        self.stop()
+        if self.__inotify is not None:
+            self.__inotify.close()
+            self.__inotify = None
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import pytest
+
+from mulima.aio import AsyncArchiveUpdate, AsyncTrackIO, update_archive
+from mulima.archive import ArtistArchive
+from mulima.index import StatSignature
+from mulima.metrics import UpdateCallbacks, UpdateCancelled
+from tests.conftest import make_flac
+
+
+@pytest.fixture
+def archive(tmp_path):
+    for number in range(5):
+        make_flac(tmp_path / f'{number}.flac', {'title': f'Track {number}'})
+    return ArtistArchive(str(tmp_path), ['Artist'])
+
+
+def test_update_streams_progress(archive):
+    async def run():
+        update = AsyncArchiveUpdate(archive, new_only=True)
+        task = asyncio.ensure_future(update.run())
+        events = [event async for event in update.events()]
+        return events, await task
+
+    events, report = asyncio.run(run())
+
+    assert report.counters['files_saved'] == 5
+    assert [event.name for event in events if event.kind == 'phase_start'] == \
+        ['discovery', 'load', 'tags', 'write', 'rename', 'index']
+    assert sum(1 for event in events if event.kind == 'file_done' and event.name == 'write') == 5
+    assert not archive.callbacks
+
+
+def test_cancelled_update_stops_between_files(archive):
+    cancelled = threading.Event()
+
+    class WaitingCallbacks(UpdateCallbacks):
+        def on_phase_start(self, phase):
+            if phase == 'write':
+                cancelled.wait(timeout=10)
+
+    archive.callbacks.append(WaitingCallbacks())
+
+    async def run():
+        update = AsyncArchiveUpdate(archive, new_only=True)
+        task = asyncio.ensure_future(update.run())
+        async for event in update.events():
+            if event.kind == 'file_done':
+                update.cancel()
+                cancelled.set()
+        await task
+
+    with pytest.raises(UpdateCancelled):
+        asyncio.run(run())
+
+    # nothing was written and indexed, so the next update does all the work
+    assert list(archive.index.paths()) == []
+    archive.callbacks.clear()
+    assert asyncio.run(update_archive(archive, new_only=True)).counters['files_saved'] == 5
+
+
+def test_track_io(archive):
+    async def run():
+        track_io = AsyncTrackIO(max_concurrency=2)
+        track_list = await track_io.load_many(sorted(archive.path.glob('*.flac')))
+        track_list[0].set_tag('artist', 'Artist')
+        written_bytes = await track_io.write(track_list[0])
+        return written_bytes, await track_io.rename(track_list[0].get_path(), '{artist} - {title}')
+
+    written_bytes, new_path = asyncio.run(run())
+    assert written_bytes > 0
+    assert new_path.name == 'Artist - Track 0.flac'
+    assert StatSignature.from_path(new_path).size > 0
+
+
+def test_cancelled_discovery_stops_between_files(archive):
+    update = AsyncArchiveUpdate(archive, new_only=True)
+    scanned_paths = list()
+
+    class CancellingCallbacks(UpdateCallbacks):
+        def on_file_done(self, phase, path):
+            scanned_paths.append(path)
+            update.cancel()
+
+    archive.callbacks.append(CancellingCallbacks())
+
+    async def run():
+        task = asyncio.ensure_future(update.run())
+        events = [event async for event in update.events()]
+        with pytest.raises(UpdateCancelled):
+            await task
+        return events
+
+    events = asyncio.run(run())
+
+    assert [event.name for event in events if event.kind == 'phase_start'] == ['discovery']
+    assert len(scanned_paths) == 1
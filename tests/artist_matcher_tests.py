@@ -0,0 +1,30 @@
+import pytest
+
+from mulima.artist_matcher import ArtistMatcher
+
+
+@pytest.mark.parametrize('matcher_kwargs, value, is_matched', [
+    (dict(), 'A & B (feat C)', True),
+    (dict(), 'a & b', False),
+    (dict(case_sensitive=False), 'a & b', True),
+    (dict(case_sensitive=False), 'STRASSE', True),
+    (dict(), 'ABBA', True),
+    (dict(whole_words=True), 'ABBA', False),
+    (dict(whole_words=True), 'B (feat C)', True),
+    (dict(whole_words=True), 'feat. Straße', True),
+])
+def test_matches(matcher_kwargs, value, is_matched):
+    matcher = ArtistMatcher(['A', 'B', 'Straße'], **matcher_kwargs)
+    assert matcher.matches(value) is is_matched
+    assert matcher.match_many([value]) == [is_matched]
+
+
+def test_match_many_keeps_order():
+    matcher = ArtistMatcher(['Kino', 'Кино'], case_sensitive=False, whole_words=True)
+    values = ['кино', 'Kinoteatr', 'Kino & Friends', 'кино', '']
+    assert matcher.match_many(values) == [True, False, True, True, False]
+    assert matcher.match_many(values) == [matcher.matches(value) for value in values]
+
+
+def test_empty_names():
+    assert ArtistMatcher([]).match_many(['A']) == [False]
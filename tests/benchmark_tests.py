@@ -0,0 +1,18 @@
+from benchmarks.library_generator import generate_library
+from benchmarks.update_benchmark import main
+from mulima.track_processor import Track
+
+
+def test_generated_library_is_readable(tmp_path):
+    library = generate_library(tmp_path, artists=2, albums_per_artist=2, tracks_per_album=3,
+                               duplicate_tracknumbers_share=1)
+
+    assert library.get_tracks_count() == 12
+    assert {path.suffix for album in library.albums for path in album.track_paths} == {'.mp3', '.flac'}
+    for album in library.albums:
+        assert [Track(path).get_tag('tracknumber') for path in album.track_paths] == ['1', '1', '1']
+
+
+def test_benchmark_runs(capsys):
+    main(['--artists', '1', '--albums', '1', '--tracks', '2', '--modes', 'serial', '--json'])
+    assert capsys.readouterr().out.count('files_per_sec') == 4
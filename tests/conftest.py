@@ -0,0 +1,24 @@
+import shutil
+import pytest
+from pathlib import Path
+
+from benchmarks.library_generator import make_flac
+
+SOURCE_TRACK_PATH = Path(__file__).parent / 'data' / 'file.mp3'
+
+
+def make_track(path: Path, tags: dict) -> Path:
+    """
+    flac track with audio frames stand-in, which differs for every title
+    """
+    make_flac(path, tags)
+    with open(path, 'ab') as file:
+        file.write(tags['title'].encode() * 1000)
+    return path
+
+
+@pytest.fixture
+def mp3_path(tmp_path):
+    path = tmp_path / 'file.mp3'
+    shutil.copy2(SOURCE_TRACK_PATH, path)
+    return path
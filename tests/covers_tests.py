@@ -0,0 +1,44 @@
+import pytest
+from PIL import Image
+
+from mulima.covers import CoverCache
+
+
+@pytest.fixture
+def picture_path(tmp_path):
+    path = tmp_path / 'cover.jpg'
+    Image.new('RGB', (800, 400), 'red').save(path)
+    return path
+
+
+def test_cover_is_downscaled_and_encoded(tmp_path, picture_path):
+    cover = CoverCache(tmp_path / 'cache', (600, 600)).get(picture_path)
+
+    assert cover.mimetype == 'image/jpeg'
+    assert cover.data.startswith(b'\xff\xd8')
+    assert (tmp_path / 'cache').exists()
+
+
+def test_cover_is_reused_from_disk(tmp_path, picture_path, monkeypatch):
+    cover = CoverCache(tmp_path / 'cache', (600, 600)).get(picture_path)
+
+    new_cache = CoverCache(tmp_path / 'cache', (600, 600))
+    monkeypatch.setattr(new_cache, '_prepare', lambda _: pytest.fail('picture should not be decoded again'))
+    assert new_cache.get(picture_path) == cover
+
+
+def test_transparent_picture_is_encoded_as_png(tmp_path):
+    path = tmp_path / 'cover.png'
+    Image.new('RGBA', (10, 10), (0, 0, 0, 0)).save(path)
+
+    assert CoverCache(tmp_path / 'cache', (600, 600)).get(path).mimetype == 'image/png'
+
+
+def test_replaced_picture_is_prepared_again(tmp_path, picture_path):
+    cache = CoverCache(tmp_path / 'cache', (600, 600))
+    cover = cache.get(picture_path)
+
+    Image.new('RGB', (300, 300), 'blue').save(picture_path)
+
+    assert cache.get(picture_path) != cover
+    assert cache.get(picture_path) == CoverCache(tmp_path / 'new_cache', (600, 600)).get(picture_path)
@@ -0,0 +1,43 @@
+import shutil
+import pytest
+from pathlib import Path
+
+from mulima.executor import UpdateExecutor
+from tests.conftest import SOURCE_TRACK_PATH
+
+
+@pytest.fixture
+def track_paths(tmp_path):
+    paths = list()
+    for i in range(8):
+        path = Path(tmp_path, f'dir{i % 3}', f'{i}.mp3')
+        path.parent.mkdir(exist_ok=True)
+        shutil.copy2(SOURCE_TRACK_PATH, path)
+        paths.append(path)
+    return paths
+
+
+def test_map_keeps_order():
+    with UpdateExecutor(max_workers=4) as executor:
+        assert executor.map(lambda x: x * 2, range(100), path_of=lambda _: Path('.')) == list(range(0, 200, 2))
+
+
+def test_wrong_limits():
+    with pytest.raises(ValueError):
+        UpdateExecutor(max_workers=0)
+    with pytest.raises(ValueError):
+        UpdateExecutor(max_workers_per_device=0)
+
+
+@pytest.mark.parametrize('executor_kwargs', [
+    dict(max_workers=4),
+    dict(max_workers=4, max_workers_per_device=2),
+    dict(max_workers=2, parse_in_processes=True),
+])
+def test_parallel_loading_matches_serial(track_paths, executor_kwargs):
+    serial_tracks = UpdateExecutor().load_tracks(track_paths)
+    with UpdateExecutor(**executor_kwargs) as executor:
+        parallel_tracks = executor.load_tracks(track_paths)
+
+    assert [track.get_path() for track in parallel_tracks] == track_paths
+    assert [track.get_tags() for track in parallel_tracks] == [track.get_tags() for track in serial_tracks]
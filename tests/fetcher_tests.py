@@ -0,0 +1,209 @@
+import io
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from PIL import Image
+
+from mulima.covers import CoverCache
+from mulima.fetcher import (COVER, LYRICS, ConnectionPool, FetchCache, Fetcher, FetchQuery, RateLimiter,
+                            UrlTemplateProvider)
+from mulima.track_processor import Track
+from tests.conftest import make_flac
+
+
+
+def make_picture_data(size, picture_format: str) -> bytes:
+    data = io.BytesIO()
+    Image.new('RGB', size, 'red').save(data, format=picture_format)
+    return data.getvalue()
+
+
+COVER_DATA = make_picture_data((1200, 900), 'PNG')
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    local stand-in of cover and lyrics provider, it remembers requested paths and client connections
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StandInHandler)
+        self.paths = list()
+        self.client_ports = set()
+        self.items = {
+            '/covers/Artist/Album': (COVER_DATA, 'image/png'),
+            '/covers/Artist/Broken': (b'<html>not found</html>', 'image/png'),
+            '/lyrics/Artist/First': ('la la la'.encode(), 'text/plain; charset=utf-8'),
+        }
+        self.failing_prefixes = {'/broken/'}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address
+        return f'http://{host}:{port}'
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        self.server.client_ports.add(self.client_address[1])
+
+        if any(self.path.startswith(prefix) for prefix in self.server.failing_prefixes):
+            status, (body, content_type) = 503, (b'', 'text/plain')
+        elif self.path in self.server.items:
+            status, (body, content_type) = 200, self.server.items[self.path]
+        else:
+            status, (body, content_type) = 404, (b'', 'text/plain')
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = StandInServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_fetcher(server, tmp_path, **kwargs) -> Fetcher:
+    providers = [
+        UrlTemplateProvider('covers', [COVER], server.url + '/covers/{artist}/{album}'),
+        UrlTemplateProvider('broken', [LYRICS], server.url + '/broken/{artist}/{title}'),
+        UrlTemplateProvider('lyrics', [LYRICS], server.url + '/lyrics/{artist}/{title}'),
+    ]
+    return Fetcher(providers, cache=FetchCache(tmp_path / 'cache'), **kwargs)
+
+
+@pytest.fixture
+def album_tracks(tmp_path):
+    track_list = list()
+    for title in ['First', 'Second', 'Third']:
+        path = make_flac(tmp_path / f'{title}.flac', {'title': title, 'artist': 'Artist', 'album': 'Album'})
+        track_list.append(Track(path))
+    return track_list
+
+
+@pytest.fixture
+def cover_cache(tmp_path):
+    return CoverCache(tmp_path / 'covers', (600, 600))
+
+
+def test_one_fetch_per_album(server, tmp_path, album_tracks, cover_cache):
+    with make_fetcher(server, tmp_path, max_concurrency=3) as fetcher:
+        assert fetcher.fetch_covers(album_tracks, cover_cache) == 3
+
+    assert server.paths == ['/covers/Artist/Album']
+    for track in album_tracks:
+        track.write()
+        data, mimetype = Track(track.get_path()).get_cover()
+        # fetched picture is downscaled and encoded like pictures of archive
+        assert mimetype == 'image/jpeg'
+        with Image.open(io.BytesIO(data)) as picture:
+            assert picture.size == (600, 450)
+
+
+def test_answer_which_is_not_picture_is_skipped(server, tmp_path, album_tracks, cover_cache):
+    for track in album_tracks:
+        track.set_tag('album', 'Broken')
+
+    with make_fetcher(server, tmp_path) as fetcher:
+        assert fetcher.fetch_covers(album_tracks, cover_cache) == 0
+    assert not any(track.has_pending_cover() for track in album_tracks)
+
+
+def test_connections_are_reused(server, tmp_path):
+    with make_fetcher(server, tmp_path, max_concurrency=1) as fetcher:
+        queries = [FetchQuery(COVER, 'Artist', album=f'Album {number}') for number in range(5)]
+        assert fetcher.fetch_many(queries) == dict.fromkeys(queries)
+        assert fetcher.pool.connections_opened == 1
+
+    assert len(server.paths) == 5
+    assert len(server.client_ports) == 1
+
+
+def test_cache(server, tmp_path, album_tracks, cover_cache):
+    with make_fetcher(server, tmp_path) as fetcher:
+        fetcher.fetch_covers(album_tracks, cover_cache)
+        assert fetcher.fetch(FetchQuery(COVER, 'Artist', album='Unknown')) is None
+
+    with make_fetcher(server, tmp_path) as fetcher:
+        assert fetcher.fetch(FetchQuery(COVER, 'Artist', album='Album')).data == COVER_DATA
+        assert fetcher.fetch(FetchQuery(COVER, 'Artist', album='Unknown')) is None
+
+    assert server.paths == ['/covers/Artist/Album', '/covers/Artist/Unknown']
+
+
+def test_cache_ttl(tmp_path):
+    now = 1000.0
+    cache = FetchCache(tmp_path, ttl=100, negative_ttl=10, clock=lambda: now)
+    found_query, missed_query = FetchQuery(COVER, 'A', album='B'), FetchQuery(COVER, 'A', album='C')
+    cache.put(found_query, None)
+    cache.put(missed_query, None)
+    cache.put(found_query, (b'data', 'image/png'))
+
+    now += 50
+    assert cache.get(found_query) == (True, (b'data', 'image/png'))
+    assert cache.get(missed_query) == (False, None)
+    now += 100
+    assert cache.get(found_query) == (False, None)
+    cache.close()
+
+
+def test_failed_provider_is_skipped_and_not_cached(server, tmp_path):
+    track = Track(make_flac(tmp_path / 'First.flac', {'title': 'First', 'artist': 'Artist'}))
+
+    with make_fetcher(server, tmp_path) as fetcher:
+        assert fetcher.fetch_lyrics([track]) == 1
+    assert track.get_tag('lyrics') == 'la la la'
+
+    with make_fetcher(server, tmp_path) as fetcher:
+        assert fetcher.fetch(FetchQuery(LYRICS, 'Artist', title='Second')) is None
+        assert fetcher.fetch(FetchQuery(LYRICS, 'Artist', title='Second')) is None
+    assert server.paths.count('/broken/Artist/Second') == 2
+    assert server.paths.count('/lyrics/Artist/Second') == 2
+
+
+def test_rate_limiter():
+    now, sleeps = 0.0, list()
+    rate_limiter = RateLimiter(1.0, intervals_by_host={'slow': 5.0}, clock=lambda: now, sleep=sleeps.append)
+
+    for host in ['fast', 'fast', 'slow', 'slow', 'fast']:
+        rate_limiter.wait(host)
+
+    assert sleeps == [1.0, 5.0, 2.0]
+
+
+@pytest.mark.parametrize('suffix', ['flac', 'mp3'])
+def test_lyrics_tag(tmp_path, mp3_path, suffix):
+    path = make_flac(tmp_path / 'track.flac', {'title': 'Title'}) if suffix == 'flac' else mp3_path
+    track = Track(path)
+    track.set_tag('lyrics', 'first line\nsecond line')
+    track.write()
+
+    assert Track(path).get_tag('lyrics') == 'first line\nsecond line'
+
+    track.remove_tag('lyrics')
+    track.write()
+    assert Track(path).get_tag('lyrics') is None
+
+
+def test_pool_limits(server):
+    pool = ConnectionPool(max_per_host=1)
+    assert pool.request(server.url + '/covers/Artist/Album').body == COVER_DATA
+    assert pool.request(server.url + '/missing').status == 404
+    assert pool.connections_opened == 1
+    pool.close()
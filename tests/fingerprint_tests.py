@@ -0,0 +1,125 @@
+import shutil
+
+import pytest
+
+from mulima.archive import ArtistArchive
+from mulima.fingerprint import FingerprintIndex, get_payload_digest, _hash_file_region
+from mulima.index import TrackIndex
+from mulima.library import Library
+from mulima.tag_regions import get_payload_range
+from mulima.track_processor import Track
+from tests.conftest import make_track
+
+
+@pytest.fixture
+def archive(tmp_path):
+    album_path = tmp_path / 'artist' / 'album'
+    album_path.mkdir(parents=True)
+    make_track(album_path / 'First.flac', {'title': 'First', 'artist': 'Artist'})
+    make_track(album_path / 'Second.flac', {'title': 'Second', 'artist': 'Artist'})
+
+    archive = ArtistArchive(str(tmp_path / 'artist'), ['Artist'], fingerprint_tracks=True)
+    archive.update(new_only=True)
+    return archive
+
+
+def test_digest_does_not_depend_on_tags(tmp_path):
+    path = tmp_path / 'track.flac'
+    make_track(path, {'title': 'Title'})
+    digest = get_payload_digest(path)
+
+    track = Track(path)
+    track.set_tag('album', 'Album' * 100)
+    track.write()
+
+    assert get_payload_digest(path) == digest
+
+
+def test_mapped_and_read_digests_are_equal(tmp_path):
+    path = tmp_path / 'track.flac'
+    make_track(path, {'title': 'Title'})
+    start, end = get_payload_range(path)
+
+    assert get_payload_digest(path, chunk_size=7) == get_payload_digest(path)
+    with open(path, 'rb') as file:
+        file.seek(start)
+        payload = file.read(end - start)
+    (tmp_path / 'payload').write_bytes(payload)
+    assert _hash_file_region(tmp_path / 'payload', 0, len(payload), 7) == get_payload_digest(path)
+
+
+def test_renamed_track_is_not_loaded(tmp_path):
+    album_path = tmp_path / 'artist' / 'album'
+    album_path.mkdir(parents=True)
+    make_track(album_path / 'First.flac', {'title': 'First', 'artist': 'Artist'})
+    archive = ArtistArchive(str(tmp_path / 'artist'), ['Artist'])
+    archive.update(new_only=True)
+
+    (album_path / 'First.flac').rename(album_path / 'Renamed.flac')
+    report = archive.update(new_only=True)
+
+    assert report.counters['files_moved'] == 1
+    assert report.counters['files_opened'] == 0
+    assert list(archive.index.paths()) == [album_path / 'Renamed.flac']
+
+
+def test_copied_track_is_recognized_by_digest(archive):
+    album_path = archive.path / 'album'
+    (archive.path / 'moved').mkdir()
+    shutil.copy2(album_path / 'First.flac', archive.path / 'moved' / 'First.flac')
+    (album_path / 'First.flac').unlink()
+
+    report = archive.update(new_only=True)
+
+    assert report.counters['files_moved'] == 1
+    assert report.counters['files_opened'] == 0
+    assert archive.index.get_tags(archive.path / 'moved' / 'First.flac')['title'] == 'First'
+    assert archive.fingerprints.get(album_path / 'First.flac') is None
+
+
+def test_duplicates_across_archives(archive, tmp_path):
+    other_path = tmp_path / 'other'
+    other_path.mkdir()
+    shutil.copy(archive.path / 'album' / 'Second.flac', other_path / 'Copy.flac')
+    track = Track(other_path / 'Copy.flac')
+    track.set_tag('album', 'Other album')
+    track.write()
+
+    with Library() as library:
+        library.add(archive)
+        library.add_album_archive(str(other_path), 'Other album')
+        assert archive.find_duplicates() == {}
+        duplicates = library.find_duplicates()
+
+    assert list(duplicates.values()) == [sorted([(archive.path / 'album' / 'Second.flac').resolve(),
+                                                 (other_path / 'Copy.flac').resolve()])]
+
+
+def test_fingerprints_are_opened_only_when_used(tmp_path):
+    make_track(tmp_path / 'First.flac', {'title': 'First', 'artist': 'Artist'})
+    fingerprints_path = tmp_path / TrackIndex.STATE_DIRNAME / FingerprintIndex.FILENAME
+
+    with ArtistArchive(str(tmp_path), ['Artist']) as archive:
+        archive.update(new_only=True)
+        assert not fingerprints_path.exists()
+
+        assert archive.find_duplicates() == {}
+        assert fingerprints_path.exists()
+
+
+def test_only_scanned_directories_are_searched_for_moves(archive, monkeypatch):
+    album_path, other_path = archive.path / 'album', archive.path / 'other'
+    other_path.mkdir()
+    (album_path / 'Second.flac').rename(other_path / 'Second.flac')
+    make_track(other_path / 'Third.flac', {'title': 'Third', 'artist': 'Artist'})
+
+    # missing tracks of scanned directories are known without touching the filesystem
+    path_class = type(album_path)
+    original_exists = path_class.exists
+    monkeypatch.setattr(path_class, 'exists', lambda path: pytest.fail(f'{path} should not be checked')
+                        if path.suffix == '.flac' else original_exists(path))
+    report = archive.update(new_only=True, directories=[album_path, other_path])
+
+    assert report.counters['files_moved'] == 1
+    assert report.counters['files_opened'] == 1
+    assert sorted(path.name for path in archive.index.paths()) == ['First.flac', 'Second.flac', 'Third.flac']
@@ -0,0 +1,73 @@
+import shutil
+
+import pytest
+
+from mulima.archive import ArtistArchive
+from mulima.id3v1 import strip_id3v1
+from mulima.tag_regions import get_id3v1_size, get_payload_range
+from tests.conftest import SOURCE_TRACK_PATH
+
+
+def make_id3v1(title: bytes = b'') -> bytes:
+    return b'TAG' + title.ljust(30, b'\0') + bytes(94) + b'\xff'
+
+
+def make_id3v1_extended() -> bytes:
+    return b'TAG+' + bytes(223)
+
+
+@pytest.fixture
+def archive_path(tmp_path):
+    (tmp_path / 'album').mkdir()
+    shutil.copy2(SOURCE_TRACK_PATH, tmp_path / 'album' / 'plain.mp3')
+    shutil.copy2(SOURCE_TRACK_PATH, tmp_path / 'album' / 'tagged.mp3')
+    shutil.copy2(SOURCE_TRACK_PATH, tmp_path / 'album' / 'extended.mp3')
+    with open(tmp_path / 'album' / 'tagged.mp3', 'ab') as file:
+        file.write(make_id3v1(b'filename'))
+    with open(tmp_path / 'album' / 'extended.mp3', 'ab') as file:
+        file.write(make_id3v1_extended() + make_id3v1())
+    return tmp_path
+
+
+def test_id3v1_size():
+    assert get_id3v1_size(b'') == 0
+    assert get_id3v1_size(bytes(400)) == 0
+    assert get_id3v1_size(bytes(300) + make_id3v1()) == 128
+    assert get_id3v1_size(make_id3v1_extended() + make_id3v1()) == 355
+    assert get_id3v1_size(b'x' + make_id3v1_extended() + make_id3v1()) == 355
+
+
+def test_strip_keeps_audio(archive_path):
+    path = archive_path / 'album' / 'extended.mp3'
+    start, end = get_payload_range(path)
+    with open(path, 'rb') as file:
+        payload = file.read()[start:end]
+
+    result = strip_id3v1(path)
+
+    assert result.tag_size == 355
+    assert path.stat().st_size == SOURCE_TRACK_PATH.stat().st_size
+    assert result.new_signature.inode == result.old_signature.inode
+    assert path.read_bytes()[start:] == payload
+
+
+def test_dry_run(archive_path):
+    archive = ArtistArchive(str(archive_path), ['AArtist'])
+
+    report = archive.strip_id3v1(dry_run=True)
+
+    assert report.counters['files_found'] == 3
+    assert report.counters['files_stripped'] == 2
+    assert report.counters['bytes_stripped'] == 128 + 355
+    assert (archive_path / 'album' / 'tagged.mp3').stat().st_size == SOURCE_TRACK_PATH.stat().st_size + 128
+
+
+def test_stripped_tracks_are_not_parsed_again(archive_path):
+    archive = ArtistArchive(str(archive_path), ['AArtist'])
+    archive.update(new_only=True)
+
+    report = archive.strip_id3v1()
+    assert report.counters['files_stripped'] == 2
+    assert archive.strip_id3v1().counters['files_stripped'] == 0
+
+    assert archive.update(new_only=True).counters['files_opened'] == 0
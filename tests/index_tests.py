@@ -0,0 +1,58 @@
+import pytest
+from pathlib import Path
+
+from mulima.index import TrackIndex, StatSignature
+
+
+@pytest.fixture
+def index(tmp_path):
+    return TrackIndex(tmp_path, 'test')
+
+
+@pytest.fixture
+def track_path(tmp_path):
+    path = Path(tmp_path, 'album', 'track.mp3')
+    path.parent.mkdir()
+    path.write_bytes(b'data')
+    return path
+
+
+def test_unknown_track_is_not_actual(index, track_path):
+    assert not index.is_actual(track_path, StatSignature.from_path(track_path))
+    assert index.get_tags(track_path) is None
+
+
+def test_indexed_track_is_actual_until_changed(index, track_path):
+    index.put(track_path, StatSignature.from_path(track_path), {'title': 'track'})
+    assert index.is_actual(track_path, StatSignature.from_path(track_path))
+    assert index.get_tags(track_path) == {'title': 'track'}
+
+    track_path.write_bytes(b'changed data')
+    assert not index.is_actual(track_path, StatSignature.from_path(track_path))
+
+
+def test_index_persists_between_instances(tmp_path, track_path):
+    index = TrackIndex(tmp_path, 'test')
+    index.put(track_path, StatSignature.from_path(track_path), {'title': 'track'})
+    index.close()
+
+    assert TrackIndex(tmp_path, 'test').get_tags(track_path) == {'title': 'track'}
+
+
+def test_retain_removes_missed_tracks(index, track_path):
+    index.put(track_path, StatSignature.from_path(track_path), {})
+    index.retain([])
+    assert list(index.paths()) == []
+
+
+def test_records_of_directories_exclude_subdirectories_and_similar_names(index, tmp_path):
+    signature = StatSignature(1, 1, 1)
+    for key in ['root.mp3', 'cd1/a.mp3', 'cd1/sub/b.mp3', 'cd1 bonus/c.mp3', 'cd1.x/d.mp3', 'cd10/e.mp3']:
+        index.put(tmp_path / key, signature, {})
+
+    assert [path.relative_to(tmp_path).as_posix() for path, _, _ in index.records([tmp_path / 'cd1', tmp_path])] == \
+        ['cd1/a.mp3', 'root.mp3']
+
+    index.retain([], directories=[tmp_path / 'cd1'])
+    index.retain_directories([tmp_path / 'cd1', tmp_path / 'cd1' / 'sub', tmp_path / 'cd10'])
+    assert sorted(path.relative_to(tmp_path).as_posix() for path in index.paths()) == ['cd1/sub/b.mp3', 'cd10/e.mp3']
@@ -0,0 +1,109 @@
+import shutil
+
+import pytest
+
+from mulima.archive import AlbumArchive
+from mulima.journal import UpdateJournal
+from mulima.metrics import UpdateCallbacks
+from mulima.track_processor import Track
+from tests.conftest import make_flac
+
+
+class CrashingCallbacks(UpdateCallbacks):
+    """
+    interrupts update on the start of given write phase
+    """
+    def __init__(self, crash_on_write: int):
+        self.crash_on_write = crash_on_write
+        self.writes = 0
+
+    def on_phase_start(self, phase: str):
+        if phase == 'write':
+            self.writes += 1
+            if self.writes == self.crash_on_write:
+                raise RuntimeError('crash')
+
+
+@pytest.fixture
+def archive_path(tmp_path):
+    for directory_name in ['cd1', 'cd2', 'cd3']:
+        (tmp_path / directory_name).mkdir()
+        make_flac(tmp_path / directory_name / 'track.flac', {'title': directory_name, 'tracknumber': '1'})
+    return tmp_path
+
+
+def test_interrupted_update_is_resumed(archive_path):
+    archive = AlbumArchive(str(archive_path), 'Album', callbacks=[CrashingCallbacks(crash_on_write=2)])
+    with pytest.raises(RuntimeError):
+        archive.update(new_only=False, checkpoint_size=1)
+
+    journal = UpdateJournal(archive._get_update_journal_path(), archive.path)
+    pending_batch = journal.get_pending_batch()
+    assert pending_batch['batch'] == ['cd2']
+    assert pending_batch['writes'] == ['cd2/track.flac']
+    assert pending_batch['renames'] == [['cd2/track.flac', 'cd2/1. cd2.flac']]
+
+    archive.callbacks.clear()
+    report = archive.update(new_only=False, checkpoint_size=1)
+
+    assert report.counters['directories_resumed'] == 1
+    assert report.counters['files_opened'] == 2
+    assert not journal.journal_path.exists()
+    assert sorted(path.relative_to(archive_path).as_posix() for path in archive_path.rglob('*.flac')) == \
+        ['cd1/1. cd1.flac', 'cd2/1. cd2.flac', 'cd3/1. cd3.flac']
+
+    assert archive.update(new_only=False, checkpoint_size=1).counters['files_opened'] == 3
+
+
+def test_journal_of_other_update_is_discarded(tmp_path):
+    journal = UpdateJournal(tmp_path / 'update.journal', tmp_path)
+    journal.start({'new_only': True})
+    journal.plan_batch([tmp_path / 'cd1'], writes=[], covers=[], renames=[])
+    journal.checkpoint([tmp_path / 'cd1'])
+
+    assert UpdateJournal(tmp_path / 'update.journal', tmp_path).start({'new_only': True}) == {tmp_path / 'cd1'}
+    assert UpdateJournal(tmp_path / 'update.journal', tmp_path).start({'new_only': False}) == set()
+    assert UpdateJournal(tmp_path / 'update.journal', tmp_path).start({'new_only': True}) == set()
+
+
+def test_torn_record_is_ignored(tmp_path):
+    journal = UpdateJournal(tmp_path / 'update.journal', tmp_path)
+    journal.start({'new_only': True})
+    journal.checkpoint([tmp_path / 'cd1'])
+    with open(journal.journal_path, 'a') as file:
+        file.write('{"checkpoint": ["cd')
+
+    assert journal.start({'new_only': True}) == {tmp_path / 'cd1'}
+    journal.checkpoint([tmp_path / 'cd2'])
+    assert journal.start({'new_only': True}) == {tmp_path / 'cd1', tmp_path / 'cd2'}
+
+
+def test_temp_copies_of_interrupted_batch_are_removed(archive_path):
+    archive = AlbumArchive(str(archive_path), 'Album', callbacks=[CrashingCallbacks(crash_on_write=2)])
+    with pytest.raises(RuntimeError):
+        archive.update(new_only=False, checkpoint_size=1)
+
+    journal = UpdateJournal(archive._get_update_journal_path(), archive.path)
+    temp_path = Track.get_temp_path(archive_path / 'cd2' / 'track.flac')
+    assert journal.get_pending_batch()['temps'] == [temp_path.relative_to(archive_path).as_posix()]
+    # crash between copying of track and replacing of it
+    temp_path.write_bytes((archive_path / 'cd2' / 'track.flac').read_bytes())
+
+    archive.callbacks.clear()
+    archive.update(new_only=False, checkpoint_size=1)
+
+    assert not temp_path.exists()
+
+
+def test_failed_copy_is_removed(mp3_path, monkeypatch):
+    track = Track(mp3_path)
+    track.set_tag('album', 'long album name ' * 1000)
+
+    def failing_copy(source, target):
+        target.write_bytes(b'partial')
+        raise OSError('no space left on device')
+
+    monkeypatch.setattr(shutil, 'copy2', failing_copy)
+    with pytest.raises(OSError):
+        track.write()
+    assert not Track.get_temp_path(mp3_path).exists()
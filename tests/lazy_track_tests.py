@@ -0,0 +1,36 @@
+import pytest
+
+import mutagen.flac
+
+from mulima.track_processor import Track
+from tests.conftest import make_flac
+
+
+def test_mp3_tags_are_read_without_mutagen_file(mp3_path, monkeypatch):
+    monkeypatch.setattr(mutagen.mp3, 'MP3', lambda *_: pytest.fail('mpeg stream should not be parsed'))
+    track = Track(mp3_path)
+
+    assert track.get_tag('title') == 'filename'
+    assert track.get_tag('date') == '2019'
+    assert track.get_tag('tracknumber') == '5'
+
+
+def test_flac_tags_are_read_from_vorbis_comment(tmp_path):
+    flac_path = make_flac(tmp_path / 'file.flac', {'title': 'T', 'tracknumber': '3', 'tracktotal': '9'},
+                          cover=bytes(10000), cover_mimetype='image/png')
+    track = Track(flac_path)
+
+    assert track.get_tag('title') == 'T'
+    assert track.get_tag('tracknumber') == '3'
+    assert track.get_tag('tracktotal') == '9'
+    assert track.get_tag('album') is None
+
+
+def test_lazy_track_writing(tmp_path, mp3_path):
+    flac_path = make_flac(tmp_path / 'file.flac', {'title': 'T'})
+    for path in (mp3_path, flac_path):
+        track = Track(path)
+        track.set_tag('album', 'new album')
+        track.write()
+
+        assert Track(path).get_tag('album') == 'new album'
@@ -0,0 +1,61 @@
+import pytest
+
+from mulima.executor import UpdateExecutor
+from mulima.library import Library
+from mulima.tree_cache import TreeCache
+from mulima.track_processor import Track
+from tests.conftest import make_flac
+
+
+@pytest.fixture
+def artist_path(tmp_path):
+    for album in ['First album', 'Second album']:
+        album_path = tmp_path / 'Artist' / album
+        album_path.mkdir(parents=True)
+        for number in range(1, 4):
+            make_flac(album_path / f'{number}.flac', {'title': f'Track {number}', 'tracknumber': str(number)})
+    return tmp_path / 'Artist'
+
+
+def test_same_archive_is_registered_once(artist_path):
+    with Library() as library:
+        archive = library.add_artist_archive(str(artist_path), ['Artist'])
+        assert library.add_artist_archive(str(artist_path / '.'), ['Other']) is archive
+        assert library.add_album_archive(str(artist_path), 'Album') is not archive
+        assert len(library.archives) == 2
+
+
+def test_nested_archives_share_tree(artist_path, tmp_path):
+    other_album_path = tmp_path / 'Other artist' / 'Album'
+    other_album_path.mkdir(parents=True)
+    make_flac(other_album_path / '1.flac', {'title': 'Other'})
+
+    with Library(executor=UpdateExecutor(max_workers=4, max_workers_per_device=2),
+                 max_concurrent_trees=2) as library:
+        library.add_album_archive(str(artist_path / 'First album'), 'First album')
+        library.add_artist_archive(str(artist_path), ['Artist'])
+        library.add_album_archive(str(other_album_path), 'Album')
+
+        assert [len(archive_list) for archive_list in library.get_trees().values()] == [2, 1]
+        reports = library.update()
+
+    # artist archive loads tracks, nested album archive takes them from shared tree
+    assert sum(report.counters['files_opened'] for _, report in reports) == 7
+    track = Track(artist_path / 'First album' / '1. Track 1.flac')
+    assert (track.get_tag('artist'), track.get_tag('album')) == ('Artist', 'First album')
+    assert Track(artist_path / 'Second album' / 'Track 1.flac').get_tag('album') is None
+
+
+
+def test_tree_cache_uses_stat_results_of_scan(artist_path, monkeypatch):
+    tree_cache = TreeCache(artist_path, UpdateExecutor())
+    filepath_list = [track_entry.path for directory_entries in tree_cache.scan(artist_path)
+                     for track_entry in directory_entries.tracks]
+
+    monkeypatch.setattr(UpdateExecutor, 'get_signatures', lambda executor, filepaths: pytest.fail(
+        'scanned tracks should not be stat') if list(filepaths) else [])
+    track_list, loaded_track_list = tree_cache.load_tracks(filepath_list)
+    assert len(track_list) == len(loaded_track_list) == 6
+
+    track_list, loaded_track_list = tree_cache.load_tracks(filepath_list)
+    assert len(track_list) == 6 and loaded_track_list == []
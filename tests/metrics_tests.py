@@ -0,0 +1,65 @@
+import shutil
+import sys
+import tracemalloc
+import pytest
+
+from mulima.archive import ArtistArchive
+from mulima.metrics import UpdateCallbacks, UpdateCancelled
+from tests.conftest import SOURCE_TRACK_PATH
+
+
+class RecordingCallbacks(UpdateCallbacks):
+    def __init__(self):
+        self.phases = list()
+        self.counters = dict()
+
+    def on_phase_end(self, phase: str, duration: float):
+        self.phases.append(phase)
+
+    def on_count(self, counter: str, amount: int):
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+
+@pytest.fixture
+def archive_path(tmp_path):
+    for name in ['a.mp3', 'b.mp3']:
+        shutil.copy2(SOURCE_TRACK_PATH, tmp_path / name)
+    return tmp_path
+
+
+def test_update_report(archive_path):
+    callbacks = RecordingCallbacks()
+    archive = ArtistArchive(str(archive_path), ['Other Artist'], callbacks=[callbacks])
+
+    report = archive.update(profile=True, trace_memory=True)
+
+    assert set(report.phase_durations) == {'discovery', 'load', 'tags', 'write', 'rename', 'index'}
+    assert report.counters['files_found'] == 2
+    assert report.counters['files_opened'] == 2
+    assert report.counters['files_saved'] == 2
+    assert report.counters['bytes_read'] > 0
+    assert report.counters['bytes_written'] > 0
+    assert report.profile is not None
+    assert report.memory_snapshot is not None
+    assert callbacks.phases == list(report.phase_durations)
+    assert callbacks.counters == {counter: value for counter, value in report.counters.items() if value}
+
+    second_report = archive.update()
+    assert second_report.counters['files_opened'] == 0
+    assert second_report.profile is None
+
+
+class FailingCallbacks(UpdateCallbacks):
+    def on_phase_start(self, phase: str):
+        if phase == 'load':
+            raise UpdateCancelled
+
+
+def test_profiling_is_stopped_on_failure(archive_path):
+    archive = ArtistArchive(str(archive_path), ['Other Artist'], callbacks=[FailingCallbacks()])
+
+    with pytest.raises(UpdateCancelled):
+        archive.update(profile=True, trace_memory=True)
+
+    assert sys.getprofile() is None
+    assert not tracemalloc.is_tracing()
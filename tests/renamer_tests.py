@@ -0,0 +1,103 @@
+import os
+import pytest
+from pathlib import Path
+
+from mulima.renamer import NAME_MAX, RenameOperation, RenamePlan, fit_filename
+
+
+@pytest.fixture
+def directory(tmp_path):
+    directory = tmp_path / 'album'
+    directory.mkdir()
+    for name in ['a.mp3', 'b.mp3', 'c.mp3', 'other.txt']:
+        (directory / name).write_text(name)
+    return directory
+
+
+def read_directory(directory: Path) -> dict:
+    return {path.name: path.read_text() for path in directory.iterdir()}
+
+
+def test_swap_collision_and_case_renames(tmp_path, directory):
+    plan = RenamePlan(tmp_path / 'journal')
+    plan.add_directory(directory, {
+        directory / 'a.mp3': 'b',
+        directory / 'b.mp3': 'A',
+        directory / 'c.mp3': 'other',
+    })
+    renamed = plan.apply()
+
+    assert read_directory(directory) == {'b.mp3': 'a.mp3', 'A.mp3': 'b.mp3', 'other.mp3': 'c.mp3',
+                                         'other.txt': 'other.txt'}
+    assert renamed[directory / 'b.mp3'] == directory / 'A.mp3'
+    assert not (tmp_path / 'journal').exists()
+
+
+def test_duplicated_filenames_get_postfixes(tmp_path, directory):
+    plan = RenamePlan(tmp_path / 'journal')
+    plan.add_directory(directory, {directory / 'a.mp3': 'same', directory / 'b.mp3': 'same'})
+    plan.apply()
+
+    assert {'same.mp3', 'same (2).mp3'} <= set(read_directory(directory))
+
+
+def test_unchanged_names_are_not_planned(tmp_path, directory):
+    plan = RenamePlan(tmp_path / 'journal')
+    plan.add_directory(directory, {directory / 'a.mp3': 'a'})
+
+    assert plan.operations == []
+    assert plan.apply() == {}
+
+
+@pytest.mark.parametrize('finish', ['resume', 'rollback'])
+def test_interrupted_plan(tmp_path, directory, monkeypatch, finish):
+    original_state = read_directory(directory)
+    plan = RenamePlan(tmp_path / 'journal')
+    plan.add_directory(directory, {directory / 'a.mp3': 'b', directory / 'b.mp3': 'a', directory / 'c.mp3': 'd'})
+
+    renames_left = [2]
+    original_rename = os.rename
+
+    def crashing_rename(*args):
+        if not renames_left[0]:
+            raise KeyboardInterrupt
+        renames_left[0] -= 1
+        return original_rename(*args)
+
+    monkeypatch.setattr('os.rename', crashing_rename)
+    with pytest.raises(KeyboardInterrupt):
+        plan.apply()
+    monkeypatch.undo()
+
+    loaded_plan = RenamePlan.load(tmp_path / 'journal')
+    getattr(loaded_plan, finish)()
+
+    if finish == 'resume':
+        assert read_directory(directory) == {'a.mp3': 'b.mp3', 'b.mp3': 'a.mp3', 'd.mp3': 'c.mp3',
+                                             'other.txt': 'other.txt'}
+    else:
+        assert read_directory(directory) == original_state
+    assert RenamePlan.load(tmp_path / 'journal') is None
+
+
+def test_long_filenames_are_cut_to_name_max(tmp_path, directory):
+    plan = RenamePlan(tmp_path / 'journal')
+    plan.add_directory(directory, {directory / 'a.mp3': 'я' * 300, directory / 'b.mp3': 'я' * 300})
+    plan.apply()
+
+    long_names = [name for name in read_directory(directory) if name.startswith('я')]
+    assert len(long_names) == 2
+    assert all(len(os.fsencode(name)) <= NAME_MAX and name.endswith('.mp3') for name in long_names)
+    assert fit_filename('short', '.mp3') == 'short'
+
+
+def test_impossible_rename_is_rolled_back(tmp_path, directory, caplog):
+    original_state = read_directory(directory)
+    plan = RenamePlan(tmp_path / 'journal')
+    plan.add_directory(directory, {directory / 'a.mp3': 'd'})
+    plan.operations.append(RenameOperation(directory / 'b.mp3', directory / ('x' * 300 + '.mp3')))
+
+    assert plan.apply() == {}
+    assert read_directory(directory) == original_state
+    assert RenamePlan.load(tmp_path / 'journal') is None
+    assert 'b.mp3' in caplog.text
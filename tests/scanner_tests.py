@@ -0,0 +1,20 @@
+from pathlib import Path
+
+from mulima.scanner import scan_directories
+
+
+def test_scan_yields_tracks_and_pictures_by_directory(tmp_path):
+    for relative_path in ['b.mp3', 'cover.jpg', 'notes.txt', 'cd2/a.flac', 'cd1/c.mp3', 'cd1/front.png',
+                          '.mulima/index.sqlite']:
+        path = Path(tmp_path, relative_path)
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(b'')
+
+    directories = list(scan_directories(tmp_path, skip_dirnames={'.mulima'}))
+
+    assert [directory.path for directory in directories] == [tmp_path, tmp_path / 'cd1', tmp_path / 'cd2']
+    assert [[entry.path.name for entry in directory.tracks] for directory in directories] == \
+        [['b.mp3'], ['c.mp3'], ['a.flac']]
+    assert [[entry.path.name for entry in directory.pictures] for directory in directories] == \
+        [['cover.jpg'], ['front.png'], []]
+    assert all(entry.stat.st_size == 0 for directory in directories for entry in directory.tracks)
@@ -0,0 +1,93 @@
+import gzip
+import shutil
+
+import pytest
+
+from mulima.archive import AlbumArchive
+from mulima.index import TrackIndex
+from mulima.snapshot import read_snapshot
+from mulima.track_processor import Track
+from tests.conftest import make_flac
+
+
+@pytest.fixture
+def archive(tmp_path):
+    album_path = tmp_path / 'album' / 'cd1'
+    album_path.mkdir(parents=True)
+    make_flac(album_path / 'First.flac', {'title': 'First', 'album': 'Album', 'tracknumber': '1'})
+    make_flac(album_path / 'Second.flac', {'title': 'Second', 'album': 'Album', 'tracknumber': '1'})
+    make_flac(album_path / 'Third.flac', {'title': 'Third', 'album': 'Album', 'tracknumber': '2'})
+    track = Track(album_path / 'Third.flac')
+    track.set_cover(data=bytes(16), mimetype='image/png')
+    track.write()
+    return AlbumArchive(str(tmp_path / 'album'), 'Album')
+
+
+@pytest.mark.parametrize('filename', ['snapshot.jsonl', 'snapshot.jsonl.gz', 'snapshot.jsonl.xz'])
+def test_dump_and_read(archive, tmp_path, filename):
+    snapshot_path = tmp_path / filename
+
+    assert archive.json_dump(str(snapshot_path)) == 3
+    records = list(read_snapshot(snapshot_path))
+
+    assert [record.path for record in records] == ['cd1/First.flac', 'cd1/Second.flac', 'cd1/Third.flac']
+    assert records[0].tags == Track(archive.path / 'cd1' / 'First.flac').get_tags()
+    assert records[0].signature.size == (archive.path / 'cd1' / 'First.flac').stat().st_size
+    assert [record.cover_digest is None for record in records] == [True, True, False]
+
+
+def test_compressed_snapshot(archive, tmp_path):
+    archive.json_dump(str(tmp_path / 'snapshot.jsonl.gz'))
+
+    with gzip.open(tmp_path / 'snapshot.jsonl.gz', 'rt') as file:
+        assert file.readline().startswith('{"format": "mulima-snapshot"')
+
+
+def test_load_restores_index(archive, tmp_path):
+    archive.update(new_only=True)
+    archive.json_dump(str(tmp_path / 'snapshot.jsonl'))
+    archive.close()
+    shutil.rmtree(archive.path / TrackIndex.STATE_DIRNAME)
+
+    restored_archive = AlbumArchive(str(archive.path), 'Album')
+    assert restored_archive.json_load(str(tmp_path / 'snapshot.jsonl')) == 3
+    assert restored_archive.update(new_only=True).counters['files_opened'] == 0
+
+
+def test_load_rejects_other_files(archive, tmp_path):
+    (tmp_path / 'other.jsonl').write_text('{"path": "a.flac"}\n')
+
+    with pytest.raises(ValueError):
+        archive.json_load(str(tmp_path / 'other.jsonl'))
+
+
+def test_stat(archive, tmp_path):
+    archive.json_dump(str(tmp_path / 'snapshot.jsonl'))
+    stats = archive.stat(str(tmp_path / 'snapshot.jsonl'))
+
+    assert stats.tracks == 3
+    assert stats.covers == 1
+    assert stats.tracks_by_directory == {'cd1': 3}
+    assert stats.missing_tags['title'] == 0
+    assert stats.missing_tags['artist'] == 3
+    assert stats.duplicate_tracknumbers == {('cd1', 'Album'): ['1']}
+
+
+def test_stat_of_index(archive):
+    archive.update(new_only=True)
+
+    stats = archive.stat()
+    assert stats.tracks == 3
+    assert stats.covers == 0
+    assert stats.duplicate_tracknumbers == {}
+
+
+def test_load_keeps_unprocessed_tracks_unindexed(archive, tmp_path):
+    make_flac(archive.path / 'cd1' / 'Fourth.flac', {'album': 'Wrong'})
+    archive.json_dump(str(tmp_path / 'snapshot.jsonl'))
+
+    assert archive.json_load(str(tmp_path / 'snapshot.jsonl')) == 0
+    report = archive.update(new_only=True)
+
+    assert report.counters['files_opened'] == 4
+    assert Track(archive.path / 'cd1' / 'Fourth.flac').get_tags()['album'] == 'Album'
@@ -0,0 +1,114 @@
+import sys
+
+import pytest
+
+from mulima.archive import ArtistArchive
+from mulima.track_processor import Track
+from mulima.fingerprint import get_payload_digest
+from tests.conftest import make_track
+
+
+@pytest.fixture
+def master(tmp_path):
+    album_path = tmp_path / 'master' / 'album'
+    album_path.mkdir(parents=True)
+    make_track(album_path / 'First.flac', {'title': 'First', 'artist': 'Artist'})
+    make_track(album_path / 'Second.flac', {'title': 'Second', 'artist': 'Artist'})
+
+    archive = ArtistArchive(str(tmp_path / 'master'), ['Artist'])
+    archive.update(new_only=True)
+    return archive
+
+
+def _transferred(report) -> int:
+    return report.counters['files_copied'] + report.counters['files_linked']
+
+
+def test_only_new_tracks_are_transferred(master, tmp_path):
+    replica_path = tmp_path / 'replica'
+
+    assert _transferred(master.sync(str(replica_path), allow_hardlinks=False)) == 2
+    assert (replica_path / 'album' / 'First.flac').read_bytes() == \
+        (master.path / 'album' / 'First.flac').read_bytes()
+
+    make_track(master.path / 'album' / 'Third.flac', {'title': 'Third', 'artist': 'Artist'})
+    report = master.sync(str(replica_path), allow_hardlinks=False)
+    assert _transferred(report) == 1
+    assert report.counters['files_hashed'] == 0
+
+
+def test_renamed_and_removed_tracks(master, tmp_path):
+    replica_path = tmp_path / 'replica'
+    master.sync(str(replica_path), allow_hardlinks=False)
+
+    (master.path / 'album').rename(master.path / 'renamed album')
+    (master.path / 'renamed album' / 'Second.flac').unlink()
+    report = master.sync(str(replica_path), allow_hardlinks=False)
+
+    assert report.counters['files_moved'] == 1
+    assert report.counters['files_deleted'] == 1
+    assert _transferred(report) == 0
+    assert sorted(path.relative_to(replica_path).as_posix() for path in replica_path.rglob('*.flac')) == \
+        ['renamed album/First.flac']
+
+
+def test_tags_only_delta_keeps_replica_file(master, tmp_path):
+    replica_path = tmp_path / 'replica'
+    master.sync(str(replica_path), allow_hardlinks=False)
+    replica_track_path = replica_path / 'album' / 'First.flac'
+    replica_inode = replica_track_path.stat().st_ino
+
+    track = Track(master.path / 'album' / 'First.flac')
+    track.set_tag('album', 'Album')
+    track.write()
+    report = master.sync(str(replica_path), tags_only=True, allow_hardlinks=False)
+
+    assert _transferred(report) == 0
+    assert report.counters['files_saved'] == 1
+    assert replica_track_path.stat().st_ino == replica_inode
+    assert Track(replica_track_path).get_tag('album') == 'Album'
+
+
+def test_reused_inode_is_not_taken_for_move(master, tmp_path):
+    replica_path = tmp_path / 'replica'
+    master.sync(str(replica_path), allow_hardlinks=False)
+
+    # removed track is replaced by other recording, which got the same inode
+    first_path, other_path = master.path / 'album' / 'First.flac', master.path / 'album' / 'Other.flac'
+    inode = first_path.stat().st_ino
+    first_path.rename(other_path)
+    other_path.write_bytes(make_track(tmp_path / 'Other.flac', {'title': 'Other', 'artist': 'Artist'}).read_bytes())
+    assert other_path.stat().st_ino == inode
+    master.update(new_only=True)
+
+    report = master.sync(str(replica_path), tags_only=True, allow_hardlinks=False)
+
+    assert report.counters['files_moved'] == 0
+    assert report.counters['files_copied'] == 1
+    assert report.counters['files_saved'] == 0
+    assert get_payload_digest(replica_path / 'album' / 'Other.flac') == get_payload_digest(other_path)
+    assert not (replica_path / 'album' / 'First.flac').exists()
+
+
+def test_tags_only_delta_checks_audio_data(master, tmp_path):
+    replica_path = tmp_path / 'replica'
+    master.sync(str(replica_path), allow_hardlinks=False)
+
+    first_path = master.path / 'album' / 'First.flac'
+    with open(first_path, 'ab') as file:
+        file.write(b'other audio')
+    report = master.sync(str(replica_path), tags_only=True, allow_hardlinks=False)
+
+    assert report.counters['files_copied'] == 1
+    assert report.counters['files_hashed'] == 0  # sizes of audio data differ
+    assert (replica_path / 'album' / 'First.flac').read_bytes() == first_path.read_bytes()
+
+
+def test_files_are_cloned_without_fcntl(master, tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, 'fcntl', None)
+    replica_path = tmp_path / 'replica'
+
+    report = master.sync(str(replica_path), allow_hardlinks=True)
+
+    assert report.counters['files_linked'] == 2
+    assert (replica_path / 'album' / 'First.flac').samefile(master.path / 'album' / 'First.flac')
@@ -0,0 +1,67 @@
+from mulima.track_processor import Track
+
+
+def test_same_values_are_not_saved(mp3_path):
+    original_stat = mp3_path.stat()
+
+    track = Track(mp3_path)
+    track.set_tag('album', 'changed')
+    track.set_tag('album', 'ALBUM')
+    track.set_tag('title', 'filename')
+
+    assert not track.is_modified
+    assert track.write() == 0
+    assert mp3_path.stat().st_mtime_ns == original_stat.st_mtime_ns
+
+
+def test_changes_are_written_in_padding(mp3_path):
+    original_size = mp3_path.stat().st_size
+
+    track = Track(mp3_path)
+    track.set_tag('album', 'other album')
+    written_bytes = track.write()
+
+    assert 0 < written_bytes < original_size
+    assert mp3_path.stat().st_size == original_size
+    assert Track(mp3_path).get_tag('album') == 'other album'
+    assert Track(mp3_path).get_tag('mulima_upd_time') is not None
+    assert not track.is_modified
+
+
+def test_cover_is_embedded_on_writing_and_parsed_file_is_released(mp3_path):
+    track = Track(mp3_path)
+    assert not hasattr(track, '__dict__')
+
+    track.set_cover(data=b'cover', mimetype='image/png')
+    assert not track.is_parsed()
+    assert track.write() > 0
+    assert track.is_parsed()
+
+    # parsed file is not kept after writing
+    track.set_cover(data=b'cover', mimetype='image/png')
+    assert track.write() == 0
+    assert Track(mp3_path).get_cover() == (b'cover', 'image/png')
+
+
+def test_grown_tags_are_saved_to_temp_copy(mp3_path):
+    original_stat = mp3_path.stat()
+
+    track = Track(mp3_path)
+    track.set_tag('album', 'long album name' * 1000)
+    written_bytes = track.write()
+
+    assert written_bytes == mp3_path.stat().st_size > original_stat.st_size
+    assert mp3_path.stat().st_ino != original_stat.st_ino
+    assert [path.name for path in mp3_path.parent.iterdir()] == [mp3_path.name]
+    assert Track(mp3_path).get_tag('album') == 'long album name' * 1000
+
+
+def test_hidden_or_empty_filenames_are_not_formatted(mp3_path):
+    track = Track(mp3_path)
+
+    for title in ['', '  ', '..', '.hidden']:
+        track.set_tag('title', title)
+        assert track.format_filename('{title}') == mp3_path.stem
+
+    track.set_tag('title', 't' * 300)
+    assert track.format_filename('{title}') == 't' * (255 - len(mp3_path.suffix))
@@ -0,0 +1,139 @@
+import threading
+import time
+
+import pytest
+
+from mulima.archive import ArtistArchive
+from mulima.watcher import ArchiveWatcher
+from tests.conftest import make_flac
+
+
+def _make_watched_archive(tmp_path, **watcher_kwargs):
+    album_path = tmp_path / 'album'
+    album_path.mkdir()
+    make_flac(album_path / 'a.flac', {'title': 'First', 'artist': 'Artist'})
+
+    archive = ArtistArchive(str(tmp_path), ['Artist'])
+    archive.update(new_only=True)
+
+    updated_directories = list()
+    update = archive.update
+
+    def tracking_update(**kwargs):
+        updated_directories.append(kwargs.get('directories'))
+        return update(**kwargs)
+
+    archive.update = tracking_update
+    return ArchiveWatcher(archive, debounce=0, **watcher_kwargs), album_path, updated_directories
+
+
+def test_polling_updates_only_changed_directory_and_ignores_own_writes(tmp_path):
+    watcher, album_path, updated_directories = _make_watched_archive(tmp_path, use_inotify=False)
+    (tmp_path / 'other').mkdir()
+    watcher._poll()
+
+    make_flac(album_path / 'b.flac', {'title': 'Second', 'artist': 'Artist'})
+    watcher._register_changes(watcher._poll())
+    watcher.process_pending(force=True)
+
+    assert updated_directories == [[album_path]]
+    assert (album_path / 'Second.flac').exists()
+
+    # mulima's own saves and renames are recognized by the index
+    watcher._register_changes(watcher._poll())
+    watcher.process_pending(force=True)
+    assert updated_directories == [[album_path]]
+
+
+def test_inotify_events_trigger_update(tmp_path):
+    watcher, album_path, updated_directories = _make_watched_archive(tmp_path)
+    if not watcher.uses_inotify():
+        pytest.skip('inotify unavailable')
+
+    thread = threading.Thread(target=watcher.run)
+    thread.start()
+    try:
+        time.sleep(0.2)
+        make_flac(album_path / 'b.flac', {'title': 'Second', 'artist': 'Artist'})
+
+        deadline = time.monotonic() + 10
+        while not (album_path / 'Second.flac').exists() and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        watcher.stop()
+        thread.join()
+        watcher.close()
+
+    assert (album_path / 'Second.flac').exists()
+    assert updated_directories and all(directories == [album_path] for directories in updated_directories)
+
+
+def test_failed_directory_update_does_not_stop_watching(tmp_path, caplog):
+    watcher, album_path, updated_directories = _make_watched_archive(tmp_path, use_inotify=False)
+    ingest_path = tmp_path / 'ingest'
+    ingest_path.mkdir()
+    watcher._poll()
+
+    (ingest_path / 'broken.flac').write_bytes(b'not a flac')
+    make_flac(album_path / 'b.flac', {'title': 'Second', 'artist': 'Artist'})
+    watcher._register_changes(watcher._poll())
+    watcher.process_pending(force=True)
+
+    assert updated_directories == [[album_path, ingest_path], [album_path], [ingest_path]]
+    assert (album_path / 'Second.flac').exists()
+    assert 'ingest' in caplog.text
+
+
+def test_removed_new_directory_is_ignored(tmp_path):
+    watcher, album_path, updated_directories = _make_watched_archive(tmp_path)
+    if not watcher.uses_inotify():
+        pytest.skip('inotify unavailable')
+
+    try:
+        watcher._watch_new_directory(tmp_path / 'removed')
+        watcher.process_pending(force=True)
+    finally:
+        watcher.close()
+    assert updated_directories == []
+
+
+def _wait_for(condition) -> bool:
+    deadline = time.monotonic() + 10
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+
+def test_moved_in_and_out_tree_is_watched_recursively(tmp_path):
+    archive_path = tmp_path / 'archive'
+    archive_path.mkdir()
+    watcher, album_path, updated_directories = _make_watched_archive(archive_path)
+    if not watcher.uses_inotify():
+        pytest.skip('inotify unavailable')
+
+    outside_path = tmp_path / 'outside' / 'Album'
+    (outside_path / 'CD1').mkdir(parents=True)
+    make_flac(outside_path / 'top.flac', {'title': 'Top', 'artist': 'Artist'})
+    make_flac(outside_path / 'CD1' / 'a.flac', {'title': 'A', 'artist': 'Artist'})
+
+    thread = threading.Thread(target=watcher.run)
+    thread.start()
+    try:
+        time.sleep(0.2)
+        outside_path.rename(archive_path / 'Album')
+        assert _wait_for(lambda: (archive_path / 'Album' / 'CD1' / 'A.flac').exists())
+        assert (archive_path / 'Album' / 'Top.flac').exists()
+
+        # changes in subdirectory of moved in tree are watched
+        make_flac(archive_path / 'Album' / 'CD1' / 'b.flac', {'title': 'B', 'artist': 'Artist'})
+        assert _wait_for(lambda: (archive_path / 'Album' / 'CD1' / 'B.flac').exists())
+
+        (archive_path / 'Album').rename(outside_path)
+        assert _wait_for(lambda: all('Album' not in path.relative_to(archive_path).parts
+                                     for path in watcher.archive.index.paths()))
+    finally:
+        watcher.stop()
+        thread.join()
+        watcher.close()
+
+    assert [path.name for path in watcher.archive.index.paths()] == ['First.flac']
@@ -0,0 +1,142 @@
+import shutil
+
+import pytest
+from PIL import Image
+
+from mulima.archive import AlbumArchive, ArtistArchive
+from mulima.index import StatSignature
+from mulima.metrics import UpdateCallbacks
+from mulima.track_processor import Track
+from tests.conftest import make_flac
+
+
+class EventsCallbacks(UpdateCallbacks):
+    def __init__(self):
+        self.events = list()
+
+    def on_phase_start(self, phase: str):
+        self.events.append(('start', phase, None))
+
+    def on_file_done(self, phase: str, path):
+        self.events.append(('done', phase, path.parent.name))
+
+
+def make_library(root):
+    for directory_name in ['cd1', 'cd2', 'cd3']:
+        (root / directory_name).mkdir(parents=True)
+        for number in ['1', '1', '2']:
+            title = f'{directory_name} {len(list((root / directory_name).iterdir()))}'
+            make_flac(root / directory_name / f'{title}.flac',
+                      {'title': title, 'artist': 'Other', 'album': 'Album', 'tracknumber': number})
+    return root
+
+
+def _state(root):
+    return sorted((path.relative_to(root).as_posix(), tuple(sorted((tag, value) for tag, value
+                                                                  in Track(path).get_tags().items()
+                                                                  if tag != 'mulima_upd_time')))
+                  for path in root.rglob('*.flac'))
+
+
+@pytest.mark.parametrize('archive_class', [AlbumArchive, ArtistArchive])
+def test_window_update_is_equal_to_full_update(tmp_path, archive_class):
+    arguments = ('Album',) if archive_class is AlbumArchive else (['Artist'],)
+    full_root, window_root = make_library(tmp_path / 'full'), make_library(tmp_path / 'window')
+
+    full_report = archive_class(str(full_root), *arguments).update(new_only=True)
+    window_report = archive_class(str(window_root), *arguments).update(new_only=True, window_size=2)
+
+    assert _state(full_root) == _state(window_root)
+    assert full_report.counters == window_report.counters
+
+
+def test_window_is_finished_before_next_one_is_loaded(tmp_path):
+    callbacks = EventsCallbacks()
+    archive = AlbumArchive(str(make_library(tmp_path)), 'Album', callbacks=[callbacks])
+
+    archive.update(new_only=True, window_size=1)
+
+    load_starts = [index for index, event in enumerate(callbacks.events) if event == ('start', 'load', None)]
+    assert len(load_starts) == 3
+    for window_index, directory_name in enumerate(['cd1', 'cd2', 'cd3']):
+        window_events = callbacks.events[load_starts[window_index]:(load_starts + [None])[window_index + 1]]
+        # the next directory is scanned ahead, while the window is processed
+        assert {(phase, name) for kind, phase, name in window_events if kind == 'done' and phase != 'discovery'} == \
+            {('load', directory_name), ('write', directory_name)}
+
+
+def test_window_size_should_be_positive(tmp_path):
+    with pytest.raises(ValueError):
+        AlbumArchive(str(make_library(tmp_path)), 'Album').update(new_only=True, window_size=0)
+
+
+def test_archive_is_scanned_by_windows(tmp_path):
+    callbacks = EventsCallbacks()
+    archive = AlbumArchive(str(make_library(tmp_path)), 'Album', callbacks=[callbacks])
+    scan = archive.scan
+
+    def tracking_scan(directories=None):
+        for directory_entries in scan(directories):
+            callbacks.events.append(('scan', None, directory_entries.path.name))
+            yield directory_entries
+
+    archive.scan = tracking_scan
+    archive.update(new_only=True, window_size=1)
+
+    scanned_or_written = [(kind, name) for kind, phase, name in callbacks.events
+                          if kind == 'scan' or (kind, phase) == ('done', 'write')]
+    # the next directory with tracks is scanned to know, that the window is complete
+    assert scanned_or_written == [('scan', tmp_path.name), ('scan', 'cd1'), ('scan', 'cd2'),
+                                  *[('done', 'cd1')] * 3, ('scan', 'cd3'), *[('done', 'cd2')] * 3,
+                                  *[('done', 'cd3')] * 3]
+
+
+def test_track_moved_to_next_window_is_recognized(tmp_path):
+    archive = ArtistArchive(str(make_library(tmp_path)), ['Artist'])
+    archive.update(new_only=True, window_size=1)
+
+    moved_path = next((tmp_path / 'cd1').iterdir())
+    moved_path.rename(tmp_path / 'cd3' / moved_path.name)
+    shutil.rmtree(tmp_path / 'cd2')
+    report = archive.update(new_only=True, window_size=1)
+
+    assert report.counters['files_moved'] == 1
+    assert report.counters['files_opened'] == 0
+    assert sorted(path.parent.name for path in archive.index.paths()) == ['cd1', 'cd1', 'cd3', 'cd3', 'cd3', 'cd3']
+
+
+def test_cover_of_previous_window_is_fallback(tmp_path):
+    make_library(tmp_path)
+    Image.new('RGB', (10, 10), 'red').save(tmp_path / 'cd1' / 'cover.jpg')
+
+    AlbumArchive(str(tmp_path), 'Album').update(new_only=True, window_size=1)
+
+    assert all(Track(path).get_cover() is not None for path in (tmp_path / 'cd3').iterdir())
+
+
+@pytest.mark.parametrize('window_size', [None, 1])
+def test_renamed_directory_is_recognized(tmp_path, window_size):
+    archive = ArtistArchive(str(make_library(tmp_path)), ['Artist'])
+    archive.update(new_only=True)
+
+    (tmp_path / 'cd1').rename(tmp_path / 'renamed')
+    report = archive.update(new_only=True, window_size=window_size)
+
+    assert report.counters['files_moved'] == 3
+    assert report.counters['files_opened'] == 0
+    assert sorted(path.parent.name for path in archive.index.paths()).count('renamed') == 3
+
+
+def test_pictures_are_not_stat_or_scanned_again(tmp_path, monkeypatch):
+    make_library(tmp_path)
+    Image.new('RGB', (10, 10), 'red').save(tmp_path / 'cover.jpg')
+    Image.new('RGB', (10, 10), 'blue').save(tmp_path / 'cd2' / 'cover.jpg')
+
+    from_path = StatSignature.from_path
+    monkeypatch.setattr(StatSignature, 'from_path', lambda path: pytest.fail(f'{path} should not be stat')
+                        if path.suffix == '.jpg' else from_path(path))
+    monkeypatch.setattr('mulima.archive.scan_directory', lambda path: pytest.fail(f'{path} should not be scanned'))
+    AlbumArchive(str(tmp_path), 'Album').update(new_only=True, window_size=1)
+
+    covers = {path.parent.name: Track(path).get_cover() for path in tmp_path.rglob('*.flac')}
+    assert covers['cd1'] == covers['cd3'] != covers['cd2']